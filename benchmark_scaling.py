@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+缩放性能测试脚本
+比较4K缩小到1080p时，moviepy逐帧缩放与ffmpeg原生缩放的转换速度
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from video_editor_app.ffmpeg_utils import run_ffmpeg, probe_media, get_quality_profile
+from video_editor_app.convert_tab import convert_video
+
+
+def create_source(path, duration, fps):
+    """生成一段4K测试视频（带音轨）"""
+    run_ffmpeg(['-f', 'lavfi', '-i', f"testsrc2=size=3840x2160:rate={fps}:duration={duration}",
+                '-f', 'lavfi', '-i', f"sine=frequency=440:duration={duration}",
+                '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p',
+                '-c:a', 'aac', '-shortest', path])
+
+
+def convert_with_moviepy(source, output, params):
+    """旧的转换方式：moviepy解码后在Python中逐帧缩放，再交给编码器"""
+    from moviepy.editor import VideoFileClip
+
+    video = VideoFileClip(source)
+    try:
+        width, height = params['resolution']
+        video = video.resize(width=width, height=height)
+        video.write_videofile(
+            output,
+            codec=params['video_codec'],
+            audio_codec=params['audio_codec'],
+            fps=params['fps'],
+            preset=params['quality']['preset'],
+            ffmpeg_params=['-crf', str(params['quality']['crf'])],
+            audio_bitrate=params['audio_bitrate'],
+            temp_audiofile=os.path.join(os.path.dirname(output), "temp-audio.m4a"),
+            remove_temp=True,
+            threads=params['threads'],
+            logger=None
+        )
+    finally:
+        video.close()
+
+
+def measure(name, func, duration, frames):
+    start = time.monotonic()
+    func()
+    elapsed = time.monotonic() - start
+    print(f"{name:<28} 耗时 {elapsed:7.2f} 秒  {frames / elapsed:7.1f} 帧/秒  "
+          f"{duration / elapsed:5.2f} 倍实时")
+    return elapsed
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="4K缩小到1080p的缩放性能测试")
+    parser.add_argument("--source", help="测试用的视频文件（默认生成4K测试视频）")
+    parser.add_argument("--duration", type=int, default=20, help="生成的测试视频时长（秒）")
+    parser.add_argument("--fps", type=int, default=30, help="帧率")
+    parser.add_argument("--threads", type=int, default=0, help="编码线程数（0为自动）")
+    parser.add_argument("--skip-moviepy", action="store_true", help="只测试ffmpeg原生缩放")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="scale_benchmark_")
+    try:
+        source = args.source
+        if not source:
+            source = os.path.join(work_dir, "source_4k.mp4")
+            print("正在生成4K测试视频...")
+            create_source(source, args.duration, args.fps)
+
+        info = probe_media(source)
+        duration = info['duration']
+        frames = duration * args.fps
+        print(f"源视频: {info['width']}x{info['height']}，{duration:.1f} 秒")
+
+        params = {
+            'video_codec': 'libx264',
+            'audio_codec': 'aac',
+            'fps': args.fps,
+            'audio_bitrate': '192k',
+            'resize': True,
+            'resolution': (1920, 1080),
+            'scale_algorithm': 'bicubic',
+            'fit_mode': 'stretch',
+            'quality': get_quality_profile('balanced'),
+            'threads': args.threads or None,
+        }
+
+        results = {}
+        if not args.skip_moviepy:
+            results['moviepy'] = measure(
+                "moviepy逐帧缩放", duration=duration, frames=frames,
+                func=lambda: convert_with_moviepy(source, os.path.join(work_dir, "moviepy.mp4"), params))
+        for algorithm in ('bicubic', 'area', 'lanczos'):
+            params['scale_algorithm'] = algorithm
+            results[algorithm] = measure(
+                f"ffmpeg原生缩放 ({algorithm})", duration=duration, frames=frames,
+                func=lambda: convert_video(source, os.path.join(work_dir, f"native_{algorithm}.mp4"),
+                                           params, threads=params['threads']))
+
+        if 'moviepy' in results:
+            print(f"原生缩放（bicubic）比moviepy快 {results['moviepy'] / results['bicubic']:.2f} 倍")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
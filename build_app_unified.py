@@ -136,7 +136,10 @@ a = Analysis(
         'PyQt5', 'PyQt5.QtCore', 'PyQt5.QtGui', 'PyQt5.QtWidgets',
         'PyQt5.QtMultimedia', 'PyQt5.QtMultimediaWidgets',
         'video_editor_app', 'video_editor_app.clip_tab', 'video_editor_app.merge_tab', 
-        'video_editor_app.convert_tab', 'video_editor_app.main'
+        'video_editor_app.convert_tab', 'video_editor_app.main',
+        'video_editor_app.ffmpeg_utils', 'video_editor_app.cache_utils',
+        'video_editor_app.resource_utils', 'video_editor_app.cache_dialog',
+        'video_editor_app.estimate_utils'
     ],
     hookspath=[],
     hooksconfig={{}},
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+cache_utils中各种缓存的读写和淘汰逻辑的单元测试
+不需要ffmpeg，运行: python -m pytest -q test_cache_utils.py
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from video_editor_app import cache_utils
+from video_editor_app.cache_utils import (JsonCache, SegmentCache, PassLogCache, ResultCache, make_cache_key,
+                                          file_fingerprint)
+
+
+def write_file(path, size, fill=b'x'):
+    with open(path, 'wb') as f:
+        f.write(fill * size)
+    return path
+
+
+def set_mtime(path, timestamp):
+    os.utime(path, (timestamp, timestamp))
+
+
+class TempDirTestCase(unittest.TestCase):
+    """在临时目录中运行，用户目录也指向临时目录，避免写入真实的缓存目录"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix="cache_test_")
+        home = mock.patch.dict(os.environ, {'HOME': self.temp_dir, 'USERPROFILE': self.temp_dir})
+        home.start()
+        self.addCleanup(home.stop)
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+        # 指纹记录也保存在临时目录中
+        store = mock.patch.object(cache_utils, '_fingerprint_store', None)
+        store.start()
+        self.addCleanup(store.stop)
+
+    def path(self, *parts):
+        return os.path.join(self.temp_dir, *parts)
+
+
+class JsonCacheTest(TempDirTestCase):
+    def test_set_and_get(self):
+        cache = JsonCache(self.path("cache.json"))
+        self.assertIsNone(cache.get("missing"))
+        self.assertEqual(cache.get("missing", 1), 1)
+        cache.set("key", {'value': 1})
+        self.assertEqual(cache.get("key"), {'value': 1})
+
+    def test_persisted_between_instances(self):
+        JsonCache(self.path("cache.json")).set("key", [1, 2])
+        self.assertEqual(JsonCache(self.path("cache.json")).get("key"), [1, 2])
+        self.assertFalse(os.path.exists(self.path("cache.json.tmp")))
+
+    def test_corrupt_file_is_ignored(self):
+        with open(self.path("cache.json"), 'w', encoding='utf-8') as f:
+            f.write("{not json")
+        cache = JsonCache(self.path("cache.json"))
+        self.assertIsNone(cache.get("key"))
+        cache.set("key", 1)
+        self.assertEqual(JsonCache(self.path("cache.json")).get("key"), 1)
+
+
+class FileFingerprintTest(TempDirTestCase):
+    def test_content_only(self):
+        first = write_file(self.path("a.mp4"), 10)
+        second = write_file(self.path("b.mp4"), 10)
+        set_mtime(second, 5000)
+        # 复制或只修改了时间的文件指纹相同
+        self.assertEqual(file_fingerprint(first), file_fingerprint(second))
+
+    def test_same_size_edit(self):
+        path = write_file(self.path("a.mp4"), 4 * 1024 ** 2)
+        fingerprint = file_fingerprint(path)
+        with open(path, 'r+b') as f:
+            f.seek(3 * 1024 ** 2 // 2)
+            f.write(b'y')
+        set_mtime(path, 5000)
+        self.assertNotEqual(file_fingerprint(path), fingerprint)
+
+    def test_record_is_persisted(self):
+        path = write_file(self.path("a.mp4"), 10)
+        fingerprint = file_fingerprint(path)
+        record = JsonCache(self.path(".video_editor", "cache", "fingerprints.json")).get(os.path.abspath(path))
+        self.assertEqual(record['fingerprint'], fingerprint)
+        self.assertEqual(record['size'], 10)
+
+
+class MakeCacheKeyTest(unittest.TestCase):
+    def test_key_depends_on_inputs_and_params(self):
+        key = make_cache_key(["a", "b"], {'crf': 23})
+        self.assertEqual(key, make_cache_key(["a", "b"], {'crf': 23}))
+        self.assertNotEqual(key, make_cache_key(["b", "a"], {'crf': 23}))
+        self.assertNotEqual(key, make_cache_key(["a", "b"], {'crf': 24}))
+
+    def test_param_order_does_not_matter(self):
+        self.assertEqual(make_cache_key(["a"], {'crf': 23, 'preset': 'fast'}),
+                         make_cache_key(["a"], {'preset': 'fast', 'crf': 23}))
+
+
+class SegmentCacheTest(TempDirTestCase):
+    def add(self, cache, key, size, timestamp):
+        temp_path = write_file(cache.temp_path(key), size)
+        path = cache.commit(key, temp_path)
+        set_mtime(path, timestamp)
+        return path
+
+    def test_get_and_commit(self):
+        cache = SegmentCache(self.path("segments"), max_bytes=100)
+        self.assertIsNone(cache.get("a"))
+        path = self.add(cache, "a", 10, 1000)
+        self.assertEqual(cache.get("a"), path)
+        # 命中时更新使用时间
+        self.assertGreater(os.path.getmtime(path), 1000)
+
+    def test_evicts_least_recently_used(self):
+        cache = SegmentCache(self.path("segments"), max_bytes=25)
+        a = self.add(cache, "a", 10, 1000)
+        b = self.add(cache, "b", 10, 2000)
+        c = self.add(cache, "c", 10, 3000)
+        self.assertEqual(cache.evict(), 20)
+        self.assertFalse(os.path.exists(a))
+        self.assertTrue(os.path.exists(b))
+        self.assertTrue(os.path.exists(c))
+
+    def test_get_refreshes_entry(self):
+        cache = SegmentCache(self.path("segments"), max_bytes=25)
+        a = self.add(cache, "a", 10, 1000)
+        b = self.add(cache, "b", 10, 2000)
+        self.add(cache, "c", 10, 3000)
+        cache.get("a")
+        cache.evict()
+        self.assertTrue(os.path.exists(a))
+        self.assertFalse(os.path.exists(b))
+
+    def test_keep_is_not_evicted(self):
+        cache = SegmentCache(self.path("segments"), max_bytes=15)
+        a = self.add(cache, "a", 10, 1000)
+        b = self.add(cache, "b", 10, 2000)
+        self.assertEqual(cache.evict(keep=(a,)), 10)
+        self.assertTrue(os.path.exists(a))
+        self.assertFalse(os.path.exists(b))
+
+    def test_part_files(self):
+        cache = SegmentCache(self.path("segments"), max_bytes=100)
+        self.add(cache, "a", 10, 1000)
+        fresh = write_file(cache.temp_path("b"), 50)
+        stale = write_file(cache.temp_path("c"), 50)
+        set_mtime(stale, 1000)
+        # 未完成的文件不计入总大小，过期的被清理
+        self.assertEqual(cache.total_size(), 10)
+        self.assertTrue(os.path.exists(fresh))
+        self.assertFalse(os.path.exists(stale))
+
+    def test_clear(self):
+        cache = SegmentCache(self.path("segments"), max_bytes=100)
+        self.add(cache, "a", 10, 1000)
+        self.add(cache, "b", 10, 2000)
+        cache.clear()
+        self.assertEqual(cache.entries(), [])
+
+
+class PassLogCacheTest(TempDirTestCase):
+    def add(self, cache, key, timestamp):
+        temp_dir = cache.temp_dir(key)
+        write_file(os.path.join(temp_dir, f"{PassLogCache.STATS_PREFIX}-0.log"), 10)
+        prefix = cache.commit(key, temp_dir)
+        set_mtime(os.path.dirname(prefix), timestamp)
+        return prefix
+
+    def test_get_and_commit(self):
+        cache = PassLogCache(self.path("passlog"))
+        self.assertIsNone(cache.get("a"))
+        prefix = self.add(cache, "a", 1000)
+        self.assertEqual(prefix, os.path.join(self.path("passlog", "a"), PassLogCache.STATS_PREFIX))
+        self.assertEqual(cache.get("a"), prefix)
+
+    def test_evicts_oldest_entries(self):
+        cache = PassLogCache(self.path("passlog"), max_entries=2)
+        self.add(cache, "a", 1000)
+        self.add(cache, "b", 2000)
+        self.add(cache, "c", 3000)
+        # 提交c时淘汰了最旧的a
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+
+    def test_committed_entry_is_kept(self):
+        cache = PassLogCache(self.path("passlog"), max_entries=1)
+        self.add(cache, "a", 3000)
+        temp_dir = cache.temp_dir("b")
+        cache.commit("b", temp_dir)
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("b"))
+
+    def test_commit_existing_key(self):
+        cache = PassLogCache(self.path("passlog"))
+        self.add(cache, "a", 1000)
+        temp_dir = cache.temp_dir("a")
+        write_file(os.path.join(temp_dir, "other"), 10)
+        self.assertEqual(cache.commit("a", temp_dir), cache.get("a"))
+        self.assertFalse(os.path.exists(temp_dir))
+
+    def test_discard(self):
+        cache = PassLogCache(self.path("passlog"))
+        temp_dir = cache.temp_dir("a")
+        cache.discard(temp_dir)
+        self.assertFalse(os.path.exists(temp_dir))
+        self.assertIsNone(cache.get("a"))
+
+
+class ResultCacheTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.clock = iter(range(1000, 100000))
+        patcher = mock.patch('video_editor_app.cache_utils.time.time', side_effect=lambda: next(self.clock))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        os.makedirs(self.path("work"))
+
+    def make_cache(self, max_bytes=100):
+        return ResultCache(self.path("results"), max_bytes=max_bytes)
+
+    def store(self, cache, name, size):
+        output_file = write_file(self.path("work", name), size, name[:1].encode('ascii'))
+        key = cache.make_key("convert", [output_file], {'name': name})
+        cache.store(key, output_file, "convert", [output_file])
+        return key
+
+    def test_store_and_fetch(self):
+        cache = self.make_cache()
+        key = self.store(cache, "a.mp4", 10)
+        target = self.path("work", "copy.mp4")
+        self.assertTrue(cache.fetch(key, target))
+        with open(target, 'rb') as f:
+            self.assertEqual(f.read(), b'a' * 10)
+        self.assertEqual(cache.entries()[0]['hits'], 1)
+        self.assertFalse(cache.fetch("missing", target))
+
+    def test_evicts_least_recently_used(self):
+        cache = self.make_cache(max_bytes=25)
+        a = self.store(cache, "a.mp4", 10)
+        b = self.store(cache, "b.mp4", 10)
+        # 使用a后，b成为最久未使用的条目
+        self.assertTrue(cache.fetch(a, self.path("work", "copy.mp4")))
+        c = self.store(cache, "c.mp4", 10)
+        keys = [meta['key'] for meta in cache.entries()]
+        self.assertEqual(keys, [a, c])
+        self.assertNotIn(b, keys)
+        self.assertEqual(cache.total_size(), 20)
+
+    def test_new_entry_is_kept_when_over_limit(self):
+        cache = self.make_cache(max_bytes=5)
+        a = self.store(cache, "a.mp4", 10)
+        self.assertEqual([meta['key'] for meta in cache.entries()], [a])
+        b = self.store(cache, "b.mp4", 10)
+        self.assertEqual([meta['key'] for meta in cache.entries()], [b])
+
+    def test_set_max_bytes_evicts_and_persists(self):
+        cache = self.make_cache(max_bytes=100)
+        self.store(cache, "a.mp4", 10)
+        b = self.store(cache, "b.mp4", 10)
+        cache.set_max_bytes(15)
+        self.assertEqual([meta['key'] for meta in cache.entries()], [b])
+        self.assertEqual(ResultCache(self.path("results")).max_bytes, 15)
+
+    def test_modified_result_is_dropped(self):
+        cache = self.make_cache()
+        key = self.store(cache, "a.mp4", 10)
+        data_path = cache.entries()[0]['path']
+        cache.release_output(self.path("work", "a.mp4"))
+        write_file(data_path, 12, b'z')
+        self.assertFalse(cache.fetch(key, self.path("work", "copy.mp4")))
+        self.assertEqual(cache.entries(), [])
+        self.assertFalse(os.path.exists(data_path))
+
+    def test_key_is_content_addressed(self):
+        cache = self.make_cache()
+        input_file = write_file(self.path("work", "input.mkv"), 10)
+        key = cache.make_key("convert", [input_file], {})
+        # 复制的文件和只修改了时间的文件使用同一个结果
+        copy = shutil.copy(input_file, self.path("work", "copy.mkv"))
+        set_mtime(input_file, 5000)
+        self.assertEqual(key, cache.make_key("convert", [input_file], {}))
+        self.assertEqual(key, cache.make_key("convert", [copy], {}))
+        self.assertNotEqual(key, cache.make_key("merge", [input_file], {}))
+        # 大小不变的修改
+        write_file(input_file, 10, b'z')
+        self.assertNotEqual(key, cache.make_key("convert", [input_file], {}))
+
+    def test_release_output_keeps_cache(self):
+        cache = self.make_cache()
+        key = self.store(cache, "a.mp4", 10)
+        output_file = self.path("work", "a.mp4")
+        cache.release_output(output_file)
+        write_file(output_file, 10, b'z')
+        target = self.path("work", "copy.mp4")
+        self.assertTrue(cache.fetch(key, target))
+        with open(target, 'rb') as f:
+            self.assertEqual(f.read(), b'a' * 10)
+
+    def test_clear(self):
+        cache = self.make_cache()
+        self.store(cache, "a.mp4", 10)
+        self.store(cache, "b.mp4", 10)
+        cache.clear()
+        self.assertEqual(cache.entries(), [])
+        self.assertEqual(os.listdir(self.path("results")), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
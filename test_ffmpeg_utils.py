@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ffmpeg_utils中判断复制还是重新编码、计算编码参数等辅助函数的单元测试
+不需要ffmpeg，运行: python -m pytest -q test_ffmpeg_utils.py
+"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from video_editor_app import ffmpeg_utils
+from video_editor_app.ffmpeg_utils import (can_remux, can_copy_audio, choose_target_profile,
+                                           select_conform_inputs, conform_video_args, crossfade_segment,
+                                           loudness_gain, mosaic_cells, encoder_quality_args,
+                                           chunk_boundaries, bitrate_value, target_video_bitrate,
+                                           CONTAINER_OVERHEAD, sample_segments)
+
+
+def make_info(**overrides):
+    """H.264/AAC 1080p30 源文件的探测结果"""
+    info = {
+        'duration': 60.0,
+        'width': 1920,
+        'height': 1080,
+        'fps': 30.0,
+        'video_codec': 'h264',
+        'audio_codec': 'aac',
+        'sample_rate': 48000,
+        'channels': 2,
+        'audio_bit_rate': 192000,
+    }
+    info.update(overrides)
+    return info
+
+
+def make_params(rate_control='source', **overrides):
+    """转换标签页的转换参数"""
+    params = {
+        'video_codec': 'libx264',
+        'audio_codec': 'aac',
+        'fps': 0,
+        'bitrate': '5000k',
+        'audio_bitrate': '192k',
+        'resize': False,
+        'resolution': (1920, 1080),
+        'ladder': [],
+        'quality': {'preset': 'medium', 'rate_control': rate_control, 'crf': 23, 'bitrate': '5000k'},
+        'force_reencode': False,
+    }
+    params.update(overrides)
+    return params
+
+
+class CanRemuxTest(unittest.TestCase):
+    def test_container_change_keeping_source(self):
+        self.assertTrue(can_remux(make_info(), "in.mkv", "out.mp4", make_params()))
+
+    def test_same_container_is_never_remuxed(self):
+        self.assertFalse(can_remux(make_info(), "in.mp4", "out.mp4", make_params()))
+        self.assertFalse(can_remux(make_info(), "in.MP4", "out.mp4", make_params()))
+
+    def test_default_quality_remuxes_container_change(self):
+        # 默认的均衡方案未修改时自动只更换容器
+        self.assertTrue(can_remux(make_info(), "in.mkv", "out.mp4", make_params('crf')))
+        self.assertTrue(can_remux(make_info(), "in.mp4", "out.mov", make_params('crf')))
+        self.assertFalse(can_remux(make_info(), "in.mp4", "out.mp4", make_params('crf')))
+
+    def test_changed_quality_reencodes(self):
+        for rate_control in ('bitrate', 'two_pass', 'target_size', 'target_quality'):
+            with self.subTest(rate_control=rate_control):
+                self.assertFalse(can_remux(make_info(), "in.mp4", "out.mp4", make_params(rate_control)))
+                self.assertFalse(can_remux(make_info(), "in.mkv", "out.mp4", make_params(rate_control)))
+        changed = [{'preset': 'medium', 'rate_control': 'crf', 'crf': 20},
+                   {'preset': 'slow', 'rate_control': 'crf', 'crf': 23},
+                   {'preset': 'veryfast', 'rate_control': 'crf', 'crf': 28}]
+        for quality in changed:
+            with self.subTest(quality=quality):
+                self.assertFalse(can_remux(make_info(), "in.mkv", "out.mp4", make_params(quality=quality)))
+
+    def test_missing_quality_reencodes(self):
+        self.assertFalse(can_remux(make_info(), "in.mkv", "out.mp4", make_params(quality=None)))
+
+    def test_force_reencode_overrides_default_quality(self):
+        self.assertFalse(can_remux(make_info(), "in.mkv", "out.mp4", make_params('crf', force_reencode=True)))
+
+    def test_force_reencode(self):
+        self.assertFalse(can_remux(make_info(), "in.mkv", "out.mp4", make_params(force_reencode=True)))
+
+    def test_codec_mismatch(self):
+        self.assertFalse(can_remux(make_info(video_codec='hevc'), "in.mkv", "out.mp4", make_params()))
+        self.assertFalse(can_remux(make_info(audio_codec='opus'), "in.mkv", "out.mp4", make_params()))
+
+    def test_audio_bitrate_above_request(self):
+        info = make_info(audio_bit_rate=320000)
+        self.assertFalse(can_remux(info, "in.mkv", "out.mp4", make_params(audio_bitrate='128k')))
+        self.assertTrue(can_remux(info, "in.mkv", "out.mp4", make_params(audio_bitrate='256k')))
+
+    def test_resolution_and_fps_change(self):
+        self.assertFalse(can_remux(make_info(), "in.mkv", "out.mp4",
+                                   make_params(resize=True, resolution=(1280, 720))))
+        self.assertTrue(can_remux(make_info(), "in.mkv", "out.mp4",
+                                  make_params(resize=True, resolution=(1920, 1080))))
+        self.assertFalse(can_remux(make_info(), "in.mkv", "out.mp4", make_params(fps=25)))
+
+    def test_container_cannot_hold_codec(self):
+        self.assertFalse(can_remux(make_info(video_codec='vp9'), "in.mkv", "out.mp4",
+                                   make_params(video_codec='libvpx-vp9')))
+
+    def test_source_without_audio(self):
+        info = make_info(audio_codec=None, audio_bit_rate=None)
+        self.assertTrue(can_remux(info, "in.mkv", "out.mp4", make_params()))
+
+
+class CanCopyAudioTest(unittest.TestCase):
+    def test_matching_codec(self):
+        self.assertTrue(can_copy_audio(make_info(), 'aac', 'mp4'))
+
+    def test_codec_mismatch_or_missing(self):
+        self.assertFalse(can_copy_audio(make_info(), 'libmp3lame', 'mp4'))
+        self.assertFalse(can_copy_audio(make_info(audio_codec=None), 'aac', 'mp4'))
+
+    def test_bitrate_limit(self):
+        self.assertTrue(can_copy_audio(make_info(), 'aac', 'mp4', '192k'))
+        self.assertTrue(can_copy_audio(make_info(), 'aac', 'mp4', '128k'))
+        self.assertFalse(can_copy_audio(make_info(), 'aac', 'mp4', '96k'))
+
+    def test_sample_rate_and_channels(self):
+        self.assertFalse(can_copy_audio(make_info(), 'aac', 'mp4', sample_rate=44100))
+        self.assertFalse(can_copy_audio(make_info(), 'aac', 'mp4', channels=1))
+        self.assertTrue(can_copy_audio(make_info(), 'aac', 'mp4', sample_rate=48000, channels=2))
+
+    def test_container(self):
+        self.assertFalse(can_copy_audio(make_info(audio_codec='opus'), 'libopus', 'avi'))
+        self.assertTrue(can_copy_audio(make_info(audio_codec='opus'), 'libopus', 'mkv'))
+        self.assertFalse(can_copy_audio(make_info(), 'aac', 'webm'))
+
+
+class SelectConformInputsTest(unittest.TestCase):
+    def infos(self, *overrides):
+        base = {'video_profile': 'High', 'level': 40, 'extradata_hash': 'sha256:a', 'pix_fmt': 'yuv420p',
+                'frame_rate': '30'}
+        return [make_info(**dict(base, **override)) for override in overrides]
+
+    def test_matching_inputs_are_copied(self):
+        infos = self.infos({}, {}, {})
+        self.assertEqual(select_conform_inputs(infos, choose_target_profile(infos)), set())
+
+    def test_one_mismatch_conforms_all(self):
+        for override in ({'width': 1280, 'height': 720}, {'extradata_hash': 'sha256:b'}, {'level': 41}):
+            with self.subTest(override=override):
+                infos = self.infos({}, {}, override)
+                self.assertEqual(select_conform_inputs(infos, choose_target_profile(infos)), {0, 1, 2})
+
+    def test_reencoded_joins_conform_all(self):
+        infos = self.infos({}, {})
+        self.assertEqual(select_conform_inputs(infos, choose_target_profile(infos), True), {0, 1})
+
+
+class CrossfadeSegmentTest(unittest.TestCase):
+    def test_matches_conformed_segments(self):
+        info = make_info(video_profile='High', level=41, pix_fmt='yuv420p', frame_rate='30')
+        profile = choose_target_profile([info])
+        quality = {'preset': 'fast', 'rate_control': 'crf', 'crf': 20}
+        with mock.patch.object(ffmpeg_utils, 'run_ffmpeg') as run_ffmpeg:
+            crossfade_segment("a.ts", 50.0, 60.0, "b.ts", 3.0, 'fade', 1.0, profile, "out.ts", quality=quality)
+        args = run_ffmpeg.call_args[0][0]
+        encoder_args = conform_video_args(profile, quality)[2:]
+        self.assertEqual(encoder_args[:2], ['-c:v', 'libx264'])
+        self.assertIn('-profile:v', encoder_args)
+        index = args.index('-c:v')
+        self.assertEqual(args[index:index + len(encoder_args)], encoder_args)
+        self.assertEqual(args[args.index('-level') + 1], '4.1')
+
+
+class LoudnessGainTest(unittest.TestCase):
+    def test_gain_to_target(self):
+        self.assertEqual(loudness_gain({'input_i': -30.0, 'input_tp': -12.0}), 7.0)
+        self.assertEqual(loudness_gain({'input_i': -16.0, 'input_tp': -1.0}), -7.0)
+
+    def test_limited_by_true_peak(self):
+        self.assertEqual(loudness_gain({'input_i': -30.0, 'input_tp': -4.0}), 3.0)
+        self.assertEqual(loudness_gain({'input_i': -30.0, 'input_tp': -4.0}, max_true_peak=-2.0), 2.0)
+
+    def test_silence_or_missing_measurement(self):
+        self.assertEqual(loudness_gain(None), 0.0)
+        self.assertEqual(loudness_gain({'input_i': None}), 0.0)
+        self.assertEqual(loudness_gain({'input_i': -float('inf'), 'input_tp': -float('inf')}), 0.0)
+        self.assertEqual(loudness_gain({'input_i': float('nan')}), 0.0)
+        self.assertEqual(loudness_gain({'input_i': -80.0, 'input_tp': -60.0}), 0.0)
+
+
+class MosaicCellsTest(unittest.TestCase):
+    def test_auto_grid(self):
+        cells = mosaic_cells('grid', 3, 1920, 1080)
+        self.assertEqual(cells, [(0, 0, 960, 540), (960, 0, 960, 540), (0, 540, 960, 540)])
+
+    def test_fixed_grid_with_even_sizes(self):
+        cells = mosaic_cells('grid', 9, 1000, 562, grid_size=3)
+        self.assertEqual(len(cells), 9)
+        self.assertEqual(cells[4], (332, 186, 332, 186))
+        with self.assertRaises(RuntimeError):
+            mosaic_cells('grid', 5, 1920, 1080, grid_size=2)
+
+    def test_picture_in_picture(self):
+        cells = mosaic_cells('pip', 3, 1920, 1080)
+        self.assertEqual(cells[0], (0, 0, 1920, 1080))
+        self.assertEqual(cells[1], (1920 - 480 - 26, 1080 - 270 - 26, 480, 270))
+        self.assertEqual(cells[2], (1920 - 480 - 26, 1080 - 2 * (270 + 26), 480, 270))
+        with self.assertRaises(RuntimeError):
+            mosaic_cells('pip', 6, 1920, 1080)
+
+    def test_unknown_layout(self):
+        with self.assertRaises(ValueError):
+            mosaic_cells('diagonal', 2, 1920, 1080)
+
+
+class EncoderQualityArgsTest(unittest.TestCase):
+    def test_x264(self):
+        quality = {'preset': 'fast', 'rate_control': 'crf', 'crf': 20}
+        self.assertEqual(encoder_quality_args('libx264', quality), ['-preset', 'fast', '-crf', '20'])
+        self.assertEqual(encoder_quality_args('libx264', quality, include_preset=False), ['-crf', '20'])
+        quality = {'preset': 'fast', 'rate_control': 'bitrate', 'bitrate': '4000k'}
+        self.assertEqual(encoder_quality_args('libx264', quality), ['-preset', 'fast', '-b:v', '4000k'])
+
+    def test_vp9_crf_scale(self):
+        args = encoder_quality_args('libvpx-vp9', {'preset': 'medium', 'rate_control': 'crf', 'crf': 23})
+        self.assertEqual(args[args.index('-crf') + 1], '32')
+        self.assertEqual(args[args.index('-b:v') + 1], '0')
+        self.assertIn('-row-mt', args)
+
+    def test_mpeg4_qscale(self):
+        args = encoder_quality_args('mpeg4', {'preset': 'slow', 'rate_control': 'crf', 'crf': 23})
+        self.assertEqual(args, ['-q:v', '5', '-mbd', 'rd', '-trellis', '1'])
+
+    def test_nvenc(self):
+        args = encoder_quality_args('h264_nvenc', {'preset': 'medium', 'rate_control': 'crf', 'crf': 23})
+        self.assertEqual(args, ['-preset', 'p4', '-rc', 'vbr', '-cq', '23', '-b:v', '0'])
+
+    def test_unsupported_codec(self):
+        self.assertEqual(encoder_quality_args('rawvideo', {'rate_control': 'crf'}), [])
+        self.assertEqual(encoder_quality_args('gif', {'rate_control': 'bitrate', 'bitrate': '1M'}), [])
+
+
+class ChunkBoundariesTest(unittest.TestCase):
+    def boundaries(self, keyframes, duration=120.0, count=3, start_time=0.0):
+        def find_keyframes(file_path, start, end):
+            return [time for time in keyframes if start <= time <= end]
+
+        with mock.patch.object(ffmpeg_utils, 'find_keyframes', side_effect=find_keyframes):
+            return chunk_boundaries("in.mp4", duration, count, start_time)
+
+    def test_cut_at_first_keyframe_after_split_point(self):
+        self.assertEqual(self.boundaries([0.0, 38.0, 42.0, 81.5, 90.0]),
+                         [(0.0, 42.0), (42.0, 81.5), (81.5, 120.0)])
+
+    def test_split_point_without_keyframe_is_skipped(self):
+        self.assertEqual(self.boundaries([0.0, 42.0]), [(0.0, 42.0), (42.0, 120.0)])
+        self.assertEqual(self.boundaries([0.0]), [(0.0, 120.0)])
+
+    def test_start_time_offset(self):
+        self.assertEqual(self.boundaries([10.0, 70.0], count=2, start_time=10.0), [(0.0, 60.0), (60.0, 120.0)])
+
+
+class BitrateTest(unittest.TestCase):
+    def test_bitrate_value(self):
+        self.assertEqual(bitrate_value('192k'), 192000)
+        self.assertEqual(bitrate_value('5M'), 5000000)
+        self.assertEqual(bitrate_value('2.5m'), 2500000)
+        self.assertEqual(bitrate_value(128000), 128000)
+
+    def test_target_video_bitrate(self):
+        target_bytes = 100 * 1024 ** 2
+        total = target_bytes * 8 * (1 - CONTAINER_OVERHEAD) / 60
+        self.assertEqual(target_video_bitrate(target_bytes, 60), int(total))
+        self.assertEqual(target_video_bitrate(target_bytes, 60, '128k'), int(total - 128000))
+
+    def test_target_too_small_or_no_duration(self):
+        with self.assertRaises(RuntimeError):
+            target_video_bitrate(1024 ** 2, 600, '192k')
+        with self.assertRaises(RuntimeError):
+            target_video_bitrate(100 * 1024 ** 2, 0)
+
+
+class SampleSegmentsTest(unittest.TestCase):
+    def test_evenly_spaced(self):
+        self.assertEqual(sample_segments(100.0, count=3, length=10.0), [(20.0, 10.0), (45.0, 10.0), (70.0, 10.0)])
+
+    def test_short_video(self):
+        self.assertEqual(sample_segments(12.0, count=3, length=5.0), [(0.0, 12.0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
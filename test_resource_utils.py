@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+resource_utils中编码线程数和并行任务数规划的单元测试
+CPU核心数和可用内存用固定值代替，运行: python -m pytest -q test_resource_utils.py
+"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from video_editor_app import resource_utils
+from video_editor_app.resource_utils import (plan_encoding, plan_parallel_jobs, codec_thread_limit,
+                                             estimate_encode_memory, RESERVED_MEMORY)
+
+GB = 1024 ** 3
+
+
+class PlanTestCase(unittest.TestCase):
+    def machine(self, cpu_count, available_memory=64 * GB):
+        """模拟一台有cpu_count个核心和available_memory可用内存的电脑"""
+        patchers = [mock.patch.object(resource_utils, 'get_cpu_count', return_value=cpu_count),
+                    mock.patch.object(resource_utils, 'get_available_memory', return_value=available_memory)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class PlanEncodingTest(PlanTestCase):
+    def test_threads_limited_by_codec(self):
+        self.machine(16)
+        limit = codec_thread_limit('libx264', 1080)
+        plan = plan_encoding(8, 1920, 1080, 'libx264')
+        self.assertEqual(plan['codec_thread_limit'], limit)
+        self.assertEqual(plan['workers'], -(-16 // limit))
+        self.assertEqual(plan['threads'], min(limit, 16 // plan['workers']))
+        self.assertFalse(plan['threads_overridden'])
+        self.assertFalse(plan['workers_overridden'])
+
+    def test_workers_limited_by_job_count(self):
+        self.machine(64)
+        self.assertEqual(plan_encoding(1, 1920, 1080, 'libx264')['workers'], 1)
+        self.assertEqual(plan_encoding(0, 1920, 1080, 'libx264')['workers'], 1)
+
+    def test_workers_limited_by_memory(self):
+        memory_per_job = estimate_encode_memory(3840, 2160)
+        self.machine(64, RESERVED_MEMORY + 2 * memory_per_job)
+        plan = plan_encoding(16, 3840, 2160, 'libx265')
+        self.assertEqual(plan['workers'], 2)
+        self.assertEqual(plan['memory_per_job'], memory_per_job)
+
+    def test_single_threaded_codec(self):
+        self.machine(8)
+        plan = plan_encoding(20, 480, 270, 'gif')
+        self.assertEqual(plan['threads'], 1)
+        self.assertEqual(plan['workers'], 8)
+
+    def test_overrides(self):
+        self.machine(8)
+        plan = plan_encoding(10, 1920, 1080, 'libx264', threads=3, workers=4)
+        self.assertEqual((plan['threads'], plan['workers']), (3, 4))
+        self.assertTrue(plan['threads_overridden'])
+        self.assertTrue(plan['workers_overridden'])
+        self.assertEqual(plan_encoding(2, 1920, 1080, 'libx264', workers=4)['workers'], 2)
+
+    def test_unknown_memory(self):
+        self.machine(16, None)
+        plan = plan_encoding(8, 1920, 1080, 'libx264')
+        self.assertIsNone(plan['available_memory'])
+        self.assertGreaterEqual(plan['workers'], 1)
+
+
+class PlanParallelJobsTest(PlanTestCase):
+    def test_one_process_per_job(self):
+        self.machine(8)
+        plan = plan_parallel_jobs(4, 1920, 1080, 'libx264')
+        self.assertEqual((plan['workers'], plan['threads']), (4, 2))
+
+    def test_limited_by_cpu_count(self):
+        self.machine(4)
+        plan = plan_parallel_jobs(10, 1920, 1080, 'libx264')
+        self.assertEqual((plan['workers'], plan['threads']), (4, 1))
+
+    def test_limited_by_memory(self):
+        self.machine(16, RESERVED_MEMORY + 3 * estimate_encode_memory(1920, 1080))
+        self.assertEqual(plan_parallel_jobs(10, 1920, 1080, 'libx264')['workers'], 3)
+        self.machine(16, RESERVED_MEMORY // 2)
+        self.assertEqual(plan_parallel_jobs(10, 1920, 1080, 'libx264')['workers'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
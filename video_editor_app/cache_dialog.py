@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+结果缓存管理对话框
+查看剪辑、合并和转换的缓存结果，修改缓存大小上限，删除或清空缓存
+"""
+
+import os
+import time
+import logging
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QLabel,
+                            QTableWidget, QTableWidgetItem, QAbstractItemView, QHeaderView,
+                            QDoubleSpinBox, QMessageBox)
+from PyQt5.QtCore import Qt
+
+try:
+    from .cache_utils import ResultCache
+    from .estimate_utils import format_size
+except ImportError:
+    from cache_utils import ResultCache
+    from estimate_utils import format_size
+
+# 获取logger
+logger = logging.getLogger("VideoEditor.cache")
+
+# 操作名称的显示文字
+OPERATION_LABELS = {
+    'clip': "剪辑",
+    'merge': "合并",
+    'convert': "转换",
+}
+
+
+class ResultCacheDialog(QDialog):
+    """结果缓存管理对话框"""
+    HEADERS = ["操作", "输入文件", "大小", "命中次数", "最近使用"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.cache = ResultCache()
+        self.setWindowTitle("结果缓存")
+        self.setMinimumSize(720, 420)
+        self.setStyleSheet("""
+            QDialog {
+                background-color: #1e1e2e;
+                color: #cdd6f4;
+            }
+            QLabel {
+                color: #cdd6f4;
+            }
+            QTableWidget, QDoubleSpinBox {
+                background-color: #313244;
+                color: #cdd6f4;
+                border: 1px solid #45475a;
+                border-radius: 5px;
+            }
+            QHeaderView::section {
+                background-color: #45475a;
+                color: #cdd6f4;
+                border: none;
+                padding: 4px;
+            }
+            QPushButton {
+                background-color: #89b4fa;
+                color: #1e1e2e;
+                border: none;
+                border-radius: 5px;
+                padding: 8px 15px;
+                font-weight: bold;
+            }
+            QPushButton:hover {
+                background-color: #b4befe;
+            }
+            QPushButton:pressed {
+                background-color: #74c7ec;
+            }
+        """)
+
+        layout = QVBoxLayout(self)
+
+        # 缓存条目列表（最近使用的在前）
+        self.table = QTableWidget(0, len(self.HEADERS))
+        self.table.setHorizontalHeaderLabels(self.HEADERS)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        layout.addWidget(self.table)
+
+        # 总大小和大小上限
+        limit_layout = QHBoxLayout()
+        self.summary_label = QLabel()
+        limit_layout.addWidget(self.summary_label)
+        limit_layout.addStretch()
+        limit_layout.addWidget(QLabel("大小上限:"))
+        self.limit_spinbox = QDoubleSpinBox()
+        self.limit_spinbox.setRange(0, 10000)
+        self.limit_spinbox.setDecimals(1)
+        self.limit_spinbox.setSuffix(" GB")
+        self.limit_spinbox.setValue(self.cache.max_bytes / 1024 ** 3)
+        limit_layout.addWidget(self.limit_spinbox)
+        apply_button = QPushButton("应用")
+        apply_button.clicked.connect(self.apply_limit)
+        limit_layout.addWidget(apply_button)
+        layout.addLayout(limit_layout)
+
+        # 按钮
+        button_layout = QHBoxLayout()
+        remove_button = QPushButton("删除选中项")
+        remove_button.clicked.connect(self.remove_selected)
+        button_layout.addWidget(remove_button)
+        clear_button = QPushButton("清空缓存")
+        clear_button.clicked.connect(self.clear_cache)
+        button_layout.addWidget(clear_button)
+        button_layout.addStretch()
+        close_button = QPushButton("关闭")
+        close_button.clicked.connect(self.accept)
+        button_layout.addWidget(close_button)
+        layout.addLayout(button_layout)
+
+        self.refresh()
+
+    def refresh(self):
+        """重新读取缓存条目"""
+        entries = list(reversed(self.cache.entries()))
+        self.table.setRowCount(len(entries))
+        for row, meta in enumerate(entries):
+            inputs = meta.get('inputs', [])
+            values = [
+                OPERATION_LABELS.get(meta.get('operation'), meta.get('operation', "")),
+                "，".join(os.path.basename(path) for path in inputs),
+                format_size(meta.get('size', 0)),
+                str(meta.get('hits', 0)),
+                time.strftime("%Y-%m-%d %H:%M", time.localtime(meta.get('last_used', 0))),
+            ]
+            for col, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if col == 0:
+                    item.setData(Qt.UserRole, meta['key'])
+                if col == 1:
+                    item.setToolTip("\n".join(inputs))
+                self.table.setItem(row, col, item)
+
+        total = sum(meta.get('size', 0) for meta in entries)
+        self.summary_label.setText(f"共 {len(entries)} 项，{format_size(total)}")
+
+    def apply_limit(self):
+        self.cache.set_max_bytes(int(self.limit_spinbox.value() * 1024 ** 3))
+        logger.info(f"结果缓存大小上限修改为 {format_size(self.cache.max_bytes)}")
+        self.refresh()
+
+    def remove_selected(self):
+        rows = set(index.row() for index in self.table.selectedIndexes())
+        for row in rows:
+            self.cache.remove(self.table.item(row, 0).data(Qt.UserRole))
+        self.refresh()
+
+    def clear_cache(self):
+        reply = QMessageBox.question(self, "确认", "确定要清空全部缓存结果吗？",
+                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if reply == QMessageBox.Yes:
+            self.cache.clear()
+            self.refresh()
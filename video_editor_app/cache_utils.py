@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+缓存辅助函数
+提供文件内容指纹、持久化的JSON缓存和中间片段的磁盘缓存，用于跳过重复的分析和处理
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+
+# 获取logger
+logger = logging.getLogger("VideoEditor.cache")
+
+# 计算指纹时读取的块大小
+FINGERPRINT_CHUNK_SIZE = 1024 * 1024
+
+# 指纹缓存，键为 (路径, 文件大小, 修改时间)
+_fingerprint_cache = {}
+_fingerprint_lock = threading.Lock()
+
+# 保存在缓存目录中的指纹记录（每个路径一条），重新启动程序后未修改的文件不需要再次读取
+_fingerprint_store = None
+
+
+def get_cache_dir(name=None):
+    """获取缓存目录（位于用户目录下），不存在时自动创建"""
+    cache_dir = os.path.join(os.path.expanduser("~"), ".video_editor", "cache")
+    if name:
+        cache_dir = os.path.join(cache_dir, name)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def _get_fingerprint_store():
+    global _fingerprint_store
+    with _fingerprint_lock:
+        if _fingerprint_store is None:
+            _fingerprint_store = JsonCache(os.path.join(get_cache_dir(), "fingerprints.json"))
+        return _fingerprint_store
+
+
+def file_fingerprint(file_path):
+    """
+    计算文件内容指纹（整个文件的SHA-256）
+
+    指纹只由文件内容决定，复制或只修改了时间的文件指纹不变，大小不变的修改也会得到不同的指纹。
+    文件大小和修改时间只用来判断能否直接使用记录的结果：未修改的文件不再读取，
+    记录同时保存在内存和缓存目录中
+    """
+    path = os.path.abspath(file_path)
+    stat = os.stat(path)
+    cache_key = (path, stat.st_size, stat.st_mtime_ns)
+    with _fingerprint_lock:
+        cached = _fingerprint_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    store = _get_fingerprint_store()
+    record = store.get(path)
+    if record and record.get('size') == stat.st_size and record.get('mtime_ns') == stat.st_mtime_ns:
+        fingerprint = record['fingerprint']
+    else:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(FINGERPRINT_CHUNK_SIZE), b''):
+                digest.update(block)
+        fingerprint = digest.hexdigest()
+        store.set(path, {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'fingerprint': fingerprint})
+
+    with _fingerprint_lock:
+        _fingerprint_cache[cache_key] = fingerprint
+    return fingerprint
+
+
+class JsonCache:
+    """保存在JSON文件中的键值缓存，可在多个线程中使用"""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._data = None
+
+    def _load(self):
+        if self._data is None:
+            try:
+                with open(self.file_path, 'r', encoding='utf-8') as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+        return self._data
+
+    def _save(self):
+        # 先写入临时文件再替换，避免写入中断导致缓存损坏
+        temp_path = f"{self.file_path}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._data, f, ensure_ascii=False)
+            os.replace(temp_path, self.file_path)
+        except OSError as e:
+            logger.warning(f"保存缓存失败: {str(e)}")
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._load().get(key, default)
+
+    def set(self, key, value):
+        with self._lock:
+            self._load()[key] = value
+            self._save()
+
+
+def make_cache_key(fingerprints, params):
+    """由输入文件指纹和参数（可JSON序列化）计算缓存键"""
+    digest = hashlib.sha256()
+    for fingerprint in fingerprints:
+        digest.update(fingerprint.encode('ascii'))
+    digest.update(json.dumps(params, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class SegmentCache:
+    """
+    中间片段的磁盘缓存
+
+    每个键对应缓存目录中的一个文件；总大小超过上限时按最近使用时间淘汰
+    """
+
+    # 残留的未完成文件超过该时间（秒）后清理
+    STALE_PART_AGE = 24 * 3600
+
+    def __init__(self, cache_dir, max_bytes, extension='.ts'):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.extension = extension
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, f"{key}{self.extension}")
+
+    def get(self, key):
+        """返回缓存文件路径并更新其使用时间，未命中时返回None"""
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def temp_path(self, key):
+        """生成写入用的临时文件路径（与缓存文件在同一目录，提交时可以原子替换）"""
+        return os.path.join(self.cache_dir, f"{key}.{os.getpid()}.{threading.get_ident()}.part{self.extension}")
+
+    def commit(self, key, temp_path):
+        """将写入完成的临时文件加入缓存"""
+        path = self.path_for(key)
+        os.replace(temp_path, path)
+        return path
+
+    def entries(self):
+        """返回缓存文件列表 [(路径, 大小, 最近使用时间)]，按使用时间从旧到新排列"""
+        result = []
+        now = time.time()
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.endswith(self.extension):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                if '.part' in entry.name:
+                    # 清理中断时残留的临时文件
+                    if now - stat.st_mtime > self.STALE_PART_AGE:
+                        self._remove(entry.path)
+                    continue
+                result.append((entry.path, stat.st_size, stat.st_mtime))
+        result.sort(key=lambda item: item[2])
+        return result
+
+    def total_size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=()):
+        """淘汰最久未使用的文件直到总大小不超过上限，keep中的文件不会被删除"""
+        keep = set(os.path.abspath(path) for path in keep)
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if os.path.abspath(path) in keep:
+                continue
+            if self._remove(path):
+                total -= size
+        return total
+
+    def clear(self):
+        for path, _, _ in self.entries():
+            self._remove(path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except OSError as e:
+            logger.warning(f"删除缓存文件失败: {str(e)}")
+            return False
+
+
+class PassLogCache:
+    """
+    两遍编码第一遍统计数据的磁盘缓存
+
+    每个键对应缓存目录中的一个子目录，保存编码器写出的统计文件（文件名前缀为STATS_PREFIX）；
+    条目数超过上限时按最近使用时间淘汰
+    """
+
+    STATS_PREFIX = "pass"
+
+    # 残留的未完成目录超过该时间（秒）后清理
+    STALE_PART_AGE = 24 * 3600
+
+    def __init__(self, cache_dir, max_entries=20):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, key):
+        """返回缓存的统计文件前缀并更新其使用时间，未命中时返回None"""
+        path = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(path):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return os.path.join(path, self.STATS_PREFIX)
+
+    def temp_dir(self, key):
+        """创建写入用的临时目录，返回目录路径"""
+        path = os.path.join(self.cache_dir, f"{key}.{os.getpid()}.{threading.get_ident()}.part")
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def commit(self, key, temp_dir):
+        """将写入完成的临时目录加入缓存，返回统计文件前缀"""
+        path = os.path.join(self.cache_dir, key)
+        try:
+            os.replace(temp_dir, path)
+        except OSError:
+            # 其他任务已经写入了同一个键
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            if not os.path.isdir(path):
+                raise
+        self.evict(keep=(path,))
+        return os.path.join(path, self.STATS_PREFIX)
+
+    def discard(self, temp_dir):
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def evict(self, keep=()):
+        """淘汰最久未使用的条目直到条目数不超过上限，keep中的目录不会被删除"""
+        keep = set(os.path.abspath(path) for path in keep)
+        entries = []
+        now = time.time()
+        with os.scandir(self.cache_dir) as items:
+            for item in items:
+                if not item.is_dir():
+                    continue
+                try:
+                    mtime = item.stat().st_mtime
+                except OSError:
+                    continue
+                if item.name.endswith('.part'):
+                    if now - mtime > self.STALE_PART_AGE:
+                        shutil.rmtree(item.path, ignore_errors=True)
+                    continue
+                entries.append((mtime, item.path))
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+            if os.path.abspath(path) not in keep:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+class ResultCache:
+    """
+    操作结果缓存（按内容寻址）
+
+    键由全部输入文件的内容指纹和规范化的操作参数计算，与文件路径和文件名无关；
+    命中时通过硬链接把缓存的结果放到输出路径（不支持硬链接时复制）。每个结果旁保存
+    一个记录操作、输入、大小和使用情况的JSON文件，总大小超过上限时按最近使用时间淘汰
+    """
+
+    # 大小上限保存在设置文件中的键
+    SETTINGS_KEY = 'result_cache_max_bytes'
+    DEFAULT_MAX_BYTES = 50 * 1024 ** 3
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or get_cache_dir("results")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.settings = JsonCache(os.path.join(get_cache_dir(), "settings.json"))
+        if max_bytes is None:
+            max_bytes = self.settings.get(self.SETTINGS_KEY, self.DEFAULT_MAX_BYTES)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def set_max_bytes(self, max_bytes):
+        """修改并保存大小上限，超出部分立即淘汰"""
+        self.max_bytes = max_bytes
+        self.settings.set(self.SETTINGS_KEY, max_bytes)
+        self.evict()
+
+    def make_key(self, operation, input_files, params):
+        """由操作名称、输入文件内容指纹和操作参数（可JSON序列化）计算缓存键"""
+        return make_cache_key([file_fingerprint(path) for path in input_files],
+                              {'operation': operation, 'params': params})
+
+    def _meta_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _data_path(self, key, extension):
+        return os.path.join(self.cache_dir, f"{key}{extension}")
+
+    def _read_meta(self, key):
+        try:
+            with open(self._meta_path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, key, meta):
+        temp_path = f"{self._meta_path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(temp_path, self._meta_path(key))
+
+    @staticmethod
+    def _link_or_copy(source, target):
+        """在target位置创建source的硬链接（跨磁盘等不支持时复制），target已存在时替换"""
+        temp_path = os.path.join(os.path.dirname(os.path.abspath(target)),
+                                 f".{os.path.basename(target)}.{os.getpid()}.{threading.get_ident()}.part")
+        try:
+            os.link(source, temp_path)
+        except OSError:
+            shutil.copyfile(source, temp_path)
+        try:
+            os.replace(temp_path, target)
+        except OSError:
+            os.remove(temp_path)
+            raise
+
+    @staticmethod
+    def release_output(output_file):
+        """
+        删除与缓存共用数据的旧输出文件
+
+        输出文件是缓存结果的硬链接时，直接覆盖写入会同时改掉缓存中的文件，写入前先删除
+        """
+        try:
+            if os.stat(output_file).st_nlink > 1:
+                os.remove(output_file)
+        except OSError:
+            pass
+
+    def fetch(self, key, output_file):
+        """缓存命中时把结果放到output_file并返回True；缓存文件已被修改时删除该条目"""
+        meta = self._read_meta(key)
+        if meta is None:
+            return False
+        data_path = self._data_path(key, meta.get('extension', ''))
+        try:
+            stat = os.stat(data_path)
+            if (file_fingerprint(data_path) != meta.get('fingerprint') or stat.st_size != meta.get('size')
+                    or stat.st_mtime_ns != meta.get('mtime_ns', stat.st_mtime_ns)):
+                logger.warning(f"缓存结果已被修改，删除该条目: {data_path}")
+                self.remove(key)
+                return False
+            self._link_or_copy(data_path, output_file)
+        except OSError as e:
+            logger.warning(f"读取缓存结果失败: {str(e)}")
+            return False
+
+        meta['hits'] = meta.get('hits', 0) + 1
+        meta['last_used'] = time.time()
+        try:
+            self._write_meta(key, meta)
+        except OSError:
+            pass
+        return True
+
+    def store(self, key, output_file, operation, input_files, params=None):
+        """把操作结果加入缓存（output_file保持不变），然后按大小上限淘汰旧条目"""
+        extension = os.path.splitext(output_file)[1].lower()
+        data_path = self._data_path(key, extension)
+        self._link_or_copy(output_file, data_path)
+        now = time.time()
+        self._write_meta(key, {
+            'operation': operation,
+            'inputs': [os.path.abspath(path) for path in input_files],
+            'params': params,
+            'extension': extension,
+            'size': os.path.getsize(data_path),
+            'mtime_ns': os.stat(data_path).st_mtime_ns,
+            'fingerprint': file_fingerprint(data_path),
+            'created': now,
+            'last_used': now,
+            'hits': 0,
+        })
+        self.evict(keep=(key,))
+
+    def entries(self):
+        """返回全部缓存条目（记录中附加key和path），按最近使用时间从旧到新排列"""
+        result = []
+        with os.scandir(self.cache_dir) as items:
+            for item in items:
+                if not item.name.endswith('.json') or not item.is_file():
+                    continue
+                key = item.name[:-len('.json')]
+                meta = self._read_meta(key)
+                if meta is None:
+                    continue
+                meta['key'] = key
+                meta['path'] = self._data_path(key, meta.get('extension', ''))
+                result.append(meta)
+        result.sort(key=lambda meta: meta.get('last_used', 0))
+        return result
+
+    def total_size(self):
+        return sum(meta.get('size', 0) for meta in self.entries())
+
+    def remove(self, key):
+        meta = self._read_meta(key)
+        paths = [self._meta_path(key)]
+        if meta is not None:
+            paths.append(self._data_path(key, meta.get('extension', '')))
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"删除缓存文件失败: {str(e)}")
+
+    def evict(self, keep=()):
+        """淘汰最久未使用的条目直到总大小不超过上限，keep中的键不会被删除"""
+        with self._lock:
+            entries = self.entries()
+            total = sum(meta.get('size', 0) for meta in entries)
+            for meta in entries:
+                if total <= self.max_bytes:
+                    break
+                if meta['key'] in keep:
+                    continue
+                self.remove(meta['key'])
+                total -= meta.get('size', 0)
+            return total
+
+    def clear(self):
+        for meta in self.entries():
+            self.remove(meta['key'])
@@ -3,61 +3,100 @@
 
 import os
 import cv2
-import tempfile
+import logging
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, 
                             QLabel, QFileDialog, QSlider, QProgressBar, 
                             QMessageBox, QFrame, QStyle, QGroupBox, QFormLayout, 
-                            QSpinBox, QLineEdit, QDialog, QSplitter, QStyleOptionSlider)
+                            QSpinBox, QLineEdit, QDialog, QSplitter, QStyleOptionSlider,
+                            QComboBox)
 from PyQt5.QtCore import Qt, QTimer, QUrl, QSize, pyqtSignal, QThread, QRect
 from PyQt5.QtGui import QIcon, QDrag, QPixmap, QPainter, QColor, QBrush, QPen
 from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent
 from PyQt5.QtMultimediaWidgets import QVideoWidget
-from moviepy.editor import VideoFileClip
+
+try:
+    from .ffmpeg_utils import (encoder_quality_args, get_quality_profile, QUALITY_PROFILE_LABELS,
+                               DEFAULT_QUALITY_PROFILE, probe_media, run_ffmpeg, audio_codec_args)
+    from .resource_utils import plan_encoding
+    from .cache_utils import ResultCache
+except ImportError:
+    from ffmpeg_utils import (encoder_quality_args, get_quality_profile, QUALITY_PROFILE_LABELS,
+                              DEFAULT_QUALITY_PROFILE, probe_media, run_ffmpeg, audio_codec_args)
+    from resource_utils import plan_encoding
+    from cache_utils import ResultCache
+
+# 获取logger
+logger = logging.getLogger("VideoEditor.clip")
 
 class VideoProcessThread(QThread):
     progress_updated = pyqtSignal(int)
     process_finished = pyqtSignal(str)
     error_occurred = pyqtSignal(str)
     
-    def __init__(self, input_file, output_file, start_time, end_time):
+    def __init__(self, input_file, output_file, start_time, end_time, quality=None):
         super().__init__()
         self.input_file = input_file
         self.output_file = output_file
         self.start_time = start_time
         self.end_time = end_time
+        # 速度/质量设置
+        self.quality = quality or get_quality_profile()
+        # 任务指标（编码线程规划）
+        self.metrics = {}
         
     def run(self):
         try:
-            # 使用moviepy裁剪视频
-            video = VideoFileClip(self.input_file)
+            info = probe_media(self.input_file)
+            
+            # 按视频分辨率规划编码线程数
+            plan = plan_encoding(1, info['width'], info['height'], 'libx264')
+            self.metrics['plan'] = plan
             
             # 如果结束时间为None，则使用视频总时长
             if self.end_time is None:
-                self.end_time = video.duration
+                self.end_time = info['duration']
                 
             # 如果开始时间为None，则使用0
             if self.start_time is None:
                 self.start_time = 0
-                
-            # 裁剪视频
-            clip = video.subclip(self.start_time, self.end_time)
+            duration = self.end_time - self.start_time
             
-            # 发送50%进度信号
-            self.progress_updated.emit(50)
-            
-            # 写入输出文件
-            clip.write_videofile(self.output_file, 
-                                codec='libx264', 
-                                audio_codec='aac',
-                                temp_audiofile=os.path.join(tempfile.gettempdir(), "temp-audio.m4a"),
-                                remove_temp=True)
+            # 相同的源文件内容和剪辑设置已经处理过时直接使用缓存的结果
+            result_cache = ResultCache()
+            operation_params = {
+                'start_time': self.start_time,
+                'end_time': self.end_time,
+                'quality': self.quality,
+                'extension': os.path.splitext(self.output_file)[1].lower(),
+            }
+            cache_key = result_cache.make_key('clip', [self.input_file], operation_params)
+            if result_cache.fetch(cache_key, self.output_file):
+                self.metrics['cached'] = True
+                logger.info(f"使用缓存的剪辑结果: {self.output_file}")
+                self.progress_updated.emit(100)
+                self.process_finished.emit(self.output_file)
+                return
+            result_cache.release_output(self.output_file)
             
-            # 关闭视频对象
-            video.close()
-            clip.close()
+            # 使用ffmpeg裁剪并重新编码视频；音频能直接复制时不重新编码，也不写临时音频文件
+            args = ['-ss', f"{self.start_time:.3f}", '-i', self.input_file, '-t', f"{duration:.3f}",
+                    '-map', '0:v:0', '-c:v', 'libx264', '-pix_fmt', 'yuv420p']
+            args += encoder_quality_args('libx264', self.quality)
+            if info.get('audio_codec'):
+                audio_args = audio_codec_args(info, 'aac', container=os.path.splitext(self.output_file)[1].lower()[1:])
+                self.metrics['audio'] = 'copy' if 'copy' in audio_args else 'encode'
+                args += ['-map', '0:a:0'] + audio_args
+            args += ['-threads', str(plan['threads']), '-movflags', '+faststart', self.output_file]
+            run_ffmpeg(args, duration=duration,
+                       progress_callback=lambda value: self.progress_updated.emit(int(value * 100)))
             
             # 发送100%进度信号
             self.progress_updated.emit(100)
+            logger.info(f"剪辑完成: {self.output_file}，任务指标: {self.metrics}")
+            try:
+                result_cache.store(cache_key, self.output_file, 'clip', [self.input_file], operation_params)
+            except OSError as e:
+                logger.warning(f"保存剪辑结果到缓存失败: {str(e)}")
             
             # 发送完成信号
             self.process_finished.emit(self.output_file)
@@ -1143,6 +1182,26 @@ class VideoClipTab(QWidget):
         
         layout.addLayout(path_layout)
         
+        # 编码质量
+        quality_layout = QHBoxLayout()
+        quality_layout.setSpacing(5)
+        quality_layout.addWidget(QLabel("编码质量:"))
+        self.quality_combo = QComboBox()
+        for name, label in QUALITY_PROFILE_LABELS:
+            self.quality_combo.addItem(label, name)
+        self.quality_combo.setCurrentIndex(self.quality_combo.findData(DEFAULT_QUALITY_PROFILE))
+        self.quality_combo.setStyleSheet("""
+            QComboBox {
+                background-color: #313244;
+                color: #cdd6f4;
+                border: 1px solid #45475a;
+                border-radius: 4px;
+                padding: 5px;
+            }
+        """)
+        quality_layout.addWidget(self.quality_combo)
+        layout.addLayout(quality_layout)
+        
         # 按钮布局
         button_layout = QHBoxLayout()
         button_layout.setSpacing(10)
@@ -1228,7 +1287,8 @@ class VideoClipTab(QWidget):
         
         # 创建并启动处理线程
         self.process_thread = VideoProcessThread(
-            self.video_path, output_path, start_time, end_time
+            self.video_path, output_path, start_time, end_time,
+            get_quality_profile(self.quality_combo.currentData())
         )
         self.process_thread.progress_updated.connect(self.update_progress)
         self.process_thread.process_finished.connect(self.on_process_finished)
@@ -2,73 +2,1052 @@
 # -*- coding: utf-8 -*-
 
 import os
-import cv2
-import tempfile
+import math
+import time
+import shutil
 import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, 
                             QLabel, QFileDialog, QProgressBar, QMessageBox, 
                             QFrame, QComboBox, QSpinBox, QFormLayout, QStyle,
-                            QGroupBox, QDoubleSpinBox, QLineEdit, QCheckBox)
-from PyQt5.QtCore import Qt, QSize, pyqtSignal, QThread, QUrl
+                            QGroupBox, QDoubleSpinBox, QLineEdit, QCheckBox,
+                            QTableView, QAbstractItemView, QHeaderView, QTableWidget,
+                            QTableWidgetItem)
+from PyQt5.QtCore import Qt, QSize, pyqtSignal, QThread, QUrl, QAbstractTableModel, QModelIndex
 from PyQt5.QtGui import QIcon, QDrag, QPixmap, QPainter, QColor
-from moviepy.editor import VideoFileClip
+
+try:
+    from .ffmpeg_utils import (probe_media, run_ffmpeg, scale_filter, encoder_quality_args,
+                               get_quality_profile, ENCODER_PRESETS, QUALITY_PROFILE_LABELS,
+                               DEFAULT_QUALITY_PROFILE, SCALE_ALGORITHMS, SCALE_FIT_MODES,
+                               ANIMATION_DITHERS, export_animation, DEFAULT_LADDER, encode_ladder,
+                               PACKAGE_MANIFESTS, package_stream, MIN_CHUNK_DURATION,
+                               probe_stream_timing, chunk_boundaries, check_chunk_seams, check_av_sync,
+                               concat_copy, TWO_PASS_CODECS, target_video_bitrate, two_pass_args,
+                               QUALITY_METRICS, CRF_SEARCH_RANGE, sample_segments, measure_quality,
+                               can_remux, audio_codec_args, can_copy_audio, bitrate_value)
+    from .resource_utils import plan_encoding, get_cpu_count, RESERVED_MEMORY
+    from .cache_utils import (get_cache_dir, file_fingerprint, make_cache_key, PassLogCache, JsonCache,
+                              ResultCache)
+    from .estimate_utils import (EncodeHistory, encode_signature, sample_encode, encode_rates, output_pixels,
+                                 audio_bytes, with_overhead, new_estimate, add_basis, format_estimate,
+                                 COPY_BYTES_PER_SECOND)
+    from .merge_tab import VideoScanThread, EstimateThread, is_video_file, row_ranges
+except ImportError:
+    from ffmpeg_utils import (probe_media, run_ffmpeg, scale_filter, encoder_quality_args,
+                              get_quality_profile, ENCODER_PRESETS, QUALITY_PROFILE_LABELS,
+                              DEFAULT_QUALITY_PROFILE, SCALE_ALGORITHMS, SCALE_FIT_MODES,
+                              ANIMATION_DITHERS, export_animation, DEFAULT_LADDER, encode_ladder,
+                              PACKAGE_MANIFESTS, package_stream, MIN_CHUNK_DURATION,
+                              probe_stream_timing, chunk_boundaries, check_chunk_seams, check_av_sync,
+                              concat_copy, TWO_PASS_CODECS, target_video_bitrate, two_pass_args,
+                              QUALITY_METRICS, CRF_SEARCH_RANGE, sample_segments, measure_quality,
+                              can_remux, audio_codec_args, can_copy_audio, bitrate_value)
+    from resource_utils import plan_encoding, get_cpu_count, RESERVED_MEMORY
+    from cache_utils import (get_cache_dir, file_fingerprint, make_cache_key, PassLogCache, JsonCache,
+                             ResultCache)
+    from estimate_utils import (EncodeHistory, encode_signature, sample_encode, encode_rates, output_pixels,
+                                audio_bytes, with_overhead, new_estimate, add_basis, format_estimate,
+                                COPY_BYTES_PER_SECOND)
+    from merge_tab import VideoScanThread, EstimateThread, is_video_file, row_ranges
 
 # 获取logger
 logger = logging.getLogger("VideoEditor.convert")
 
-class VideoConvertThread(QThread):
-    progress_updated = pyqtSignal(int)
-    process_finished = pyqtSignal(str)
-    error_occurred = pyqtSignal(str)
+# 质量方案下拉框中"自定义"项的数据
+CUSTOM_QUALITY = 'custom'
+
+# 需要两遍编码的码率控制方式
+TWO_PASS_MODES = ('two_pass', 'target_size')
+
+# 转换方式：只更换容器 / 重新编码
+METHOD_REMUX = "remux"
+METHOD_ENCODE = "encode"
+METHOD_CACHED = "cached"
+METHOD_LABELS = {
+    METHOD_REMUX: "重新封装",
+    METHOD_ENCODE: "重新编码",
+    METHOD_CACHED: "使用缓存结果",
+}
+
+# 只影响执行方式、不影响转换结果的参数，不参与结果缓存的键
+EXECUTION_PARAMS = ('threads', 'workers', 'chunked', 'resumable')
+
+# 两遍编码第一遍统计数据的缓存条目上限
+PASS_LOG_CACHE_ENTRIES = 20
+
+# 断点续转：长于RESUME_MIN_DURATION（秒）的视频分段编码，每段不超过CHECKPOINT_INTERVAL（秒）；
+# 工作目录（以RESUME_DIR_PREFIX开头）超过STALE_RESUME_AGE（秒）未继续时清理
+CHECKPOINT_INTERVAL = 300
+RESUME_MIN_DURATION = 2 * CHECKPOINT_INTERVAL
+RESUME_DIR_PREFIX = ".resume_"
+RESUME_JOURNAL = "journal.json"
+STALE_RESUME_AGE = 7 * 24 * 3600
+
+# 两遍编码第一遍的耗时相对第二遍的比例（第一遍只分析，速度较快），用于预估耗时
+FIRST_PASS_COST = 0.5
+
+# 动图格式及其编码器
+ANIMATION_CODECS = {'gif': 'gif', 'webp': 'libwebp'}
+
+# 队列中每一项的状态
+STATUS_WAITING = "waiting"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_LABELS = {
+    STATUS_WAITING: "等待中",
+    STATUS_RUNNING: "转换中",
+    STATUS_DONE: "已完成",
+    STATUS_FAILED: "失败",
+}
+
+def package_output_path(output_dir, stem, package_format):
+    """流媒体打包的主清单路径，每个文件的分片写入单独的目录"""
+    return os.path.join(output_dir, f"{stem}_{package_format}", PACKAGE_MANIFESTS[package_format])
+
+def package_format_of(output_file):
+    """根据输出文件判断流媒体打包格式，不是打包输出时返回None"""
+    for package_format, manifest in PACKAGE_MANIFESTS.items():
+        if os.path.basename(output_file) == manifest:
+            return package_format
+    return None
+
+def remove_output(output_file, params=None):
+    """
+    删除转换失败时写了一半的输出
+
+    流媒体打包时删除整个分片目录；输出码率阶梯时同时删除每一档的文件
+    """
+    if package_format_of(output_file):
+        shutil.rmtree(os.path.dirname(output_file), ignore_errors=True)
+        return
+    paths = [output_file]
+    if params and params.get('ladder'):
+        paths += [ladder_output_path(output_file, rendition) for rendition in params['ladder']]
+    for path in paths:
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError:
+            pass
+
+def ladder_output_path(output_file, rendition):
+    """码率阶梯中一档的输出路径（在文件名后加上档位名称）"""
+    stem, ext = os.path.splitext(output_file)
+    return f"{stem}_{rendition['name']}{ext}"
+
+def output_size(input_files, params):
+    """获取转换后的最大分辨率 (宽, 高)，用于规划编码线程和估计内存"""
+    if params.get('ladder'):
+        largest = max(params['ladder'], key=lambda rendition: rendition['width'] * rendition['height'])
+        return largest['width'], largest['height']
+    if params['resize']:
+        return params['resolution']
+        
+    def frame_size(path):
+        try:
+            info = probe_media(path)
+            return (info.get('width') or 0) * (info.get('height') or 0), info.get('width'), info.get('height')
+        except Exception:
+            return 0, None, None
+            
+    with ThreadPoolExecutor(max_workers=max(1, min(16, len(input_files)))) as executor:
+        _, width, height = max(executor.map(frame_size, input_files), default=(0, None, None))
+    return width, height
+
+def can_split(params):
+    """普通格式转换才能分段编码（动图、码率阶梯和流媒体打包需要完整的输入）"""
+    output_format = params.get('format')
+    # 两遍编码的统计数据针对整个文件，不能分段
+    two_pass = (params.get('quality') or {}).get('rate_control') in TWO_PASS_MODES
+    return (not params.get('ladder') and not two_pass
+            and output_format not in ANIMATION_CODECS and output_format not in PACKAGE_MANIFESTS)
+
+def supports_chunking(params):
+    """是否分段并行编码"""
+    return bool(params.get('chunked')) and can_split(params)
+
+def supports_resume(params):
+    """长视频是否分段编码并记录进度，中断后可以继续转换"""
+    return bool(params.get('resumable')) and can_split(params)
+
+def plan_conversion(input_files, params):
+    """
+    按输出分辨率和视频编码规划编码线程数和同时转换的文件数，转换参数中的设置优先
     
-    def __init__(self, input_file, output_file, params):
-        super().__init__()
-        self.input_file = input_file
-        self.output_file = output_file
-        self.params = params
+    输出码率阶梯时每个文件同时运行多个编码器，按编码器总数规划后再换算为同时转换的文件数，
+    此时threads为每个编码器的线程数。分段并行编码时逐个转换文件，并发数用于同时编码的段数
+    （chunk_workers），threads为每段的线程数
+    """
+    width, height = output_size(input_files, params)
+    if supports_chunking(params):
+        cpu_count = get_cpu_count()
+        plan = plan_encoding(cpu_count, width, height, params['video_codec'],
+                             threads=params.get('threads'), workers=params.get('workers'))
+        # 按编码器的有效线程数规划时，核心数不多的电脑只会得到一个编码进程，分段就没有意义；
+        # 内存允许时至少同时编码两段，每段的线程数相应减少
+        enough_memory = (plan['available_memory'] is None
+                         or plan['available_memory'] - RESERVED_MEMORY >= 2 * plan['memory_per_job'])
+        if not params.get('workers') and plan['workers'] < 2 and cpu_count >= 2 and enough_memory:
+            plan = plan_encoding(cpu_count, width, height, params['video_codec'],
+                                 threads=params.get('threads'), workers=2)
+            plan['workers_overridden'] = False
+        plan['encoders_per_job'] = 1
+        plan['chunk_workers'] = plan['workers']
+        plan['workers'] = 1
+        return plan
         
-    def run(self):
+    codec = ANIMATION_CODECS.get(params.get('format'), params['video_codec'])
+    encoders = len(params.get('ladder') or []) or 1
+    workers = params.get('workers')
+    plan = plan_encoding(len(input_files) * encoders, width, height, codec,
+                         threads=params.get('threads'), workers=workers * encoders if workers else None)
+    plan['encoders_per_job'] = encoders
+    plan['workers'] = max(1, plan['workers'] // encoders)
+    return plan
+
+def quality_settings(params):
+    """
+    获取转换参数中的速度/质量设置，没有设置时按视频比特率固定码率编码
+    
+    两遍编码的方式在这里按固定码率返回，目标画质按恒定质量返回；第一遍分析、目标大小的码率
+    和目标画质的CRF搜索由convert_video处理
+    """
+    quality = params.get('quality')
+    if quality is None:
+        quality = {'preset': 'medium', 'rate_control': 'bitrate', 'bitrate': params['bitrate']}
+    elif quality.get('rate_control') in TWO_PASS_MODES:
+        quality = dict(quality, rate_control='bitrate')
+    elif quality.get('rate_control') == 'target_quality':
+        # 目标画质搜索出的CRF由convert_video填入，其他输出方式使用界面上的CRF
+        quality = dict(quality, rate_control='crf')
+    elif quality.get('rate_control') == 'source':
+        # 保持源编码但不能只更换容器时，按界面上的CRF重新编码
+        quality = dict(quality, rate_control='crf')
+    return quality
+
+def video_encode_args(params, threads=None, quality=None):
+    """普通格式转换的视频滤镜和编码参数（不含输入、输出和音频），quality默认取自转换参数"""
+    video_codec = params['video_codec']
+    
+    # 缩放和帧率转换
+    filters = []
+    if params['resize']:
+        # yuv420p要求宽高为偶数
+        width, height = (value - value % 2 for value in params['resolution'])
+        filters.append(scale_filter(width, height, params.get('fit_mode', 'stretch'),
+                                    params.get('scale_algorithm', 'bicubic')))
+    if params['fps']:
+        filters.append(f"fps={params['fps']}")
+    
+    if video_codec != 'rawvideo':
+        filters.append('format=yuv420p')
+    args = ['-vf', ','.join(filters), '-c:v', video_codec]
+    args += encoder_quality_args(video_codec, quality or quality_settings(params))
+    if threads:
+        args += ['-threads', str(threads)]
+    return args
+
+def first_pass_stats(input_file, params, quality, duration=None, threads=None, progress_callback=None):
+    """
+    获取两遍编码的第一遍统计数据，返回统计文件前缀
+    
+    统计数据由源文件内容、滤镜、编码器和速度档位决定，与目标码率无关，按这些设置缓存；
+    同一源文件输出多个目标大小时，只有第一次需要运行分析
+    """
+    video_args = video_encode_args(params, threads, quality)
+    key = make_cache_key([file_fingerprint(input_file)], {
+        'filters': video_args[1],
+        'video_codec': params['video_codec'],
+        'preset': quality.get('preset'),
+    })
+    cache = PassLogCache(get_cache_dir("passlog"), PASS_LOG_CACHE_ENTRIES)
+    stats_prefix = cache.get(key)
+    if stats_prefix:
+        logger.info(f"使用缓存的第一遍统计数据: {input_file}")
+        return stats_prefix
+        
+    temp_dir = cache.temp_dir(key)
+    try:
+        args = ['-i', input_file, '-map', '0:v:0'] + video_args
+        args += two_pass_args(1, os.path.join(temp_dir, PassLogCache.STATS_PREFIX))
+        args += ['-an', '-f', 'null', '-']
+        run_ffmpeg(args, duration=duration, progress_callback=progress_callback)
+    except Exception:
+        cache.discard(temp_dir)
+        raise
+    return cache.commit(key, temp_dir)
+
+def supports_crf_search(codec):
+    """编码器是否有可调的恒定质量参数（CRF/CQ/qscale）"""
+    return (encoder_quality_args(codec, {'rate_control': 'crf', 'crf': CRF_SEARCH_RANGE[0]})
+            != encoder_quality_args(codec, {'rate_control': 'crf', 'crf': CRF_SEARCH_RANGE[1]}))
+
+def search_crf(input_file, params, info, progress_callback=None):
+    """
+    搜索达到目标画质的最大CRF（即码率最低的CRF）
+    
+    从视频中选取几段代表性片段，按输出的滤镜生成无损参考片段，再用候选CRF并行编码各片段，
+    以最差片段的SSIM/PSNR作为该CRF的画质，二分查找满足目标值的最大CRF。
+    结果按源文件内容和编码设置缓存；最小的CRF也达不到目标时返回最小值。
+    返回 (CRF, {候选CRF: 画质})，progress_callback接收0.0~1.0的进度
+    """
+    target_quality = params['quality']
+    metric = target_quality.get('target_metric', 'ssim')
+    target = target_quality.get('target_value', QUALITY_METRICS[0][2])
+    codec = params['video_codec']
+    quality = quality_settings(params)
+    filters = video_encode_args(params, quality=quality)[1]
+    
+    cache = JsonCache(os.path.join(get_cache_dir(), "crf_search.json"))
+    key = make_cache_key([file_fingerprint(input_file)], {
+        'filters': filters, 'video_codec': codec, 'preset': quality.get('preset'),
+        'metric': metric, 'target': target,
+    })
+    cached = cache.get(key)
+    if cached is not None:
+        logger.info(f"使用缓存的CRF搜索结果: {input_file}，CRF {cached['crf']}")
+        return cached['crf'], {int(crf): score for crf, score in cached['scores'].items()}
+        
+    samples = sample_segments(info.get('duration'))
+    # 各片段同时编码，每个编码器分到一部分核心
+    sample_threads = max(1, get_cpu_count() // len(samples))
+    work_dir = tempfile.mkdtemp(prefix="crf_search_")
+    try:
+        references = [os.path.join(work_dir, f"reference_{i}.mkv") for i in range(len(samples))]
+        
+        def make_reference(i):
+            start, length = samples[i]
+            run_ffmpeg(['-ss', f"{start:.3f}", '-t', f"{length:.3f}", '-i', input_file, '-map', '0:v:0',
+                        '-vf', filters, '-c:v', 'ffv1', references[i]])
+            
+        def encode_sample(i, crf):
+            encoded = os.path.join(work_dir, f"sample_{i}_crf{crf}.mkv")
+            candidate = dict(quality, rate_control='crf', crf=crf)
+            run_ffmpeg(['-i', references[i], '-c:v', codec] + encoder_quality_args(codec, candidate)
+                       + ['-threads', str(sample_threads), encoded])
+            try:
+                return measure_quality(encoded, references[i], metric)
+            finally:
+                os.remove(encoded)
+                
+        scores = {}
+        low, high = CRF_SEARCH_RANGE
+        steps = math.ceil(math.log2(high - low + 2))
+        best = low
+        with ThreadPoolExecutor(max_workers=len(samples)) as executor:
+            list(executor.map(make_reference, range(len(samples))))
+            while low <= high:
+                crf = (low + high) // 2
+                scores[crf] = min(executor.map(lambda i: encode_sample(i, crf), range(len(samples))))
+                if scores[crf] >= target:
+                    best = crf
+                    low = crf + 1
+                else:
+                    high = crf - 1
+                if progress_callback:
+                    progress_callback(min(len(scores) / steps, 1.0))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        
+    if not any(score >= target for score in scores.values()):
+        logger.warning(f"所有候选CRF都达不到目标{metric.upper()} {target}，使用最小值 CRF {best}")
+    cache.set(key, {'crf': best, 'scores': {str(crf): score for crf, score in scores.items()}})
+    return best, scores
+
+def resume_work_dir(input_file, output_file, params, quality):
+    """
+    可断点续转的分段转换的工作目录
+    
+    目录位于输出目录中，名称由源文件内容和转换参数决定，中断后以相同设置重新转换时找到之前完成的段
+    """
+    key = make_cache_key([file_fingerprint(input_file)], {'params': cache_params(params), 'quality': quality})
+    return os.path.join(os.path.dirname(os.path.abspath(output_file)), f"{RESUME_DIR_PREFIX}{key[:16]}")
+
+def remove_stale_resume_dirs(output_dir, keep=None):
+    """删除输出目录中长时间没有继续的断点续转工作目录（转换参数改变后不会再用到）"""
+    try:
+        names = os.listdir(output_dir)
+    except OSError:
+        return
+    now = time.time()
+    for name in names:
+        path = os.path.join(output_dir, name)
+        if not name.startswith(RESUME_DIR_PREFIX) or path == keep or not os.path.isdir(path):
+            continue
         try:
-            # 加载视频
-            video = VideoFileClip(self.input_file)
+            if now - os.path.getmtime(path) > STALE_RESUME_AGE:
+                shutil.rmtree(path, ignore_errors=True)
+                logger.info(f"删除过期的断点续转目录: {path}")
+        except OSError:
+            pass
+
+def convert_video_chunked(input_file, output_file, params, info, threads=None, workers=2, progress_callback=None,
+                          quality=None, resumable=False, metrics=None):
+    """
+    分段转换一个长视频
+    
+    在关键帧处把视频切成若干段，各段使用相同的编码参数同时编码（每段一个ffmpeg进程），
+    音频整段单独编码一次，最后以流复制方式拼接各段并合入音频。各段的帧数按输出帧率的
+    统一时间轴计算，拼接后帧数与整段编码一致；编码后检查接缝处的时间戳和音视频同步。
+    quality默认取自转换参数。视频太短无法切分时返回None。
+    
+    resumable为True时每段不超过CHECKPOINT_INTERVAL，各段编码完成后改为正式文件名并记入
+    工作目录中的日志；转换中断后以相同设置再次转换时跳过日志中已完成的段，只编码剩余部分。
+    metrics不为None时记录段数和续转时跳过的段数
+    """
+    duration = info['duration']
+    max_count = int(duration // MIN_CHUNK_DURATION)
+    count = min(workers * 2, max_count)
+    if resumable:
+        # 中断时最多重做一段
+        count = max(count, min(math.ceil(duration / CHECKPOINT_INTERVAL), max_count))
+    if count < 2:
+        return None
+        
+    # 各段的帧数按统一的帧时间轴计算，保持原帧率时也按源帧率转换为恒定帧率
+    fps = params['fps'] or info.get('fps') or 30
+    params = dict(params, fps=fps)
+    
+    journal = None
+    boundaries = None
+    if resumable:
+        work_dir = resume_work_dir(input_file, output_file, params, quality or quality_settings(params))
+        remove_stale_resume_dirs(os.path.dirname(work_dir), keep=work_dir)
+        journal = JsonCache(os.path.join(work_dir, RESUME_JOURNAL))
+        # 续转时沿用上次的分段位置，已完成的段才能直接使用
+        boundaries = journal.get('boundaries')
+    if not boundaries:
+        timing = probe_stream_timing(input_file)
+        start_time = timing['start_time'] if timing else 0.0
+        boundaries = chunk_boundaries(input_file, duration, count, start_time)
+        if len(boundaries) < 2:
+            return None
+        if journal is not None:
+            # 确定可以分段后才创建工作目录
+            os.makedirs(work_dir, exist_ok=True)
+            journal.set('boundaries', [list(boundary) for boundary in boundaries])
             
-            # 发送25%进度信号
-            self.progress_updated.emit(25)
+    if not resumable:
+        # 中间文件写在输出目录中，拼接时不需要跨磁盘复制
+        work_dir = tempfile.mkdtemp(prefix=".chunks_", dir=os.path.dirname(os.path.abspath(output_file)))
+    succeeded = False
+    try:
+        video_args = video_encode_args(params, threads, quality)
+        tasks = []
+        chunk_files = []
+        expected_durations = []
+        for i, (start, end) in enumerate(boundaries):
+            chunk_file = os.path.join(work_dir, f"chunk_{i:04d}.mkv")
+            # 最后一段编码到结尾，其余各段的帧数由统一的帧时间轴决定
+            last = i == len(boundaries) - 1
+            frames = None if last else round(end * fps) - round(start * fps)
+            args = ['-ss', f"{max(start - 0.0005, 0):.4f}"]
+            if not last:
+                args += ['-t', f"{end - start + 1.0:.4f}"]
+            args += ['-i', input_file, '-map', '0:v:0'] + video_args
+            if frames is not None:
+                args += ['-frames:v', str(frames)]
+            tasks.append((args, end - start, chunk_file))
+            chunk_files.append(chunk_file)
+            expected_durations.append(frames / fps if frames is not None else None)
             
-            # 调整分辨率
-            if self.params['resize']:
-                width, height = self.params['resolution']
-                video = video.resize(width=width, height=height)
+        audio_file = None
+        if info.get('audio_codec'):
+            # 音频整段编码（能直接复制时复制），避免分段编码在接缝处产生的编码器延迟和静音
+            audio_file = os.path.join(work_dir, "audio.mka")
+            container = os.path.splitext(output_file)[1].lower()[1:]
+            tasks.append((['-i', input_file, '-map', '0:a:0', '-vn']
+                          + audio_codec_args(info, params['audio_codec'], params['audio_bitrate'], container),
+                          duration, audio_file))
             
-            # 发送50%进度信号
-            self.progress_updated.emit(50)
+        def completed(task_file):
+            """日志中记录已完成且文件大小一致的段"""
+            if journal is None:
+                return False
+            entry = journal.get(os.path.basename(task_file))
+            try:
+                return entry is not None and os.path.getsize(task_file) == entry['size']
+            except OSError:
+                return False
+                
+        # 按各任务的时长汇总进度，拼接占最后的5%；续转时已完成的段直接计入进度
+        total = sum(task_duration for _, task_duration, _ in tasks)
+        done = [task_duration if completed(task_file) else 0.0 for _, task_duration, task_file in tasks]
+        skipped = sum(1 for value in done if value)
+        if skipped:
+            logger.info(f"继续未完成的分段转换: {output_file}，已完成 {skipped}/{len(tasks)} 项")
+            if progress_callback:
+                progress_callback(int(sum(done) / total * 95))
+        if metrics is not None:
+            metrics['chunks'] = len(chunk_files)
+            metrics['resumed_chunks'] = skipped
+        lock = threading.Lock()
+        
+        def run_task(index):
+            args, task_duration, task_file = tasks[index]
+            if done[index]:
+                return
+                
+            def on_progress(value):
+                if progress_callback is None:
+                    return
+                with lock:
+                    done[index] = value * task_duration
+                    progress_callback(int(sum(done) / total * 95))
+                    
+            if journal is None:
+                run_ffmpeg(args + [task_file], duration=task_duration, progress_callback=on_progress)
+                return
+            # 先写入临时文件，编码完成后再改为正式文件名并记入日志，中断时不会留下不完整的段
+            stem, ext = os.path.splitext(task_file)
+            part_file = f"{stem}.part{ext}"
+            run_ffmpeg(args + [part_file], duration=task_duration, progress_callback=on_progress)
+            os.replace(part_file, task_file)
+            journal.set(os.path.basename(task_file), {'size': os.path.getsize(task_file)})
+            
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(run_task, range(len(tasks))))
+            
+        seams = check_chunk_seams(chunk_files, expected_durations, fps)
+        
+        concat_copy(chunk_files, output_file, work_dir, audio_file=audio_file)
+        
+        if seams is not None:
+            sync = check_av_sync(output_file, sum(chunk_duration for _, chunk_duration in seams), fps)
+            logger.info(f"分段编码完成: {output_file}，{len(chunk_files)} 段，接缝检查: {seams}，音视频同步: {sync}")
+        succeeded = True
+    finally:
+        # 可续转的工作目录在失败或中断时保留，下次转换时继续
+        if succeeded or not resumable:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        
+    if progress_callback:
+        progress_callback(100)
+    return output_file
+
+def cache_params(params):
+    """
+    规范化转换参数，用于计算结果缓存的键
+    
+    去掉只影响执行方式的参数和当前输出格式用不到的参数，使无关设置的改动不影响缓存命中；
+    码率阶梯和流媒体打包有多个输出文件，不使用结果缓存（返回None）
+    """
+    output_format = params.get('format')
+    if params.get('ladder') or output_format in PACKAGE_MANIFESTS:
+        return None
+    if output_format in ANIMATION_CODECS:
+        return {'format': output_format, 'animation': params.get('animation')}
+    result = {key: value for key, value in params.items()
+              if key not in EXECUTION_PARAMS + ('animation', 'package', 'ladder')}
+    if not params['resize']:
+        for key in ('resolution', 'scale_algorithm', 'fit_mode'):
+            result.pop(key, None)
+    return result
+
+def convert_video_cached(input_file, output_file, params, result_cache=None, metrics=None, **kwargs):
+    """
+    使用结果缓存转换一个视频文件
+    
+    相同内容的源文件已经按相同参数转换过时直接取出缓存的结果（转换方式记为METHOD_CACHED），
+    否则调用convert_video转换并把结果加入缓存。result_cache为None时不使用缓存，其余参数同convert_video
+    """
+    operation_params = cache_params(params) if result_cache is not None else None
+    key = None
+    if operation_params is not None:
+        key = result_cache.make_key('convert', [input_file], operation_params)
+        if result_cache.fetch(key, output_file):
+            logger.info(f"使用缓存的转换结果: {output_file}")
+            if metrics is not None:
+                metrics['method'] = METHOD_CACHED
+            if kwargs.get('progress_callback'):
+                kwargs['progress_callback'](100)
+            return output_file
+            
+    if result_cache is not None:
+        # 旧的输出文件是缓存结果的硬链接时先删除，避免覆盖写入时改掉缓存
+        result_cache.release_output(output_file)
+    convert_video(input_file, output_file, params, metrics=metrics, **kwargs)
+    if key is not None:
+        try:
+            result_cache.store(key, output_file, 'convert', [input_file], operation_params)
+        except OSError as e:
+            logger.warning(f"保存转换结果到缓存失败: {str(e)}")
+    return output_file
+
+def remux_video(input_file, output_file, info, progress_callback=None):
+    """以流复制方式把视频和音频写入新的容器"""
+    args = ['-i', input_file, '-map', '0:v:0', '-map', '0:a:0?', '-c', 'copy']
+    if os.path.splitext(output_file)[1].lower() in ('.mp4', '.mov'):
+        args += ['-movflags', '+faststart']
+    args += [output_file]
+    run_ffmpeg(args, duration=info.get('duration'), progress_callback=progress_callback)
+    return output_file
+
+def convert_video(input_file, output_file, params, threads=None, progress_callback=None, chunk_workers=1,
+                  metrics=None):
+    """
+    按转换参数转换一个视频文件，threads为编码线程数，progress_callback接收0-100的进度
+    
+    解码、缩放和编码都在同一个ffmpeg进程中完成，视频帧不经过Python；
+    chunk_workers大于1且启用了分段并行编码时，长视频切成多段同时编码；启用了断点续转时，
+    长视频分段编码并记录进度，中断后再次转换时从未完成的段继续。
+    只需更换容器时直接复制音视频流（参数force_reencode为True时总是重新编码）；
+    metrics不为None时在其中记录转换方式（METHOD_REMUX或METHOD_ENCODE）
+    """
+    if metrics is not None:
+        metrics['method'] = METHOD_ENCODE
+    callback = (lambda p: progress_callback(int(p * 100))) if progress_callback else None
+    if os.path.splitext(output_file)[1].lower()[1:] in ANIMATION_CODECS:
+        # 动图使用调色板导出
+        animation = params.get('animation', {})
+        export_animation(input_file, output_file, threads=threads, progress_callback=callback, **animation)
+        if progress_callback:
+            progress_callback(100)
+        return output_file
+        
+    package_format = package_format_of(output_file)
+    if package_format:
+        # 编码结果直接写成HLS/DASH分片；未设置码率阶梯时只输出一档
+        ladder = params.get('ladder')
+        if not ladder:
+            if params['resize']:
+                width, height = params['resolution']
+            else:
+                info = probe_media(input_file)
+                width, height = info['width'], info['height']
+            ladder = [{'name': f"{height}p", 'width': width, 'height': height,
+                       'bitrate': None, 'audio_bitrate': params['audio_bitrate']}]
+        package = params.get('package', {})
+        package_stream(input_file, output_file, ladder, package_format,
+                       package.get('segment_type', 'mpegts'), package.get('segment_duration', 6),
+                       params['video_codec'], params['audio_codec'], params['fps'], quality_settings(params),
+                       params.get('fit_mode') or 'pad', params.get('scale_algorithm', 'bicubic'),
+                       threads=threads, progress_callback=callback)
+        if progress_callback:
+            progress_callback(100)
+        return output_file
+        
+    if params.get('ladder'):
+        # 一次解码，同时输出多档码率
+        ladder = params['ladder']
+        encode_ladder(input_file, [ladder_output_path(output_file, rendition) for rendition in ladder], ladder,
+                      params['video_codec'], params['audio_codec'], params['fps'], quality_settings(params),
+                      params.get('fit_mode') or 'pad', params.get('scale_algorithm', 'bicubic'),
+                      threads=threads, progress_callback=callback)
+        if progress_callback:
+            progress_callback(100)
+        return output_file
+        
+    info = probe_media(input_file)
+    if can_remux(info, input_file, output_file, params):
+        remux_video(input_file, output_file, info, callback)
+        if metrics is not None:
+            metrics['method'] = METHOD_REMUX
+        if progress_callback:
+            progress_callback(100)
+        return output_file
+        
+    video_codec = params['video_codec']
+    quality = quality_settings(params)
+    rate_control = (params.get('quality') or {}).get('rate_control')
+    encode_progress = progress_callback
+    if rate_control == 'target_quality':
+        if supports_crf_search(video_codec):
+            # CRF搜索占进度的前20%
+            search_progress = (lambda p: progress_callback(int(p * 20))) if progress_callback else None
+            quality['crf'], scores = search_crf(input_file, params, info, search_progress)
+            logger.info(f"目标画质搜索结果: {input_file}，CRF {quality['crf']}，各候选画质: {scores}")
+            if progress_callback:
+                callback = lambda p: progress_callback(20 + int(p * 80))
+                encode_progress = lambda value: progress_callback(20 + value * 80 // 100)
+        else:
+            logger.warning(f"{video_codec} 没有恒定质量参数，按码率 {quality['bitrate']} 编码")
+            quality['rate_control'] = 'bitrate'
+            
+    parallel = supports_chunking(params) and chunk_workers > 1
+    resumable = supports_resume(params) and (info.get('duration') or 0) >= RESUME_MIN_DURATION
+    if (parallel or resumable) and info.get('duration'):
+        if convert_video_chunked(input_file, output_file, params, info, threads, chunk_workers if parallel else 1,
+                                 encode_progress, quality, resumable, metrics):
+            return output_file
+    if supports_chunking(params):
+        # 勾选了分段并行编码但整段编码，记录原因并在转换结束时提示
+        reason = "视频太短" if parallel else "只能同时运行一个编码进程"
+        logger.warning(f"未分段并行编码（{reason}）: {input_file}")
+        if metrics is not None:
+            metrics['chunk_skipped'] = reason
             
-            # 写入输出文件
-            video.write_videofile(
-                self.output_file, 
-                codec=self.params['video_codec'],
-                audio_codec=self.params['audio_codec'],
-                fps=self.params['fps'],
-                bitrate=self.params['bitrate'],
-                audio_bitrate=self.params['audio_bitrate'],
-                temp_audiofile=os.path.join(tempfile.gettempdir(), "temp-audio.m4a"),
-                remove_temp=True,
-                threads=2,
-                logger=None
-            )
+    pass_args = []
+    if rate_control == 'target_size':
+        # 按目标文件大小和时长计算码率
+        audio_bitrate = params['audio_bitrate'] if info.get('audio_codec') else None
+        quality['bitrate'] = str(target_video_bitrate(params['quality']['target_size'] * 1024 ** 2,
+                                                      info.get('duration'), audio_bitrate))
+    if rate_control in TWO_PASS_MODES:
+        if video_codec in TWO_PASS_CODECS:
+            # 第一遍占进度的前一半（使用缓存时跳过）
+            first_pass = (lambda p: progress_callback(int(p * 50))) if progress_callback else None
+            stats_prefix = first_pass_stats(input_file, params, quality, info.get('duration'), threads, first_pass)
+            pass_args = two_pass_args(2, stats_prefix)
+            if progress_callback:
+                progress_callback(50)
+                callback = lambda p: progress_callback(50 + int(p * 50))
+        else:
+            logger.warning(f"{video_codec} 不支持两遍编码，按码率 {quality['bitrate']} 单遍编码")
+            
+    args = ['-i', input_file, '-map', '0:v:0'] + video_encode_args(params, threads, quality) + pass_args
+    if info.get('audio_codec'):
+        # 源音频符合要求时直接复制，不重新编码
+        container = os.path.splitext(output_file)[1].lower()[1:]
+        args += ['-map', '0:a:0'] + audio_codec_args(info, params['audio_codec'], params['audio_bitrate'], container)
+    if os.path.splitext(output_file)[1].lower() in ('.mp4', '.mov'):
+        args += ['-movflags', '+faststart']
+    args += [output_file]
+    
+    run_ffmpeg(args, duration=info.get('duration'), progress_callback=callback)
+    
+    if progress_callback:
+        progress_callback(100)
+    return output_file
+
+def supports_estimate(params):
+    """普通格式转换才能预估大小和耗时（动图、码率阶梯和流媒体打包的编码方式不同）"""
+    output_format = params.get('format')
+    return (not params.get('ladder') and output_format not in ANIMATION_CODECS
+            and output_format not in PACKAGE_MANIFESTS)
+
+def output_geometry(info, params):
+    """转换后的 (宽, 高, 帧率)，保持原分辨率或原帧率时取自源视频"""
+    if params['resize']:
+        width, height = params['resolution']
+    else:
+        width, height = info.get('width'), info.get('height')
+    return width, height, params['fps'] or info.get('fps') or 30
+
+def record_encode_speed(input_file, output_file, params, threads, elapsed):
+    """
+    记录一次重新编码的速度和码率，用于预估以后转换的耗时和大小
+    
+    只记录单遍编码整个文件的任务；两遍编码和目标画质的耗时包含分析和搜索，不记录
+    """
+    rate_control = (params.get('quality') or {}).get('rate_control')
+    if not supports_estimate(params) or rate_control in TWO_PASS_MODES + ('target_quality',):
+        return
+    try:
+        info = probe_media(input_file)
+        width, height, fps = output_geometry(info, params)
+        container = os.path.splitext(output_file)[1].lower()[1:]
+        copy_audio = can_copy_audio(info, params['audio_codec'], container, params['audio_bitrate'])
+        video_bytes = os.path.getsize(output_file) - audio_bytes(info, params['audio_bitrate'], copy_audio)
+        EncodeHistory().record(encode_signature(params['video_codec'], quality_settings(params), height, threads),
+                               output_pixels(width, height, fps, info.get('duration')), elapsed, video_bytes)
+    except Exception as e:
+        logger.warning(f"记录编码速度失败: {input_file}: {str(e)}")
+
+def estimate_conversion(input_files, params):
+    """
+    预估转换全部文件的输出大小和耗时，返回estimate_utils.new_estimate()格式的字典
+    
+    只更换容器的文件按源文件大小和磁盘速度估计；重新编码的文件按本机相同编码设置的历史速度估计耗时
+    （没有历史记录时使用样本编码的速度），按码率和目标大小编码时由码率直接计算大小，恒定质量和目标画质
+    按样本编码的每像素比特数估计大小。动图、码率阶梯和流媒体打包不做预估
+    """
+    estimate = new_estimate()
+    if not supports_estimate(params):
+        estimate['size'] = estimate['time'] = None
+        estimate['notes'].append("动图、码率阶梯和流媒体打包暂不支持预估")
+        return estimate
+        
+    container = params['format']
+    jobs = []
+    for input_file in input_files:
+        info = probe_media(input_file)
+        if can_remux(info, input_file, f"output.{container}", params):
+            size = os.path.getsize(input_file)
+            estimate['size'] += size
+            estimate['time'] += size / COPY_BYTES_PER_SECOND
+            add_basis(estimate, "源文件大小")
+        else:
+            jobs.append((input_file, info))
+    if not jobs:
+        return estimate
+        
+    plan = plan_conversion([input_file for input_file, _ in jobs], params)
+    codec = params['video_codec']
+    quality = quality_settings(params)
+    rate_control = (params.get('quality') or {}).get('rate_control')
+    history = EncodeHistory()
+    signatures = [encode_signature(codec, quality, output_geometry(info, params)[1], plan['threads'])
+                  for _, info in jobs]
+    
+    # 恒定质量的大小取决于内容，总是编码样本；按码率编码且有历史速度时不需要样本
+    sample = None
+    if quality['rate_control'] == 'crf' or any(history.get(signature) is None for signature in signatures):
+        input_file, info = max(jobs, key=lambda job: job[1].get('duration') or 0)
+        width, height, fps = output_geometry(info, params)
+        sample = sample_encode(input_file, video_encode_args(params, plan['threads'], quality),
+                               info.get('duration'), width, height, fps)
+        
+    encode_time = 0.0
+    for (input_file, info), signature in zip(jobs, signatures):
+        width, height, fps = output_geometry(info, params)
+        duration = info.get('duration') or 0
+        pixels = output_pixels(width, height, fps, duration)
+        pixels_per_second, bits_per_pixel, basis = encode_rates(history.get(signature), sample)
+        add_basis(estimate, *basis)
+        
+        # 大小
+        copy_audio = can_copy_audio(info, params['audio_codec'], container, params['audio_bitrate'])
+        if estimate['size'] is not None:
+            if rate_control == 'target_size':
+                estimate['size'] += params['quality']['target_size'] * 1024 ** 2
+            elif quality['rate_control'] == 'bitrate':
+                estimate['size'] += with_overhead(bitrate_value(quality['bitrate']) * duration / 8
+                                                  + audio_bytes(info, params['audio_bitrate'], copy_audio))
+            elif bits_per_pixel is not None:
+                estimate['size'] += with_overhead(bits_per_pixel * pixels
+                                                  + audio_bytes(info, params['audio_bitrate'], copy_audio))
+            else:
+                estimate['size'] = None
+                
+        # 耗时（两遍编码加上第一遍，目标画质加上CRF搜索中各候选CRF对样本片段的编码）
+        if rate_control in TWO_PASS_MODES and codec in TWO_PASS_CODECS:
+            pixels *= 1 + FIRST_PASS_COST
+        elif rate_control == 'target_quality' and supports_crf_search(codec):
+            steps = math.ceil(math.log2(CRF_SEARCH_RANGE[1] - CRF_SEARCH_RANGE[0] + 2))
+            sample_seconds = sum(length for _, length in sample_segments(duration))
+            pixels += output_pixels(width, height, fps, sample_seconds * (steps + 1))
+        if pixels_per_second is None:
+            encode_time = None
+        elif encode_time is not None:
+            encode_time += pixels / pixels_per_second
             
-            # 发送100%进度信号
-            self.progress_updated.emit(100)
+    if rate_control == 'target_quality':
+        estimate['notes'].append("目标画质的输出大小按界面上的CRF估计")
+    if encode_time is None:
+        estimate['time'] = None
+    else:
+        # 同时编码的任务数：同时转换的文件数 × 每个文件同时编码的段数
+        estimate['time'] += encode_time / (plan['workers'] * plan.get('chunk_workers', 1))
+    return estimate
+
+class BatchConvertThread(QThread):
+    """
+    批量转换线程
+    
+    所有任务使用同一组转换参数，每个任务的编码线程数和同时运行的任务数由plan_encoding
+    根据CPU核心数、输出分辨率、编码器和可用内存规划；失败的任务自动重试max_retries次
+    """
+    item_status = pyqtSignal(int, str, str)  # 行号, 状态, 错误信息
+    item_progress = pyqtSignal(int, int)
+    item_method = pyqtSignal(int, str)  # 行号, 转换方式（重新封装/重新编码）
+    batch_finished = pyqtSignal(int, int)  # 成功数, 失败数
+    
+    def __init__(self, jobs, params, max_retries=1):
+        super().__init__()
+        # 任务列表 [(行号, 输入文件, 输出文件)]
+        self.jobs = jobs
+        self.params = params
+        self.max_retries = max_retries
+        self._stopped = threading.Event()
+        # 任务指标：编码线程规划以及每个文件的耗时和尝试次数
+        self.metrics = {'plan': None, 'jobs': {}}
+        self.threads = None
+        self.chunk_workers = 1
+        # 结果缓存：相同的源文件和转换参数直接使用之前的结果
+        self.result_cache = None
+        
+    def stop(self):
+        """停止批量转换：正在转换的文件会完成，尚未开始的文件保持等待状态"""
+        self._stopped.set()
+        
+    def convert_job(self, job):
+        row, input_file, output_file = job
+        if self._stopped.is_set():
+            self.item_status.emit(row, STATUS_WAITING, "")
+            return None
             
-            # 发送完成信号
-            self.process_finished.emit(self.output_file)
+        error = ""
+        start = time.monotonic()
+        job_metrics = {'input': input_file, 'threads': self.threads, 'attempts': 0}
+        self.metrics['jobs'][row] = job_metrics
+        for attempt in range(self.max_retries + 1):
+            self.item_status.emit(row, STATUS_RUNNING, "")
+            job_metrics['attempts'] = attempt + 1
+            attempt_start = time.monotonic()
+            try:
+                convert_video_cached(input_file, output_file, self.params, self.result_cache, job_metrics,
+                                     threads=self.threads, chunk_workers=self.chunk_workers,
+                                     progress_callback=lambda value: self.item_progress.emit(row, value))
+                job_metrics['elapsed'] = time.monotonic() - start
+                if (job_metrics['method'] == METHOD_ENCODE and self.chunk_workers <= 1
+                        and not job_metrics.get('resumed_chunks')):
+                    # 记录本机的编码速度，用于以后的预估（分段并行编码的速度与单个编码器不同、
+                    # 续转的耗时不包含之前完成的段，都不记录）
+                    record_encode_speed(input_file, output_file, self.params, self.threads,
+                                        time.monotonic() - attempt_start)
+                self.item_method.emit(row, job_metrics['method'])
+                self.item_status.emit(row, STATUS_DONE, "")
+                return True
+            except Exception as e:
+                error = str(e)
+                logger.warning(f"转换失败（第{attempt + 1}次）: {input_file}: {error}")
+                # 删除写了一半的输出文件
+                remove_output(output_file, self.params)
+                if self._stopped.is_set():
+                    break
+                    
+        job_metrics['elapsed'] = time.monotonic() - start
+        self.item_status.emit(row, STATUS_FAILED, error)
+        return False
+        
+    def run(self):
+        if not self.jobs:
+            self.batch_finished.emit(0, 0)
+            return
             
-        except Exception as e:
-            # 发送错误信号
-            self.error_occurred.emit(str(e))
+        plan = plan_conversion([job[1] for job in self.jobs], self.params)
+        self.metrics['plan'] = plan
+        self.threads = plan['threads']
+        self.chunk_workers = plan.get('chunk_workers', 1)
+        self.result_cache = ResultCache()
+        logger.info(f"批量转换 {len(self.jobs)} 个文件，同时转换 {plan['workers']} 个，"
+                    f"每个文件 {plan['threads']} 个编码线程，规划依据: {plan}")
+        
+        with ThreadPoolExecutor(max_workers=plan['workers']) as executor:
+            results = list(executor.map(self.convert_job, self.jobs))
+        logger.info(f"批量转换结束，任务指标: {self.metrics}")
+        self.batch_finished.emit(results.count(True), results.count(False))
+
+class ConvertItem:
+    """转换队列中的一项"""
+    __slots__ = ('path', 'name', 'status', 'progress', 'output', 'error', 'method')
+    
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.status = STATUS_WAITING
+        self.progress = 0
+        self.output = None
+        self.error = ""
+        self.method = None
+
+class ConvertQueueModel(QAbstractTableModel):
+    """转换队列的数据模型"""
+    HEADERS = ["视频文件", "状态", "进度", "输出文件"]
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._items = []
+        self._paths = set()
+        
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._items)
+        
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+        
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+        
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        item = self._items[index.row()]
+        col = index.column()
+        
+        if role == Qt.DisplayRole:
+            if col == 0:
+                return item.name
+            if col == 1:
+                if item.status == STATUS_DONE and item.method:
+                    return f"{STATUS_LABELS[item.status]}（{METHOD_LABELS[item.method]}）"
+                return STATUS_LABELS[item.status]
+            if col == 2:
+                return f"{item.progress}%"
+            if col == 3:
+                return os.path.basename(item.output) if item.output else ""
+        if role == Qt.ToolTipRole:
+            if col == 0:
+                return item.path
+            if col == 1 and item.error:
+                return item.error
+            if col == 3:
+                return item.output
+        if role == Qt.ForegroundRole and col == 1:
+            if item.status == STATUS_FAILED:
+                return QColor("#f38ba8")
+            if item.status == STATUS_DONE:
+                return QColor("#a6e3a1")
+        return None
+        
+    def add_files(self, paths):
+        """添加文件（跳过已在队列中的文件），返回实际添加的数量"""
+        new_paths = []
+        for path in paths:
+            if path not in self._paths:
+                self._paths.add(path)
+                new_paths.append(path)
+        if new_paths:
+            start = len(self._items)
+            self.beginInsertRows(QModelIndex(), start, start + len(new_paths) - 1)
+            self._items.extend(ConvertItem(path) for path in new_paths)
+            self.endInsertRows()
+        return len(new_paths)
+        
+    def remove_rows(self, rows):
+        """删除指定的行，连续的行一次性删除"""
+        for first, last in row_ranges(rows):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            for item in self._items[first:last + 1]:
+                self._paths.discard(item.path)
+            del self._items[first:last + 1]
+            self.endRemoveRows()
+            
+    def clear(self):
+        self.beginResetModel()
+        self._items = []
+        self._paths = set()
+        self.endResetModel()
+        
+    def item(self, row):
+        return self._items[row]
+        
+    def rows_with_status(self, *statuses):
+        return [row for row, item in enumerate(self._items) if item.status in statuses]
+        
+    def set_status(self, row, status, error=""):
+        item = self._items[row]
+        item.status = status
+        item.error = error
+        if status == STATUS_WAITING:
+            item.progress = 0
+            item.method = None
+        self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.HEADERS) - 1))
+        
+    def set_progress(self, row, value):
+        self._items[row].progress = value
+        index = self.index(row, 2)
+        self.dataChanged.emit(index, index)
+        
+    def set_method(self, row, method):
+        self._items[row].method = method
+        index = self.index(row, 1)
+        self.dataChanged.emit(index, index)
+        
+    def set_output(self, row, output_file):
+        self._items[row].output = output_file
+        index = self.index(row, 3)
+        self.dataChanged.emit(index, index)
 
 class VideoDropArea(QFrame):
-    video_dropped = pyqtSignal(str)
+    videos_dropped = pyqtSignal(list)
     
     def __init__(self):
         super().__init__()
@@ -91,7 +1070,7 @@ class VideoDropArea(QFrame):
         layout.setContentsMargins(10, 5, 10, 5)
         
         # 添加提示标签
-        self.label = QLabel("拖放视频文件到此处")
+        self.label = QLabel("拖放视频文件或文件夹到此处")
         self.label.setAlignment(Qt.AlignCenter)
         self.label.setStyleSheet("border: none; font-size: 14px; color: #cdd6f4;")
         layout.addWidget(self.label)
@@ -118,13 +1097,11 @@ class VideoDropArea(QFrame):
         
     def dropEvent(self, event):
         if event.mimeData().hasUrls():
-            url = event.mimeData().urls()[0]
-            file_path = url.toLocalFile()
-            
-            # 检查是否为视频文件
-            video_extensions = ['.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv']
-            if any(file_path.lower().endswith(ext) for ext in video_extensions):
-                self.video_dropped.emit(file_path)
+            # 文件夹交给扫描线程展开，文件只保留视频文件
+            paths = [url.toLocalFile() for url in event.mimeData().urls()]
+            paths = [path for path in paths if os.path.isdir(path) or is_video_file(path)]
+            if paths:
+                self.videos_dropped.emit(paths)
             else:
                 QMessageBox.warning(self, "文件类型错误", "请拖放视频文件")
                 
@@ -142,6 +1119,12 @@ class VideoConvertTab(QWidget):
         
         logger.info("初始化VideoConvertTab")
         
+        # 初始化变量
+        self.queue_model = ConvertQueueModel(self)
+        self.convert_thread = None
+        self.estimate_thread = None
+        self.scan_threads = []
+        
         # 创建布局
         self.main_layout = QVBoxLayout(self)
         
@@ -154,15 +1137,11 @@ class VideoConvertTab(QWidget):
         # 创建转换按钮和进度条
         self.create_convert_controls()
         
-        # 初始化变量
-        self.input_file = None
-        self.convert_thread = None
-        
         logger.info("VideoConvertTab初始化完成")
     
     def create_file_selection_area(self):
         # 创建文件选择组
-        file_group = QGroupBox("文件选择")
+        file_group = QGroupBox("转换队列")
         file_layout = QVBoxLayout(file_group)
         
         # 创建文件选择按钮
@@ -173,28 +1152,57 @@ class VideoConvertTab(QWidget):
         self.add_file_button.clicked.connect(self.add_video_file)
         file_button_layout.addWidget(self.add_file_button)
         
+        self.add_folder_button = QPushButton("添加文件夹")
+        self.add_folder_button.setIcon(self.style().standardIcon(QStyle.SP_DirOpenIcon))
+        self.add_folder_button.clicked.connect(self.add_video_folder)
+        file_button_layout.addWidget(self.add_folder_button)
+        
+        self.remove_button = QPushButton("移除选中")
+        self.remove_button.setIcon(self.style().standardIcon(QStyle.SP_TrashIcon))
+        self.remove_button.clicked.connect(self.remove_selected)
+        file_button_layout.addWidget(self.remove_button)
+        
+        self.clear_button = QPushButton("清空列表")
+        self.clear_button.clicked.connect(self.clear_queue)
+        file_button_layout.addWidget(self.clear_button)
+        
         file_button_layout.addStretch()
         file_layout.addLayout(file_button_layout)
         
-        # 创建文件信息标签
-        self.file_info_label = QLabel("未选择文件")
-        self.file_info_label.setAlignment(Qt.AlignCenter)
-        self.file_info_label.setStyleSheet("padding: 10px; background-color: #313244; border-radius: 4px;")
-        file_layout.addWidget(self.file_info_label)
+        # 拖放区域
+        self.drop_area = VideoDropArea()
+        self.drop_area.videos_dropped.connect(self.add_paths)
+        file_layout.addWidget(self.drop_area)
+        
+        # 转换队列
+        self.queue_view = QTableView()
+        self.queue_view.setModel(self.queue_model)
+        self.queue_view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.queue_view.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.queue_view.verticalHeader().setVisible(False)
+        self.queue_view.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.queue_view.horizontalHeader().setSectionResizeMode(3, QHeaderView.Stretch)
+        self.queue_view.setMinimumHeight(180)
+        file_layout.addWidget(self.queue_view)
         
         # 添加到主布局
         self.main_layout.addWidget(file_group)
     
     def create_conversion_params_area(self):
+        # 创建格式选择下拉框（应用于队列中的所有文件）
+        format_layout = QHBoxLayout()
+        format_layout.addWidget(QLabel("输出格式:"))
+        self.format_combo = QComboBox()
+        self.format_combo.addItems(["MP4", "AVI", "MKV", "MOV", "WMV", "GIF", "WEBP", "HLS", "DASH"])
+        self.format_combo.currentTextChanged.connect(self.update_format_inputs)
+        format_layout.addWidget(self.format_combo)
+        format_layout.addStretch()
+        self.main_layout.addLayout(format_layout)
+        
         # 创建转换参数组
-        params_group = QGroupBox("转换参数")
+        params_group = QGroupBox("转换参数（应用于队列中的所有文件）")
         params_layout = QFormLayout(params_group)
         
-        # 创建格式选择下拉框
-        self.format_combo = QComboBox()
-        self.format_combo.addItems(["MP4", "AVI", "MKV", "MOV", "WMV", "GIF"])
-        params_layout.addRow("输出格式:", self.format_combo)
-        
         # 创建视频编码选择下拉框
         self.video_codec_combo = QComboBox()
         self.video_codec_combo.addItems(["libx264", "mpeg4", "libxvid", "rawvideo"])
@@ -205,16 +1213,74 @@ class VideoConvertTab(QWidget):
         self.audio_codec_combo.addItems(["aac", "mp3", "libvorbis"])
         params_layout.addRow("音频编码:", self.audio_codec_combo)
         
+        # 速度/质量方案，选择方案后自动填写下面的编码速度和质量
+        self.quality_profile_combo = QComboBox()
+        for name, label in QUALITY_PROFILE_LABELS:
+            self.quality_profile_combo.addItem(label, name)
+        self.quality_profile_combo.addItem("自定义", CUSTOM_QUALITY)
+        params_layout.addRow("质量方案:", self.quality_profile_combo)
+        
+        # 编码速度（越慢压缩率越高）
+        self.preset_combo = QComboBox()
+        self.preset_combo.addItems(ENCODER_PRESETS)
+        params_layout.addRow("编码速度:", self.preset_combo)
+        
+        # 码率控制方式
+        self.rate_control_combo = QComboBox()
+        self.rate_control_combo.addItem("恒定质量 (CRF/CQ)", 'crf')
+        self.rate_control_combo.addItem("固定码率", 'bitrate')
+        self.rate_control_combo.addItem("两遍编码（固定码率）", 'two_pass')
+        self.rate_control_combo.addItem("目标文件大小（两遍编码）", 'target_size')
+        self.rate_control_combo.addItem("目标画质（自动搜索CRF）", 'target_quality')
+        self.rate_control_combo.addItem("保持源编码（只更换容器，不能时按CRF编码）", 'source')
+        params_layout.addRow("码率控制:", self.rate_control_combo)
+        
+        # 恒定质量数值（按x264刻度，越小质量越高）
+        self.crf_spinbox = QSpinBox()
+        self.crf_spinbox.setRange(0, 51)
+        self.crf_spinbox.setValue(23)
+        params_layout.addRow("质量 (CRF):", self.crf_spinbox)
+        
         # 创建帧率输入框
         self.fps_spinbox = QSpinBox()
-        self.fps_spinbox.setRange(1, 120)
-        self.fps_spinbox.setValue(30)
+        self.fps_spinbox.setRange(0, 120)
+        self.fps_spinbox.setSpecialValueText("保持原帧率")
+        self.fps_spinbox.setValue(0)
         params_layout.addRow("帧率 (FPS):", self.fps_spinbox)
         
-        # 创建视频比特率输入框
+        # 创建视频比特率输入框（固定码率时使用）
         self.bitrate_edit = QLineEdit("5000k")
         params_layout.addRow("视频比特率:", self.bitrate_edit)
         
+        # 目标文件大小（按时长换算为码率）
+        self.target_size_spinbox = QDoubleSpinBox()
+        self.target_size_spinbox.setRange(1, 100000)
+        self.target_size_spinbox.setDecimals(1)
+        self.target_size_spinbox.setValue(50)
+        self.target_size_spinbox.setSuffix(" MB")
+        params_layout.addRow("目标大小:", self.target_size_spinbox)
+        
+        # 目标画质（编码样本片段后测量，自动选择达到该值的最大CRF）
+        target_quality_layout = QHBoxLayout()
+        self.target_metric_combo = QComboBox()
+        for label, metric, _ in QUALITY_METRICS:
+            self.target_metric_combo.addItem(label, metric)
+        self.target_metric_combo.currentIndexChanged.connect(self.on_target_metric_changed)
+        target_quality_layout.addWidget(self.target_metric_combo)
+        self.target_value_spinbox = QDoubleSpinBox()
+        target_quality_layout.addWidget(self.target_value_spinbox)
+        target_quality_layout.addStretch()
+        params_layout.addRow("目标画质:", target_quality_layout)
+        self.on_target_metric_changed()
+        
+        self.quality_profile_combo.currentIndexChanged.connect(self.apply_quality_profile)
+        self.preset_combo.currentIndexChanged.connect(self.on_quality_edited)
+        self.rate_control_combo.currentIndexChanged.connect(self.on_quality_edited)
+        self.crf_spinbox.valueChanged.connect(self.on_quality_edited)
+        self._applying_profile = False
+        self.quality_profile_combo.setCurrentIndex(self.quality_profile_combo.findData(DEFAULT_QUALITY_PROFILE))
+        self.apply_quality_profile()
+        
         # 创建音频比特率输入框
         self.audio_bitrate_edit = QLineEdit("192k")
         params_layout.addRow("音频比特率:", self.audio_bitrate_edit)
@@ -244,146 +1310,533 @@ class VideoConvertTab(QWidget):
         
         params_layout.addRow("分辨率:", resolution_layout)
         
+        # 缩放算法和宽高比处理方式
+        scale_layout = QHBoxLayout()
+        self.scale_algorithm_combo = QComboBox()
+        for label, algorithm in SCALE_ALGORITHMS:
+            self.scale_algorithm_combo.addItem(label, algorithm)
+        self.scale_algorithm_combo.setEnabled(False)
+        scale_layout.addWidget(self.scale_algorithm_combo)
+        self.fit_mode_combo = QComboBox()
+        for label, fit_mode in SCALE_FIT_MODES:
+            self.fit_mode_combo.addItem(label, fit_mode)
+        self.fit_mode_combo.setEnabled(False)
+        scale_layout.addWidget(self.fit_mode_combo)
+        params_layout.addRow("缩放方式:", scale_layout)
+        
+        # 编码线程数和同时转换的文件数，0表示自动规划
+        performance_layout = QHBoxLayout()
+        self.threads_spinbox = QSpinBox()
+        self.threads_spinbox.setRange(0, 128)
+        self.threads_spinbox.setSpecialValueText("自动")
+        performance_layout.addWidget(QLabel("编码线程:"))
+        performance_layout.addWidget(self.threads_spinbox)
+        self.workers_spinbox = QSpinBox()
+        self.workers_spinbox.setRange(0, 64)
+        self.workers_spinbox.setSpecialValueText("自动")
+        performance_layout.addWidget(QLabel("同时转换:"))
+        performance_layout.addWidget(self.workers_spinbox)
+        self.chunked_checkbox = QCheckBox("分段并行编码")
+        self.chunked_checkbox.setToolTip("在关键帧处把长视频切成多段同时编码后再拼接，适合在多核电脑上转换单个长视频；\n"
+                                         "启用后逐个转换文件，\"同时转换\"为同时编码的段数")
+        performance_layout.addWidget(self.chunked_checkbox)
+        self.resumable_checkbox = QCheckBox("断点续转")
+        self.resumable_checkbox.setToolTip("长视频分段编码并记录已完成的段，程序或电脑中断后以相同设置重新转换时\n"
+                                           "从未完成的段继续；进度保存在输出目录中以.resume_开头的隐藏目录。\n"
+                                           "分段编码按恒定帧率输出、音频单独编码，各段分别进行码率控制")
+        performance_layout.addWidget(self.resumable_checkbox)
+        self.force_reencode_checkbox = QCheckBox("总是重新编码")
+        self.force_reencode_checkbox.setToolTip("使用默认的均衡方案或码率控制为“保持源编码”、源文件的编码、分辨率和帧率\n"
+                                                "都符合要求时只更换容器（不重新编码），勾选后总是按设置重新编码")
+        performance_layout.addWidget(self.force_reencode_checkbox)
+        performance_layout.addStretch()
+        params_layout.addRow("并行:", performance_layout)
+        
         # 添加到主布局
         self.main_layout.addWidget(params_group)
+        self.params_group = params_group
+        
+        self.create_ladder_params_area()
+        self.create_package_params_area()
+        self.create_animation_params_area()
+        self.update_format_inputs(self.format_combo.currentText())
+        
+    def create_ladder_params_area(self):
+        # 创建码率阶梯参数组（勾选后每个文件一次解码输出多档）
+        self.ladder_group = QGroupBox("多码率输出（一次解码，同时编码多档）")
+        self.ladder_group.setCheckable(True)
+        self.ladder_group.setChecked(False)
+        ladder_layout = QVBoxLayout(self.ladder_group)
+        
+        self.ladder_table = QTableWidget(0, 5)
+        self.ladder_table.setHorizontalHeaderLabels(["名称", "宽", "高", "视频码率", "音频码率"])
+        self.ladder_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.ladder_table.verticalHeader().setVisible(False)
+        self.ladder_table.setMinimumHeight(110)
+        for rendition in DEFAULT_LADDER:
+            self.add_ladder_row(rendition)
+        ladder_layout.addWidget(self.ladder_table)
+        
+        ladder_button_layout = QHBoxLayout()
+        add_rendition_button = QPushButton("添加一档")
+        add_rendition_button.clicked.connect(
+            lambda: self.add_ladder_row({'name': '360p', 'width': 640, 'height': 360,
+                                         'bitrate': '800k', 'audio_bitrate': '96k'}))
+        ladder_button_layout.addWidget(add_rendition_button)
+        remove_rendition_button = QPushButton("删除选中档")
+        remove_rendition_button.clicked.connect(self.remove_ladder_rows)
+        ladder_button_layout.addWidget(remove_rendition_button)
+        ladder_button_layout.addStretch()
+        ladder_layout.addLayout(ladder_button_layout)
+        
+        self.main_layout.addWidget(self.ladder_group)
+        
+    def create_package_params_area(self):
+        # 创建流媒体打包参数组（输出HLS/DASH时显示）
+        self.package_group = QGroupBox("流媒体打包")
+        package_layout = QFormLayout(self.package_group)
+        
+        self.segment_duration_spinbox = QSpinBox()
+        self.segment_duration_spinbox.setRange(1, 30)
+        self.segment_duration_spinbox.setValue(6)
+        self.segment_duration_spinbox.setSuffix(" 秒")
+        package_layout.addRow("分片时长:", self.segment_duration_spinbox)
+        
+        self.segment_type_combo = QComboBox()
+        self.segment_type_combo.addItem("MPEG-TS", 'mpegts')
+        self.segment_type_combo.addItem("fMP4", 'fmp4')
+        package_layout.addRow("HLS分片格式:", self.segment_type_combo)
+        
+        self.main_layout.addWidget(self.package_group)
+        
+    def add_ladder_row(self, rendition):
+        row = self.ladder_table.rowCount()
+        self.ladder_table.insertRow(row)
+        for col, key in enumerate(('name', 'width', 'height', 'bitrate', 'audio_bitrate')):
+            self.ladder_table.setItem(row, col, QTableWidgetItem(str(rendition[key])))
+            
+    def remove_ladder_rows(self):
+        rows = set(index.row() for index in self.ladder_table.selectedIndexes())
+        for row in sorted(rows, reverse=True):
+            self.ladder_table.removeRow(row)
+            
+    def get_ladder(self):
+        """获取码率阶梯设置，未启用时返回None；宽高不是正整数的行会被忽略"""
+        if not self.ladder_group.isChecked() or self.format_combo.currentText().lower() in ANIMATION_CODECS:
+            return None
+        ladder = []
+        for row in range(self.ladder_table.rowCount()):
+            values = [self.ladder_table.item(row, col).text().strip() if self.ladder_table.item(row, col) else ''
+                      for col in range(5)]
+            name, width, height, bitrate, audio_bitrate = values
+            if not (width.isdigit() and height.isdigit()) or int(width) <= 0 or int(height) <= 0:
+                continue
+            ladder.append({
+                'name': name or f"{height}p",
+                'width': int(width),
+                'height': int(height),
+                'bitrate': bitrate or None,
+                'audio_bitrate': audio_bitrate or '128k',
+            })
+        return ladder or None
+        
+    def create_animation_params_area(self):
+        # 创建动图参数组（输出GIF/WebP时显示）
+        self.animation_group = QGroupBox("动图参数")
+        animation_layout = QFormLayout(self.animation_group)
+        
+        self.animation_fps_spinbox = QSpinBox()
+        self.animation_fps_spinbox.setRange(1, 50)
+        self.animation_fps_spinbox.setValue(12)
+        animation_layout.addRow("帧率 (FPS):", self.animation_fps_spinbox)
+        
+        self.animation_width_spinbox = QSpinBox()
+        self.animation_width_spinbox.setRange(0, 3840)
+        self.animation_width_spinbox.setValue(480)
+        self.animation_width_spinbox.setSpecialValueText("原始宽度")
+        self.animation_width_spinbox.setSuffix(" 像素")
+        animation_layout.addRow("宽度:", self.animation_width_spinbox)
+        
+        self.animation_loop_spinbox = QSpinBox()
+        self.animation_loop_spinbox.setRange(0, 100)
+        self.animation_loop_spinbox.setSpecialValueText("无限循环")
+        animation_layout.addRow("循环次数:", self.animation_loop_spinbox)
+        
+        self.dither_combo = QComboBox()
+        for label, dither in ANIMATION_DITHERS:
+            self.dither_combo.addItem(label, dither)
+        animation_layout.addRow("抖动 (GIF):", self.dither_combo)
+        
+        self.colors_spinbox = QSpinBox()
+        self.colors_spinbox.setRange(2, 256)
+        self.colors_spinbox.setValue(256)
+        animation_layout.addRow("颜色数 (GIF):", self.colors_spinbox)
+        
+        self.webp_quality_spinbox = QSpinBox()
+        self.webp_quality_spinbox.setRange(0, 100)
+        self.webp_quality_spinbox.setValue(75)
+        animation_layout.addRow("质量 (WebP):", self.webp_quality_spinbox)
+        
+        self.decimate_checkbox = QCheckBox("去除重复帧（静止画面较多时文件更小）")
+        animation_layout.addRow("", self.decimate_checkbox)
+        
+        self.main_layout.addWidget(self.animation_group)
+        
+    def update_format_inputs(self, output_format):
+        """输出动图时显示动图参数，隐藏视频编码参数"""
+        is_animation = output_format.lower() in ANIMATION_CODECS
+        self.animation_group.setVisible(is_animation)
+        self.params_group.setVisible(not is_animation)
+        self.ladder_group.setVisible(not is_animation)
+        is_package = output_format.lower() in PACKAGE_MANIFESTS
+        self.package_group.setVisible(is_package)
+        self.segment_type_combo.setEnabled(output_format.lower() == 'hls')
     
     def create_convert_controls(self):
         # 创建控制按钮布局
         controls_layout = QHBoxLayout()
         
         # 创建转换按钮
-        self.convert_button = QPushButton("转换")
+        self.convert_button = QPushButton("开始转换")
         self.convert_button.setIcon(self.style().standardIcon(QStyle.SP_MediaPlay))
         self.convert_button.clicked.connect(self.start_conversion)
         self.convert_button.setEnabled(False)
         controls_layout.addWidget(self.convert_button)
         
+        # 创建预估按钮
+        self.estimate_button = QPushButton("预估耗时和大小")
+        self.estimate_button.clicked.connect(self.start_estimate)
+        self.estimate_button.setEnabled(False)
+        controls_layout.addWidget(self.estimate_button)
+        
+        # 创建重试按钮
+        self.retry_button = QPushButton("重试失败项")
+        self.retry_button.setIcon(self.style().standardIcon(QStyle.SP_BrowserReload))
+        self.retry_button.clicked.connect(self.retry_failed)
+        self.retry_button.setEnabled(False)
+        controls_layout.addWidget(self.retry_button)
+        
+        # 创建停止按钮
+        self.stop_button = QPushButton("停止")
+        self.stop_button.setIcon(self.style().standardIcon(QStyle.SP_MediaStop))
+        self.stop_button.clicked.connect(self.stop_conversion)
+        self.stop_button.setEnabled(False)
+        controls_layout.addWidget(self.stop_button)
+        
         # 添加到主布局
         self.main_layout.addLayout(controls_layout)
         
-        # 创建进度条
+        # 创建进度条（整个队列的进度）
         self.progress_bar = QProgressBar()
         self.progress_bar.setRange(0, 100)
         self.progress_bar.setValue(0)
         self.progress_bar.setTextVisible(True)
-        self.progress_bar.setFormat("%p% - %v / %m")
+        self.progress_bar.setFormat("%v / %m")
         self.main_layout.addWidget(self.progress_bar)
+        
+        # 创建状态标签
+        self.status_label = QLabel("队列为空")
+        self.main_layout.addWidget(self.status_label)
     
+    def apply_quality_profile(self):
+        """将选择的速度/质量方案填入各项设置"""
+        name = self.quality_profile_combo.currentData()
+        if name != CUSTOM_QUALITY:
+            quality = get_quality_profile(name)
+            self._applying_profile = True
+            self.preset_combo.setCurrentText(quality['preset'])
+            self.rate_control_combo.setCurrentIndex(self.rate_control_combo.findData(quality['rate_control']))
+            self.crf_spinbox.setValue(quality['crf'])
+            self._applying_profile = False
+        self.update_rate_control_inputs()
+        
+    def on_quality_edited(self):
+        """手动修改编码设置后切换为自定义方案"""
+        if not self._applying_profile:
+            self.quality_profile_combo.blockSignals(True)
+            self.quality_profile_combo.setCurrentIndex(self.quality_profile_combo.findData(CUSTOM_QUALITY))
+            self.quality_profile_combo.blockSignals(False)
+        self.update_rate_control_inputs()
+        
+    def update_rate_control_inputs(self):
+        rate_control = self.rate_control_combo.currentData()
+        self.crf_spinbox.setEnabled(rate_control in ('crf', 'source'))
+        self.bitrate_edit.setEnabled(rate_control in ('bitrate', 'two_pass'))
+        self.target_size_spinbox.setEnabled(rate_control == 'target_size')
+        self.target_metric_combo.setEnabled(rate_control == 'target_quality')
+        self.target_value_spinbox.setEnabled(rate_control == 'target_quality')
+        
+    def on_target_metric_changed(self):
+        # 切换画质指标时调整目标值的范围并填入默认值
+        _, metric, default = QUALITY_METRICS[self.target_metric_combo.currentIndex()]
+        if metric == 'ssim':
+            self.target_value_spinbox.setDecimals(3)
+            self.target_value_spinbox.setRange(0.8, 0.999)
+            self.target_value_spinbox.setSingleStep(0.005)
+        else:
+            self.target_value_spinbox.setDecimals(1)
+            self.target_value_spinbox.setRange(25, 60)
+            self.target_value_spinbox.setSingleStep(0.5)
+        self.target_value_spinbox.setValue(default)
+        
     def toggle_resolution_inputs(self, state):
         # 启用或禁用分辨率输入框
         enabled = state == Qt.Checked
         self.width_spinbox.setEnabled(enabled)
         self.height_spinbox.setEnabled(enabled)
+        self.scale_algorithm_combo.setEnabled(enabled)
+        self.fit_mode_combo.setEnabled(enabled)
     
     def add_video_file(self):
         # 打开文件对话框
-        file_path, _ = QFileDialog.getOpenFileName(
+        file_paths, _ = QFileDialog.getOpenFileNames(
             self,
             "选择视频文件",
             "",
             "视频文件 (*.mp4 *.avi *.mkv *.mov *.wmv *.flv *.webm);;所有文件 (*)"
         )
         
-        if file_path:
-            self.input_file = file_path
-            file_name = os.path.basename(file_path)
-            self.file_info_label.setText(f"已选择: {file_name}")
-            self.convert_button.setEnabled(True)
+        if file_paths:
+            self.add_files(file_paths)
+            
+    def add_video_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, "选择包含视频的文件夹")
+        if folder:
+            self.add_paths([folder])
+            
+    def add_paths(self, paths):
+        """添加文件和文件夹，文件夹在后台线程中递归展开"""
+        folders = [path for path in paths if os.path.isdir(path)]
+        files = [path for path in paths if not os.path.isdir(path)]
+        if files:
+            self.add_files(files)
+        if folders:
+            scan_thread = VideoScanThread(folders)
+            scan_thread.files_found.connect(self.add_files)
+            scan_thread.finished.connect(lambda: self.scan_threads.remove(scan_thread))
+            self.scan_threads.append(scan_thread)
+            scan_thread.start()
+            
+    def add_files(self, file_paths):
+        was_empty = self.queue_model.rowCount() == 0
+        if not self.queue_model.add_files(file_paths):
+            return
             
-            # 尝试获取视频信息
+        # 以第一个文件的分辨率作为默认分辨率
+        if was_empty:
             try:
-                video = VideoFileClip(file_path)
-                info_text = (
-                    f"已选择: {file_name}\n"
-                    f"时长: {video.duration:.2f} 秒\n"
-                    f"分辨率: {video.size[0]}x{video.size[1]}\n"
-                    f"FPS: {video.fps:.2f}"
-                )
-                self.file_info_label.setText(info_text)
-                
-                # 设置默认分辨率为视频原始分辨率
-                self.width_spinbox.setValue(video.size[0])
-                self.height_spinbox.setValue(video.size[1])
-                
-                # 关闭视频对象
-                video.close()
+                info = probe_media(self.queue_model.item(0).path)
+                if info.get('width') and info.get('height'):
+                    self.width_spinbox.setValue(info['width'])
+                    self.height_spinbox.setValue(info['height'])
             except Exception as e:
                 logger.error(f"获取视频信息时出错: {str(e)}")
-    
-    def start_conversion(self):
-        if not self.input_file:
-            QMessageBox.warning(self, "警告", "请先选择视频文件")
-            return
-        
-        # 获取输出格式
-        output_format = self.format_combo.currentText().lower()
+        self.update_queue_state()
         
-        # 打开保存文件对话框
-        output_file, _ = QFileDialog.getSaveFileName(
-            self,
-            "保存转换后的视频",
-            "",
-            f"{output_format.upper()} 文件 (*.{output_format});;所有文件 (*)"
-        )
+    def remove_selected(self):
+        # 转换过程中不能修改队列
+        if self.convert_thread is not None:
+            return
+        rows = [index.row() for index in self.queue_view.selectionModel().selectedRows()]
+        self.queue_model.remove_rows(rows)
+        self.update_queue_state()
         
-        if not output_file:
+    def clear_queue(self):
+        if self.convert_thread is not None:
             return
+        self.queue_model.clear()
+        self.update_queue_state()
         
-        # 确保文件扩展名正确
-        if not output_file.lower().endswith(f".{output_format}"):
-            output_file += f".{output_format}"
+    def update_queue_state(self):
+        """根据队列状态更新按钮、进度条和状态文字"""
+        running = self.convert_thread is not None
+        total = self.queue_model.rowCount()
+        done = len(self.queue_model.rows_with_status(STATUS_DONE))
+        failed = len(self.queue_model.rows_with_status(STATUS_FAILED))
+        waiting = len(self.queue_model.rows_with_status(STATUS_WAITING))
         
-        # 获取转换参数
-        params = {
+        self.convert_button.setEnabled(not running and waiting > 0)
+        self.estimate_button.setEnabled(not running and waiting > 0 and self.estimate_thread is None)
+        self.retry_button.setEnabled(not running and failed > 0)
+        self.stop_button.setEnabled(running)
+        for widget in (self.add_file_button, self.add_folder_button, self.remove_button,
+                       self.clear_button, self.drop_area):
+            widget.setEnabled(not running)
+            
+        self.progress_bar.setRange(0, max(total, 1))
+        self.progress_bar.setValue(done + failed)
+        if total:
+            self.status_label.setText(f"共 {total} 个文件：已完成 {done}，失败 {failed}，等待 {waiting}")
+        else:
+            self.status_label.setText("队列为空")
+            
+    def get_params(self):
+        """获取转换参数"""
+        return {
             'video_codec': self.video_codec_combo.currentText(),
             'audio_codec': self.audio_codec_combo.currentText(),
             'fps': self.fps_spinbox.value(),
             'bitrate': self.bitrate_edit.text(),
             'audio_bitrate': self.audio_bitrate_edit.text(),
             'resize': self.resize_checkbox.isChecked(),
-            'resolution': (self.width_spinbox.value(), self.height_spinbox.value())
+            'format': self.format_combo.currentText().lower(),
+            'resolution': (self.width_spinbox.value(), self.height_spinbox.value()),
+            'ladder': self.get_ladder(),
+            'package': {
+                'segment_duration': self.segment_duration_spinbox.value(),
+                'segment_type': self.segment_type_combo.currentData(),
+            },
+            'animation': {
+                'fps': self.animation_fps_spinbox.value(),
+                'width': self.animation_width_spinbox.value(),
+                'loop': self.animation_loop_spinbox.value(),
+                'dither': self.dither_combo.currentData(),
+                'max_colors': self.colors_spinbox.value(),
+                'decimate': self.decimate_checkbox.isChecked(),
+                'webp_quality': self.webp_quality_spinbox.value(),
+            },
+            'scale_algorithm': self.scale_algorithm_combo.currentData(),
+            'fit_mode': self.fit_mode_combo.currentData(),
+            'quality': {
+                'preset': self.preset_combo.currentText(),
+                'rate_control': self.rate_control_combo.currentData(),
+                'crf': self.crf_spinbox.value(),
+                'bitrate': self.bitrate_edit.text(),
+                'target_size': self.target_size_spinbox.value(),
+                'target_metric': self.target_metric_combo.currentData(),
+                'target_value': self.target_value_spinbox.value(),
+            },
+            'threads': self.threads_spinbox.value(),
+            'workers': self.workers_spinbox.value(),
+            'chunked': self.chunked_checkbox.isChecked(),
+            'resumable': self.resumable_checkbox.isChecked(),
+            'force_reencode': self.force_reencode_checkbox.isChecked(),
         }
         
-        # 禁用控件
-        self.convert_button.setEnabled(False)
-        self.add_file_button.setEnabled(False)
+    def assign_output_files(self, rows, output_dir, output_format):
+        """
+        为队列中的文件分配输出路径
         
-        # 创建并启动转换线程
-        self.convert_thread = VideoConvertThread(self.input_file, output_file, params)
-        self.convert_thread.progress_updated.connect(self.update_progress)
-        self.convert_thread.process_finished.connect(self.conversion_finished)
-        self.convert_thread.error_occurred.connect(self.conversion_error)
-        self.convert_thread.start()
-    
-    def update_progress(self, value):
-        self.progress_bar.setValue(value)
-    
-    def conversion_finished(self, output_file):
-        # 重置进度条
-        self.progress_bar.setValue(100)
+        与输入文件、已存在的文件或同一批次中其他输出重名时添加序号
+        """
+        used = set(os.path.normcase(os.path.abspath(self.queue_model.item(row).output))
+                   for row in range(self.queue_model.rowCount())
+                   if self.queue_model.item(row).output and row not in rows)
+        jobs = []
+        for row in rows:
+            item = self.queue_model.item(row)
+            stem = os.path.splitext(item.name)[0]
+            name = stem
+            counter = 1
+            while True:
+                if output_format in PACKAGE_MANIFESTS:
+                    output_file = package_output_path(output_dir, name, output_format)
+                    exists = os.path.exists(os.path.dirname(output_file))
+                else:
+                    output_file = os.path.join(output_dir, f"{name}.{output_format}")
+                    exists = os.path.exists(output_file)
+                if not exists and os.path.normcase(os.path.abspath(output_file)) not in used:
+                    break
+                name = f"{stem}_converted{'' if counter == 1 else f'_{counter}'}"
+                counter += 1
+            used.add(os.path.normcase(os.path.abspath(output_file)))
+            self.queue_model.set_output(row, output_file)
+            jobs.append((row, item.path, output_file))
+        return jobs
         
-        # 启用控件
-        self.convert_button.setEnabled(True)
-        self.add_file_button.setEnabled(True)
+    def start_conversion(self):
+        rows = self.queue_model.rows_with_status(STATUS_WAITING)
+        if not rows:
+            QMessageBox.warning(self, "警告", "请先添加视频文件")
+            return
         
-        # 显示完成消息
-        QMessageBox.information(
-            self,
-            "转换完成",
-            f"视频已成功转换并保存到:\n{output_file}"
-        )
-    
-    def conversion_error(self, error_message):
-        # 重置进度条
-        self.progress_bar.setValue(0)
+        # 选择输出目录（所有文件输出到同一目录）
+        output_dir = QFileDialog.getExistingDirectory(self, "选择输出目录")
+        if not output_dir:
+            return
         
-        # 启用控件
-        self.convert_button.setEnabled(True)
-        self.add_file_button.setEnabled(True)
+        # 获取输出格式
+        output_format = self.format_combo.currentText().lower()
+        jobs = self.assign_output_files(rows, output_dir, output_format)
+        self.run_jobs(jobs)
         
-        # 显示错误消息
-        QMessageBox.critical(
-            self,
-            "转换错误",
-            f"转换过程中出错:\n{error_message}"
-        ) 
\ No newline at end of file
+    def start_estimate(self):
+        """按当前设置在后台预估等待中的文件的输出大小和耗时，结果显示在状态栏中"""
+        rows = self.queue_model.rows_with_status(STATUS_WAITING)
+        if not rows or self.estimate_thread is not None:
+            return
+        self.estimate_thread = EstimateThread(estimate_conversion,
+                                              [self.queue_model.item(row).path for row in rows], self.get_params())
+        self.estimate_thread.estimate_ready.connect(self.on_estimate_ready)
+        self.estimate_thread.error_occurred.connect(self.on_estimate_error)
+        self.estimate_thread.start()
+        self.update_queue_state()
+        self.status_label.setText(f"{self.status_label.text()}。正在预估耗时和大小...")
+        
+    def on_estimate_ready(self, estimate):
+        self.finish_estimate(format_estimate(estimate))
+        
+    def on_estimate_error(self, error_msg):
+        self.finish_estimate(f"预估失败: {error_msg}")
+        
+    def finish_estimate(self, text):
+        self.estimate_thread.wait()
+        self.estimate_thread = None
+        self.update_queue_state()
+        self.status_label.setText(f"{self.status_label.text()}。{text}")
+        
+    def retry_failed(self):
+        """重新转换失败的文件，沿用之前分配的输出路径"""
+        jobs = []
+        for row in self.queue_model.rows_with_status(STATUS_FAILED):
+            item = self.queue_model.item(row)
+            self.queue_model.set_status(row, STATUS_WAITING)
+            jobs.append((row, item.path, item.output))
+        self.run_jobs(jobs)
+        
+    def run_jobs(self, jobs):
+        if not jobs:
+            return
+            
+        # 创建并启动批量转换线程
+        self.convert_thread = BatchConvertThread(jobs, self.get_params())
+        self.convert_thread.item_status.connect(self.update_item_status)
+        self.convert_thread.item_progress.connect(self.queue_model.set_progress)
+        self.convert_thread.item_method.connect(self.queue_model.set_method)
+        self.convert_thread.batch_finished.connect(self.conversion_finished)
+        self.convert_thread.start()
+        self.update_queue_state()
+        
+    def stop_conversion(self):
+        if self.convert_thread is not None:
+            self.convert_thread.stop()
+            self.stop_button.setEnabled(False)
+            self.status_label.setText("正在停止，等待当前文件转换完成...")
+            
+    def update_item_status(self, row, status, error):
+        self.queue_model.set_status(row, status, error)
+        if status != STATUS_RUNNING:
+            self.update_queue_state()
+    
+    def conversion_finished(self, succeeded, failed):
+        self.convert_thread.wait()
+        jobs = list(self.convert_thread.metrics['jobs'].values())
+        methods = [job.get('method') for job in jobs]
+        self.convert_thread = None
+        self.update_queue_state()
+        
+        # 批量转换不弹出对话框，结果显示在状态栏中
+        summary = f"本次转换完成 {succeeded} 个"
+        remuxed = methods.count(METHOD_REMUX)
+        cached = methods.count(METHOD_CACHED)
+        if remuxed:
+            summary += f"（其中 {remuxed} 个只更换了容器，未重新编码）"
+        if cached:
+            summary += f"，{cached} 个使用了缓存的结果"
+        unchunked = [job['chunk_skipped'] for job in jobs if job.get('chunk_skipped')]
+        if unchunked:
+            summary += f"，{len(unchunked)} 个未分段并行编码（{'、'.join(sorted(set(unchunked)))}）"
+        if failed:
+            summary += f"，失败 {failed} 个（可点击“重试失败项”重新转换）"
+        self.status_label.setText(f"{self.status_label.text()}。{summary}")
+        logger.info(summary)
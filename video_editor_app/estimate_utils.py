@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+输出大小和耗时预估
+根据探测到的媒体信息、一小段样本编码和本机以往的编码速度，在开始转换或合并前估计输出大小和耗时
+"""
+
+import os
+import time
+import shutil
+import logging
+import tempfile
+
+try:
+    from .ffmpeg_utils import run_ffmpeg, bitrate_value, CONTAINER_OVERHEAD
+    from .cache_utils import get_cache_dir, JsonCache
+    from .resource_utils import get_cpu_count
+except ImportError:
+    from ffmpeg_utils import run_ffmpeg, bitrate_value, CONTAINER_OVERHEAD
+    from cache_utils import get_cache_dir, JsonCache
+    from resource_utils import get_cpu_count
+
+# 获取logger
+logger = logging.getLogger("VideoEditor.estimate")
+
+# 样本编码的时长（秒），从视频中间选取
+SAMPLE_DURATION = 4.0
+
+# 流复制（只更换容器、直接拼接）按磁盘读写速度估计耗时（字节/秒）
+COPY_BYTES_PER_SECOND = 150 * 1024 ** 2
+
+# 历史速度按指数移动平均更新，新记录的权重
+HISTORY_WEIGHT = 0.3
+
+
+def format_size(size):
+    """把字节数格式化为便于阅读的文字"""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} B"
+        size /= 1024
+
+
+def format_eta(seconds):
+    """把预估耗时格式化为 X 小时 Y 分 / Y 分 Z 秒"""
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{max(seconds, 1)} 秒"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes} 分 {seconds} 秒"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} 小时 {minutes} 分"
+
+
+def output_pixels(width, height, fps, duration):
+    """输出的总像素数（宽 × 高 × 帧数），作为编码工作量"""
+    return (width or 0) * (height or 0) * (fps or 30) * (duration or 0)
+
+
+def audio_bytes(info, audio_bitrate, copy=False):
+    """音轨的大小（字节）：复制时按源音频码率，否则按输出的音频码率；没有音轨时为0"""
+    if not info.get('audio_codec'):
+        return 0
+    bitrate = info.get('audio_bit_rate') if copy else None
+    if not bitrate:
+        bitrate = bitrate_value(audio_bitrate) if audio_bitrate else 128000
+    return bitrate * (info.get('duration') or 0) / 8
+
+
+def with_overhead(stream_bytes):
+    """加上容器开销后的文件大小"""
+    return stream_bytes * (1 + CONTAINER_OVERHEAD)
+
+
+def encode_signature(codec, quality, height, threads):
+    """
+    编码速度的历史记录键
+
+    同一台机器（CPU核心数）、编码器、速度档位、码率控制、输出高度分档和线程数下的编码速度相近
+    """
+    quality = quality or {}
+    rate_control = quality.get('rate_control', 'crf')
+    rate = quality.get('crf') if rate_control == 'crf' else quality.get('bitrate')
+    height = height or 1080
+    bucket = '720' if height <= 720 else '1080' if height <= 1080 else '2160'
+    return '|'.join(str(part) for part in (codec, quality.get('preset', 'medium'), rate_control, rate, bucket,
+                                           f"cpu{get_cpu_count()}", f"t{threads or 0}"))
+
+
+class EncodeHistory:
+    """
+    本机的编码速度历史
+
+    按encode_signature记录每秒编码的像素数和每像素的比特数（指数移动平均），
+    保存在缓存目录的JSON文件中
+    """
+
+    def __init__(self, file_path=None):
+        self.cache = JsonCache(file_path or os.path.join(get_cache_dir(), "encode_history.json"))
+
+    def get(self, signature):
+        """获取历史记录 {'pixels_per_second', 'bits_per_pixel', 'jobs'}，没有记录时返回None"""
+        return self.cache.get(signature)
+
+    def record(self, signature, pixels, elapsed, video_bytes=None):
+        """记录一次编码的工作量（像素数）、耗时（秒）和视频流大小（字节）"""
+        if not pixels or not elapsed or elapsed <= 0:
+            return
+        entry = dict(self.cache.get(signature) or {})
+
+        def blend(old, new):
+            return new if old is None else old * (1 - HISTORY_WEIGHT) + new * HISTORY_WEIGHT
+
+        entry['pixels_per_second'] = blend(entry.get('pixels_per_second'), pixels / elapsed)
+        if video_bytes and video_bytes > 0:
+            entry['bits_per_pixel'] = blend(entry.get('bits_per_pixel'), video_bytes * 8 / pixels)
+        entry['jobs'] = entry.get('jobs', 0) + 1
+        entry['updated'] = time.time()
+        self.cache.set(signature, entry)
+
+
+def sample_encode(input_file, video_args, duration, width, height, fps, sample_duration=SAMPLE_DURATION):
+    """
+    从视频中间编码一小段样本（只编码视频），测量编码速度和码率
+
+    video_args为视频滤镜和编码参数；返回 {'pixels_per_second', 'bits_per_pixel'}，编码失败时返回None。
+    样本耗时包含ffmpeg启动和定位的开销，测得的速度偏保守
+    """
+    length = min(sample_duration, duration or sample_duration)
+    start = max(0.0, (duration or 0) / 2 - length / 2)
+    work_dir = tempfile.mkdtemp(prefix="estimate_")
+    try:
+        sample_file = os.path.join(work_dir, "sample.mkv")
+        begin = time.monotonic()
+        run_ffmpeg(['-ss', f"{start:.3f}", '-t', f"{length:.3f}", '-i', input_file, '-map', '0:v:0']
+                   + video_args + ['-an', sample_file])
+        elapsed = time.monotonic() - begin
+        size = os.path.getsize(sample_file)
+    except Exception as e:
+        logger.warning(f"样本编码失败: {input_file}: {str(e)}")
+        return None
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    pixels = output_pixels(width, height, fps, length)
+    if not pixels or elapsed <= 0:
+        return None
+    return {'pixels_per_second': pixels / elapsed, 'bits_per_pixel': size * 8 / pixels}
+
+
+def encode_rates(history_entry, sample):
+    """
+    合并历史记录和样本编码的结果，返回 (每秒像素数, 每像素比特数, 依据)
+
+    编码速度优先使用历史记录（来自完整的编码任务，比短样本准确）；每像素比特数与视频内容有关，
+    优先使用本次样本的结果
+    """
+    pixels_per_second = bits_per_pixel = None
+    basis = []
+    if history_entry and history_entry.get('pixels_per_second'):
+        pixels_per_second = history_entry['pixels_per_second']
+        basis.append(f"本机历史速度（{history_entry.get('jobs', 0)} 次）")
+    if sample:
+        bits_per_pixel = sample['bits_per_pixel']
+        if pixels_per_second is None:
+            pixels_per_second = sample['pixels_per_second']
+        basis.append("样本编码")
+    if bits_per_pixel is None and history_entry:
+        bits_per_pixel = history_entry.get('bits_per_pixel')
+    return pixels_per_second, bits_per_pixel, basis
+
+
+def new_estimate():
+    """
+    空的预估结果
+
+    size为输出大小（字节），time为耗时（秒），不能预估时为None；basis为预估依据的说明，
+    notes为预估中没有考虑的情况
+    """
+    return {'size': 0, 'time': 0.0, 'basis': [], 'notes': []}
+
+
+def add_basis(estimate, *basis):
+    for item in basis:
+        if item not in estimate['basis']:
+            estimate['basis'].append(item)
+
+
+def format_estimate(estimate):
+    """把预估结果格式化为一行说明文字"""
+    parts = []
+    if estimate.get('size') is not None:
+        parts.append(f"预计输出约 {format_size(estimate['size'])}")
+    if estimate.get('time') is not None:
+        parts.append(f"耗时约 {format_eta(estimate['time'])}")
+    text = "，".join(parts) if parts else "无法预估"
+    if estimate.get('basis'):
+        text += f"（依据：{'、'.join(estimate['basis'])}）"
+    if estimate.get('notes'):
+        text += f"；{'；'.join(estimate['notes'])}"
+    return text
@@ -0,0 +1,1443 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+FFmpeg辅助函数
+封装ffmpeg/ffprobe命令行调用，供各标签页的处理线程使用
+"""
+
+import os
+import re
+import math
+import sys
+import json
+import shutil
+import tempfile
+import logging
+import threading
+import subprocess
+from collections import Counter, deque
+
+# 获取logger
+logger = logging.getLogger("VideoEditor.ffmpeg")
+
+# 缓存可执行文件路径
+_ffmpeg_exe = None
+_ffprobe_exe = None
+
+# 出错时保留的ffmpeg错误输出行数
+FFMPEG_STDERR_TAIL_LINES = 50
+
+# 只读取文件头时的探测上限（字节 / 微秒）
+PROBE_SIZE = 5 * 1024 * 1024
+ANALYZE_DURATION = 1000000
+
+# 探测结果缓存，键为 (路径, 文件大小, 修改时间)
+_probe_cache = {}
+_probe_cache_lock = threading.Lock()
+
+# mp4容器可以直接复制的编码
+MP4_VIDEO_CODECS = ('h264', 'hevc', 'mpeg4', 'av1')
+MP4_AUDIO_CODECS = ('aac', 'mp3', 'ac3', 'eac3', 'alac', 'opus')
+
+# 各容器可以直接复制的 (视频编码, 音频编码)，None表示不限制
+CONTAINER_CODECS = {
+    'mp4': (MP4_VIDEO_CODECS, MP4_AUDIO_CODECS),
+    'mov': (MP4_VIDEO_CODECS + ('prores', 'mjpeg'), MP4_AUDIO_CODECS + ('pcm_s16le', 'pcm_s24le')),
+    'mkv': (None, None),
+    'avi': (('h264', 'mpeg4', 'msmpeg4v3', 'mjpeg', 'rawvideo'), ('mp3', 'ac3', 'aac', 'pcm_s16le')),
+    'wmv': (('wmv1', 'wmv2', 'wmv3', 'vc1'), ('wmav1', 'wmav2')),
+    'ts': (('h264', 'hevc', 'mpeg2video', 'mpeg4'), ('aac', 'mp3', 'ac3', 'eac3', 'opus')),
+}
+
+# 编码器输出的编码名称（与ffprobe的codec_name一致）
+ENCODER_CODEC_NAMES = {
+    'libx264': 'h264',
+    'h264_nvenc': 'h264',
+    'libx265': 'hevc',
+    'hevc_nvenc': 'hevc',
+    'mpeg4': 'mpeg4',
+    'libxvid': 'mpeg4',
+    'libvpx': 'vp8',
+    'libvpx-vp9': 'vp9',
+    'rawvideo': 'rawvideo',
+    'wmv2': 'wmv2',
+    'aac': 'aac',
+    'mp3': 'mp3',
+    'libmp3lame': 'mp3',
+    'libvorbis': 'vorbis',
+    'libopus': 'opus',
+}
+
+# ffprobe的H.264编码档次名称对应的x264档次（目标规格的像素格式为yuv420p）
+X264_PROFILES = {
+    'Constrained Baseline': 'baseline',
+    'Baseline': 'baseline',
+    'Main': 'main',
+    'High': 'high',
+}
+
+# 编码速度档位（从快到慢，与x264/x265的preset相同）
+ENCODER_PRESETS = ('ultrafast', 'superfast', 'veryfast', 'faster', 'fast',
+                   'medium', 'slow', 'slower', 'veryslow')
+
+# 命名的速度/质量方案：rate_control为'crf'时使用恒定质量，为'bitrate'时使用固定码率
+QUALITY_PROFILES = {
+    'draft': {'preset': 'veryfast', 'rate_control': 'crf', 'crf': 28},
+    'balanced': {'preset': 'medium', 'rate_control': 'crf', 'crf': 23},
+    'archival': {'preset': 'slow', 'rate_control': 'crf', 'crf': 18},
+}
+QUALITY_PROFILE_LABELS = [
+    ('draft', "草稿（最快）"),
+    ('balanced', "均衡"),
+    ('archival', "存档（最高质量）"),
+]
+DEFAULT_QUALITY_PROFILE = 'balanced'
+
+# 缩放算法 (显示名称, swscale算法)
+SCALE_ALGORITHMS = [
+    ("双三次（默认）", 'bicubic'),
+    ("Lanczos（最清晰）", 'lanczos'),
+    ("区域平均（适合大幅缩小）", 'area'),
+    ("双线性（较快）", 'bilinear'),
+    ("快速双线性（最快）", 'fast_bilinear'),
+]
+
+# 默认的码率阶梯，每一档为一个输出规格
+DEFAULT_LADDER = [
+    {'name': '1080p', 'width': 1920, 'height': 1080, 'bitrate': '5000k', 'audio_bitrate': '192k'},
+    {'name': '720p', 'width': 1280, 'height': 720, 'bitrate': '2800k', 'audio_bitrate': '128k'},
+    {'name': '480p', 'width': 854, 'height': 480, 'bitrate': '1400k', 'audio_bitrate': '96k'},
+]
+
+# 流媒体打包格式及其主清单文件名
+PACKAGE_MANIFESTS = {'hls': 'master.m3u8', 'dash': 'manifest.mpd'}
+
+# 支持两遍编码的编码器（libx265的统计文件需要通过x265-params传递，暂不支持）
+TWO_PASS_CODECS = ('libx264', 'libvpx', 'libvpx-vp9', 'mpeg4')
+
+# 按目标文件大小计算码率时预留给容器开销的比例
+CONTAINER_OVERHEAD = 0.02
+
+# 画质指标 (显示名称, 滤镜名, 默认目标值)
+QUALITY_METRICS = [
+    ("SSIM", 'ssim', 0.98),
+    ("PSNR (dB)", 'psnr', 42.0),
+]
+
+# 搜索CRF时的取值范围（x264刻度）
+CRF_SEARCH_RANGE = (14, 40)
+
+# 分段并行编码时每段的最短时长（秒），段太短时切分和拼接的开销超过并行带来的收益
+MIN_CHUNK_DURATION = 30
+
+# 动图的抖动算法 (显示名称, paletteuse的dither参数)
+ANIMATION_DITHERS = [
+    ("Sierra-2-4A（推荐）", 'sierra2_4a'),
+    ("Floyd-Steinberg", 'floyd_steinberg'),
+    ("Bayer（文件最小）", 'bayer'),
+    ("不抖动", 'none'),
+]
+
+# 宽高比与目标分辨率不同时的处理方式 (显示名称, 方式)
+SCALE_FIT_MODES = [
+    ("拉伸到目标分辨率", 'stretch'),
+    ("保持比例，填充黑边", 'pad'),
+    ("保持比例，裁剪多余部分", 'crop'),
+]
+
+
+def get_ffmpeg_exe():
+    """获取ffmpeg可执行文件路径（优先使用moviepy自带的imageio-ffmpeg）"""
+    global _ffmpeg_exe
+    if _ffmpeg_exe is None:
+        try:
+            import imageio_ffmpeg
+            _ffmpeg_exe = imageio_ffmpeg.get_ffmpeg_exe()
+        except Exception:
+            _ffmpeg_exe = shutil.which("ffmpeg")
+        if not _ffmpeg_exe:
+            raise RuntimeError("未找到ffmpeg，请安装ffmpeg或imageio-ffmpeg")
+        logger.info(f"使用ffmpeg: {_ffmpeg_exe}")
+    return _ffmpeg_exe
+
+
+def get_ffprobe_exe():
+    """获取ffprobe可执行文件路径，找不到时返回None"""
+    global _ffprobe_exe
+    if _ffprobe_exe is None:
+        _ffprobe_exe = shutil.which("ffprobe") or ""
+        if not _ffprobe_exe:
+            # 尝试在ffmpeg所在目录查找
+            try:
+                ffmpeg_dir = os.path.dirname(get_ffmpeg_exe())
+                candidate = os.path.join(ffmpeg_dir, "ffprobe.exe" if sys.platform == "win32" else "ffprobe")
+                if os.path.isfile(candidate):
+                    _ffprobe_exe = candidate
+            except RuntimeError:
+                pass
+    return _ffprobe_exe or None
+
+
+def _popen_kwargs():
+    """子进程的公共参数（Windows下不弹出控制台窗口）"""
+    if sys.platform == "win32":
+        return {'creationflags': subprocess.CREATE_NO_WINDOW}
+    return {}
+
+
+def run_ffmpeg(args, duration=None, progress_callback=None):
+    """
+    运行ffmpeg命令
+
+    args: ffmpeg参数列表（不含可执行文件）
+    duration: 输出时长（秒），用于计算进度
+    progress_callback: 进度回调，参数为0.0~1.0之间的浮点数
+    """
+    cmd = [get_ffmpeg_exe(), '-hide_banner', '-nostdin', '-y', '-loglevel', 'error',
+           '-progress', 'pipe:1', '-nostats'] + list(args)
+    logger.debug(f"执行ffmpeg命令: {' '.join(cmd)}")
+
+    process = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        encoding='utf-8',
+        errors='replace',
+        **_popen_kwargs()
+    )
+
+    # stderr在单独的线程中持续读取，只保留最后几行用于错误信息；
+    # 否则错误输出超过管道缓冲区时ffmpeg阻塞，stdout也不会结束
+    stderr_tail = deque(maxlen=FFMPEG_STDERR_TAIL_LINES)
+    stderr_reader = threading.Thread(target=lambda: stderr_tail.extend(line.rstrip() for line in process.stderr),
+                                     daemon=True)
+    stderr_reader.start()
+
+    # 解析-progress输出
+    for line in process.stdout:
+        if progress_callback is None or not duration:
+            continue
+        key, _, value = line.strip().partition('=')
+        if key in ('out_time_us', 'out_time_ms') and value.isdigit():
+            # 两个字段的单位都是微秒
+            progress_callback(min(int(value) / 1000000.0 / duration, 1.0))
+
+    process.wait()
+    stderr_reader.join()
+
+    if process.returncode != 0:
+        lines = [line for line in stderr_tail if line.strip()]
+        message = lines[-1] if lines else f"返回码 {process.returncode}"
+        tail = "\n".join(lines)
+        logger.debug(f"ffmpeg错误输出（最后{len(lines)}行）:\n{tail}")
+        raise RuntimeError(f"ffmpeg执行失败: {message}")
+
+    if progress_callback is not None:
+        progress_callback(1.0)
+
+
+def _parse_rate(value):
+    """解析 30000/1001 形式的帧率"""
+    try:
+        if '/' in value:
+            num, den = value.split('/', 1)
+            return float(num) / float(den) if float(den) else 0.0
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _empty_media_info():
+    return {
+        'duration': None,
+        'bit_rate': None,
+        'format_name': None,
+        'video_codec': None,
+        'width': None,
+        'height': None,
+        'fps': None,
+        'frame_rate': None,
+        'pix_fmt': None,
+        'video_profile': None,
+        'level': None,
+        'extradata_hash': None,
+        'video_bit_rate': None,
+        'audio_codec': None,
+        'sample_rate': None,
+        'channels': None,
+        'audio_bit_rate': None,
+    }
+
+
+def _stream_bit_rate(stream):
+    """获取流码率，mkv等容器的码率记录在BPS标签中"""
+    bit_rate = _to_int(stream.get('bit_rate'))
+    if bit_rate is None:
+        bit_rate = _to_int(stream.get('tags', {}).get('BPS'))
+    return bit_rate
+
+
+def _probe_with_ffprobe(ffprobe, file_path):
+    """使用ffprobe获取媒体信息"""
+    cmd = [ffprobe, '-v', 'error',
+           '-probesize', str(PROBE_SIZE), '-analyzeduration', str(ANALYZE_DURATION),
+           '-show_entries', 'format=duration,bit_rate,format_name'
+                            ':stream=codec_type,codec_name,width,height,pix_fmt,avg_frame_rate,'
+                            'r_frame_rate,sample_rate,channels,bit_rate,profile,level,extradata_hash'
+                            ':stream_disposition=attached_pic:stream_tags=BPS',
+           '-show_data_hash', 'sha256',
+           '-of', 'json', file_path]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True, encoding='utf-8', errors='replace',
+                            **_popen_kwargs())
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe无法读取文件: {result.stderr.strip()}")
+
+    data = json.loads(result.stdout or "{}")
+    info = _empty_media_info()
+
+    fmt = data.get('format', {})
+    info['duration'] = _to_float(fmt.get('duration'))
+    info['bit_rate'] = _to_int(fmt.get('bit_rate'))
+    info['format_name'] = fmt.get('format_name')
+
+    for stream in data.get('streams', []):
+        codec_type = stream.get('codec_type')
+        if codec_type == 'video' and info['video_codec'] is None:
+            # 跳过封面图片
+            if stream.get('disposition', {}).get('attached_pic'):
+                continue
+            frame_rate = stream.get('avg_frame_rate')
+            if not _parse_rate(frame_rate):
+                frame_rate = stream.get('r_frame_rate')
+            info['video_codec'] = stream.get('codec_name')
+            info['width'] = _to_int(stream.get('width'))
+            info['height'] = _to_int(stream.get('height'))
+            info['frame_rate'] = frame_rate
+            info['fps'] = _parse_rate(frame_rate)
+            info['pix_fmt'] = stream.get('pix_fmt')
+            # 编码档次、级别和参数集（H.264的SPS/PPS），拼接时只有这些一致的流才能直接复制
+            info['video_profile'] = stream.get('profile')
+            info['level'] = _to_int(stream.get('level'))
+            info['extradata_hash'] = stream.get('extradata_hash')
+            info['video_bit_rate'] = _stream_bit_rate(stream)
+        elif codec_type == 'audio' and info['audio_codec'] is None:
+            info['audio_codec'] = stream.get('codec_name')
+            info['sample_rate'] = _to_int(stream.get('sample_rate'))
+            info['channels'] = _to_int(stream.get('channels'))
+            info['audio_bit_rate'] = _stream_bit_rate(stream)
+
+    return info
+
+
+# ffmpeg -i 输出的解析规则
+_DURATION_RE = re.compile(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)")
+_BITRATE_RE = re.compile(r"bitrate:\s*(\d+)\s*kb/s")
+_STREAM_RE = re.compile(r"Stream #\d+:\d+.*?:\s*(Video|Audio):\s*(.*)")
+_CHANNEL_LAYOUTS = {'mono': 1, 'stereo': 2, '2.1': 3, 'quad': 4, '5.0': 5, '5.1': 6, '7.1': 8}
+
+
+def _probe_with_ffmpeg(file_path):
+    """没有ffprobe时，解析 ffmpeg -i 的输出获取媒体信息"""
+    cmd = [get_ffmpeg_exe(), '-hide_banner', '-nostdin',
+           '-probesize', str(PROBE_SIZE), '-analyzeduration', str(ANALYZE_DURATION), '-i', file_path]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True, encoding='utf-8', errors='replace',
+                            **_popen_kwargs())
+    output = result.stderr
+    info = _empty_media_info()
+
+    match = _DURATION_RE.search(output)
+    if not match:
+        raise RuntimeError(f"ffmpeg无法读取文件: {file_path}")
+    hours, minutes, seconds = match.groups()
+    info['duration'] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    match = _BITRATE_RE.search(output)
+    if match:
+        info['bit_rate'] = int(match.group(1)) * 1000
+
+    match = re.search(r"Input #0,\s*([^,]+(?:,[^,\s]+)*),\s*from", output)
+    if match:
+        info['format_name'] = match.group(1)
+
+    for line in output.splitlines():
+        match = _STREAM_RE.search(line)
+        if not match:
+            continue
+        codec_type, desc = match.groups()
+        parts = [p.strip() for p in re.split(r",(?![^(]*\))", desc)]
+        codec = parts[0].split()[0] if parts and parts[0] else None
+        bitrate = re.search(r"(\d+)\s*kb/s", desc)
+
+        if codec_type == 'Video' and info['video_codec'] is None:
+            if 'attached pic' in desc:
+                continue
+            info['video_codec'] = codec
+            profile = re.match(r"\w+\s+\(([^)/]+)\)", parts[0])
+            if profile:
+                info['video_profile'] = profile.group(1).strip()
+            if len(parts) > 1:
+                info['pix_fmt'] = parts[1].split('(')[0].strip()
+            size = re.search(r"\b(\d{2,5})x(\d{2,5})\b", desc)
+            if size:
+                info['width'], info['height'] = int(size.group(1)), int(size.group(2))
+            fps = re.search(r"([\d.]+)\s*fps", desc) or re.search(r"([\d.]+)\s*tbr", desc)
+            if fps:
+                info['frame_rate'] = fps.group(1)
+                info['fps'] = float(fps.group(1))
+            if bitrate:
+                info['video_bit_rate'] = int(bitrate.group(1)) * 1000
+        elif codec_type == 'Audio' and info['audio_codec'] is None:
+            info['audio_codec'] = codec
+            rate = re.search(r"(\d+)\s*Hz", desc)
+            if rate:
+                info['sample_rate'] = int(rate.group(1))
+            channels = re.search(r"(\d+)\s*channels", desc)
+            if channels:
+                info['channels'] = int(channels.group(1))
+            elif len(parts) > 2:
+                info['channels'] = _CHANNEL_LAYOUTS.get(parts[2].split('(')[0].strip())
+            if bitrate:
+                info['audio_bit_rate'] = int(bitrate.group(1)) * 1000
+
+    return info
+
+
+def probe_media(file_path):
+    """
+    获取媒体文件的容器和流信息
+
+    返回字典，包含时长、码率、视频/音频编码、分辨率、帧率、采样率、声道数等，
+    无法获取的字段为None。只读取容器和流的头信息，不解码数据；
+    结果按文件大小和修改时间缓存，文件未改变时不会重复探测
+    """
+    stat = os.stat(file_path)
+    cache_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime)
+    with _probe_cache_lock:
+        cached = _probe_cache.get(cache_key)
+    if cached is not None:
+        return dict(cached)
+
+    ffprobe = get_ffprobe_exe()
+    if ffprobe:
+        info = _probe_with_ffprobe(ffprobe, file_path)
+    else:
+        info = _probe_with_ffmpeg(file_path)
+
+    # 流码率缺失时由总码率减去另一路流的码率推算
+    if info['video_bit_rate'] is None and info['bit_rate'] and info['video_codec']:
+        info['video_bit_rate'] = max(info['bit_rate'] - (info['audio_bit_rate'] or 0), 0) or None
+
+    with _probe_cache_lock:
+        _probe_cache[cache_key] = info
+    return dict(info)
+
+
+def is_mp4_copy_compatible(info):
+    """判断媒体流能否直接复制到mp4容器"""
+    return is_copy_compatible(info, 'mp4')
+
+
+def is_copy_compatible(info, container):
+    """判断媒体流能否直接复制到指定容器（文件扩展名，不含点）"""
+    if container not in CONTAINER_CODECS or info.get('video_codec') is None:
+        return False
+    video_codecs, audio_codecs = CONTAINER_CODECS[container]
+    if video_codecs is not None and info['video_codec'] not in video_codecs:
+        return False
+    return info.get('audio_codec') is None or audio_codecs is None or info['audio_codec'] in audio_codecs
+
+
+def can_copy_audio(info, audio_codec, container, bitrate=None, sample_rate=None, channels=None):
+    """
+    判断源音频能否不经重新编码直接复制到输出
+
+    要求源音频已经是audio_codec对应的编码、输出容器可以直接容纳，采样率和声道数符合要求（为None时不限制），
+    且源码率不明显高于要求的码率（要求更低码率时需要重新编码来减小文件）
+    """
+    source = info.get('audio_codec')
+    if not source or ENCODER_CODEC_NAMES.get(audio_codec) != source:
+        return False
+    if sample_rate and info.get('sample_rate') != sample_rate:
+        return False
+    if channels and info.get('channels') != channels:
+        return False
+    if bitrate and info.get('audio_bit_rate') and info['audio_bit_rate'] > bitrate_value(bitrate) * 1.5:
+        return False
+    if container not in CONTAINER_CODECS:
+        return False
+    audio_codecs = CONTAINER_CODECS[container][1]
+    return audio_codecs is None or source in audio_codecs
+
+
+def can_remux(info, input_file, output_file, params):
+    """
+    判断转换能否只更换容器而不重新编码
+
+    只在输出容器与源文件不同、且码率控制为保持源编码（rate_control为'source'）或速度/质量设置
+    仍为默认方案时考虑，即只更换容器的转换默认不重新编码；还要求源视频和音频的编码与要求的编码相同、
+    不改变分辨率和帧率、源音频码率不明显高于要求的码率（同can_copy_audio），且输出容器可以直接容纳
+    源编码。修改了CRF、码率等设置或force_reencode为True时总是按设置重新编码
+    """
+    if params.get('force_reencode') or params.get('ladder'):
+        return False
+    quality = params.get('quality') or {}
+    if quality.get('rate_control') != 'source' and not is_default_quality(quality):
+        return False
+    container = os.path.splitext(output_file)[1].lower()[1:]
+    if os.path.splitext(input_file)[1].lower()[1:] == container:
+        return False
+    if ENCODER_CODEC_NAMES.get(params['video_codec']) != info.get('video_codec'):
+        return False
+    if info.get('audio_codec') and not can_copy_audio(info, params['audio_codec'], container,
+                                                      params.get('audio_bitrate')):
+        return False
+    if params['resize'] and tuple(params['resolution']) != (info.get('width'), info.get('height')):
+        return False
+    if params['fps'] and abs(params['fps'] - (info.get('fps') or 0)) > 0.01:
+        return False
+    return is_copy_compatible(info, container)
+
+
+def audio_codec_args(info, audio_codec, bitrate=None, container='mp4'):
+    """输出音频的编码参数：可以直接复制时复制音频流，否则按audio_codec和bitrate重新编码"""
+    if can_copy_audio(info, audio_codec, container, bitrate):
+        return ['-c:a', 'copy']
+    args = ['-c:a', audio_codec]
+    if bitrate:
+        args += ['-b:a', bitrate]
+    return args
+
+
+def profile_key(info):
+    """
+    生成用于比较的规格键（只有规格完全相同的输入才能直接复制拼接）
+
+    除分辨率、帧率、像素格式和音频规格外，还比较编码档次、级别和参数集（extradata），
+    SPS/PPS不同的H.264流直接复制到一起时，输出文件开头的参数集无法正确解码后面的片段
+    """
+    fps = info.get('fps')
+    return (
+        info.get('video_codec'),
+        info.get('video_profile'),
+        info.get('level'),
+        info.get('extradata_hash'),
+        info.get('width'),
+        info.get('height'),
+        round(fps, 3) if fps else None,
+        info.get('pix_fmt'),
+        info.get('audio_codec'),
+        info.get('sample_rate'),
+        info.get('channels'),
+    )
+
+
+def choose_target_profile(infos):
+    """
+    为拼接选择统一的目标规格
+
+    以出现次数最多的规格作为目标，输入全部符合时可以直接复制而不用重新编码
+    """
+    has_audio = any(info.get('audio_codec') for info in infos)
+
+    # 优先选择已经是H.264/AAC的规格
+    candidates = [info for info in infos
+                  if info.get('video_codec') == 'h264' and info.get('pix_fmt') == 'yuv420p'
+                  and (info.get('audio_codec') == 'aac' or not has_audio)]
+    if not candidates:
+        candidates = [info for info in infos if info.get('width') and info.get('height')]
+    if not candidates:
+        raise RuntimeError("无法获取视频规格")
+
+    key, _ = Counter(profile_key(info) for info in candidates).most_common(1)[0]
+    reference = next(info for info in candidates if profile_key(info) == key)
+
+    # 转换后的片段使用与直接复制的输入相同的编码档次和级别
+    h264 = reference.get('video_codec') == 'h264'
+    return {
+        'video_codec': 'h264',
+        'video_profile': reference.get('video_profile') if h264 else None,
+        'level': reference.get('level') if h264 else None,
+        'extradata_hash': reference.get('extradata_hash') if h264 else None,
+        'width': reference['width'],
+        'height': reference['height'],
+        'fps': reference.get('fps') or 30.0,
+        'frame_rate': reference.get('frame_rate') or '30',
+        'pix_fmt': 'yuv420p',
+        'audio_codec': 'aac' if has_audio else None,
+        'sample_rate': (reference.get('sample_rate') or 48000) if has_audio else None,
+        'channels': min(reference.get('channels') or 2, 2) if has_audio else None,
+    }
+
+
+def matches_profile(info, profile):
+    """判断输入是否已经符合目标规格"""
+    return profile_key(info) == profile_key(profile)
+
+
+def select_conform_inputs(infos, profile, reencode_joins=False):
+    """
+    选择拼接前需要转换为目标规格的输入，返回序号集合
+
+    libx264转换出的片段带有自己的参数集（SPS/PPS），与原始H.264流的参数集不同，不能与直接复制的
+    原始片段拼接在一起。因此只要有一个输入不符合目标规格，或者拼接点需要重新编码（reencode_joins，
+    如转场），就转换全部输入；否则全部直接复制
+    """
+    if reencode_joins or any(not matches_profile(info, profile) for info in infos):
+        return set(range(len(infos)))
+    return set()
+
+
+def profile_encoder_args(profile, quality=None):
+    """
+    按目标规格重新编码视频的编码参数，编码档次和级别与目标规格一致
+
+    拼接时所有重新编码的片段（转换后的输入、转场）都使用这些参数
+    """
+    args = ['-c:v', 'libx264'] + encoder_quality_args('libx264', quality)
+    x264_profile = X264_PROFILES.get(profile.get('video_profile'))
+    if x264_profile:
+        args += ['-profile:v', x264_profile]
+    if (profile.get('level') or 0) > 0:
+        args += ['-level', f"{profile['level'] / 10:.1f}"]
+    return args
+
+
+def conform_video_args(profile, quality=None):
+    """
+    转换为目标规格的视频滤镜和编码参数：保持宽高比缩放并填充黑边，统一帧率和像素格式
+    """
+    video_filter = (
+        f"{scale_filter(profile['width'], profile['height'], 'pad')},"
+        f"fps={profile['frame_rate']},format={profile['pix_fmt']}"
+    )
+    return ['-vf', video_filter] + profile_encoder_args(profile, quality)
+
+
+def conform_segment(input_file, output_file, profile, threads=0, progress_callback=None, keyframes=None,
+                    audio_gain=0, quality=None):
+    """
+    将一个输入转换为目标规格
+
+    缩放时保持宽高比并填充黑边；没有音轨的输入补一条静音音轨，保证所有片段流结构一致；
+    音频已经符合目标规格且不需要调整音量时直接复制。
+    keyframes为需要强制插入关键帧的时间点列表（秒），audio_gain为音频增益（dB），
+    quality为速度/质量设置（None表示默认方案）
+    """
+    info = probe_media(input_file)
+
+    args = ['-i', input_file]
+    if profile.get('audio_codec') and not info.get('audio_codec'):
+        layout = 'mono' if profile['channels'] == 1 else 'stereo'
+        args += ['-f', 'lavfi', '-i', f"anullsrc=channel_layout={layout}:sample_rate={profile['sample_rate']}",
+                 '-map', '0:v:0', '-map', '1:a:0', '-shortest']
+    else:
+        args += ['-map', '0:v:0']
+        if profile.get('audio_codec'):
+            args += ['-map', '0:a:0']
+
+    args += conform_video_args(profile, quality)
+    if profile.get('audio_codec'):
+        container = os.path.splitext(output_file)[1].lower()[1:]
+        if audio_gain:
+            args += ['-af', f"volume={audio_gain:.2f}dB"]
+            args += _profile_audio_args(profile)
+        elif can_copy_audio(info, profile['audio_codec'], container, None,
+                            profile['sample_rate'], profile['channels']):
+            # 音频已经符合目标规格，直接复制
+            args += ['-c:a', 'copy']
+        else:
+            args += _profile_audio_args(profile)
+    if keyframes:
+        args += ['-force_key_frames', ','.join(f"{t:.3f}" for t in keyframes)]
+    if threads:
+        args += ['-threads', str(threads)]
+    args += [output_file]
+
+    run_ffmpeg(args, duration=info.get('duration'), progress_callback=progress_callback)
+    return output_file
+
+
+def scale_filter(width, height, fit='pad', algorithm='bicubic'):
+    """
+    生成缩放滤镜
+
+    fit为'pad'时保持宽高比缩小到目标范围内并居中填充黑边，为'crop'时保持宽高比放大到
+    覆盖目标范围后居中裁剪，为'stretch'时直接拉伸；algorithm为swscale缩放算法
+    """
+    if fit == 'pad':
+        return (f"scale={width}:{height}:force_original_aspect_ratio=decrease:flags={algorithm},"
+                f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1")
+    if fit == 'crop':
+        return (f"scale={width}:{height}:force_original_aspect_ratio=increase:flags={algorithm},"
+                f"crop={width}:{height},setsar=1")
+    return f"scale={width}:{height}:flags={algorithm},setsar=1"
+
+
+def get_quality_profile(name=None):
+    """获取命名的速度/质量方案（副本），name为None时返回默认方案"""
+    return dict(QUALITY_PROFILES[name or DEFAULT_QUALITY_PROFILE])
+
+
+def is_default_quality(quality):
+    """判断速度/质量设置是否仍为默认方案（只比较方案中包含的项）"""
+    return all((quality or {}).get(key) == value for key, value in get_quality_profile().items())
+
+
+def encoder_quality_args(codec, quality=None, include_preset=True):
+    """
+    将速度/质量设置转换为指定编码器的ffmpeg参数
+
+    quality包含preset、rate_control（'crf'或'bitrate'）、crf和bitrate；
+    crf按x264的0-51刻度给出，其他编码器换算到各自的恒定质量参数（VP9的CRF、
+    MPEG-4的qscale、NVENC的CQ）。不支持的编码器返回空列表
+    """
+    quality = quality or get_quality_profile()
+    preset = quality.get('preset', 'medium')
+    speed = ENCODER_PRESETS.index(preset) if preset in ENCODER_PRESETS else ENCODER_PRESETS.index('medium')
+    constant_quality = quality.get('rate_control', 'crf') == 'crf'
+    crf = quality.get('crf', 23)
+    bitrate = quality.get('bitrate')
+
+    args = []
+    if codec in ('libx264', 'libx265'):
+        if include_preset:
+            args += ['-preset', preset]
+        args += ['-crf', str(crf)] if constant_quality else ['-b:v', bitrate]
+    elif codec in ('libvpx', 'libvpx-vp9'):
+        # cpu-used越小越慢、质量越好
+        args += ['-deadline', 'good', '-cpu-used', str((5, 5, 4, 4, 3, 2, 1, 1, 0)[speed])]
+        if codec == 'libvpx-vp9':
+            args += ['-row-mt', '1']
+        if constant_quality:
+            # VP9的CRF刻度为0-63；VP8的恒定质量模式需要同时给出码率上限
+            args += ['-crf', str(min(63, round(crf * 1.4))), '-b:v', '0' if codec == 'libvpx-vp9' else (bitrate or '10M')]
+        else:
+            args += ['-b:v', bitrate]
+    elif codec in ('mpeg4', 'libxvid'):
+        if constant_quality:
+            args += ['-q:v', str(min(31, max(2, round((crf - 13) / 2))))]
+        else:
+            args += ['-b:v', bitrate]
+        if speed >= ENCODER_PRESETS.index('slow'):
+            # 较慢档位使用率失真优化的宏块决策
+            args += ['-mbd', 'rd', '-trellis', '1']
+    elif codec.endswith('_nvenc'):
+        if include_preset:
+            args += ['-preset', f"p{(1, 1, 2, 3, 4, 4, 5, 6, 7)[speed]}"]
+        args += ['-rc', 'vbr', '-cq', str(crf), '-b:v', '0'] if constant_quality else ['-b:v', bitrate]
+    elif not constant_quality and bitrate and codec not in ('rawvideo', 'gif'):
+        args += ['-b:v', bitrate]
+    return args
+
+
+def _profile_audio_args(profile):
+    """目标规格的音频编码参数"""
+    return ['-c:a', 'aac', '-ar', str(profile['sample_rate']), '-ac', str(profile['channels']), '-b:a', '192k']
+
+
+def target_video_bitrate(target_bytes, duration, audio_bitrate=None):
+    """
+    按目标文件大小计算视频码率（比特/秒）
+
+    从总码率中扣除音频码率和容器开销；剩余码率过低时抛出RuntimeError
+    """
+    if not duration:
+        raise RuntimeError("无法获取视频时长，不能按目标大小编码")
+    total = target_bytes * 8 * (1 - CONTAINER_OVERHEAD) / duration
+    video_bitrate = int(total - (bitrate_value(audio_bitrate) if audio_bitrate else 0))
+    if video_bitrate < 50000:
+        raise RuntimeError(f"目标大小 {target_bytes / 1024 ** 2:.1f} MB 对 {duration:.0f} 秒的视频过小")
+    return video_bitrate
+
+
+def two_pass_args(pass_number, stats_prefix):
+    """两遍编码第pass_number遍的参数，统计文件写入stats_prefix开头的文件"""
+    return ['-pass', str(pass_number), '-passlogfile', stats_prefix]
+
+
+def find_keyframes(file_path, start, end):
+    """
+    返回[start, end]区间内视频关键帧的时间（秒，升序）
+
+    只读取该区间附近的数据，不解码整个文件
+    """
+    start = max(start, 0)
+    ffprobe = get_ffprobe_exe()
+    times = []
+    if ffprobe:
+        # 读取数据包头的关键帧标志，不需要解码
+        cmd = [ffprobe, '-v', 'error', '-select_streams', 'v:0',
+               '-read_intervals', f"{start:.3f}%{end:.3f}",
+               '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', file_path]
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True, encoding='utf-8', errors='replace',
+                                **_popen_kwargs())
+        for line in result.stdout.splitlines():
+            parts = line.strip().split(',')
+            if len(parts) >= 2 and parts[-1].startswith('K'):
+                pts_time = _to_float(parts[0])
+                if pts_time is not None:
+                    times.append(pts_time)
+    else:
+        # 只解码关键帧，通过showinfo获取时间戳
+        cmd = [get_ffmpeg_exe(), '-hide_banner', '-nostdin', '-skip_frame', 'nokey', '-copyts',
+               '-ss', f"{start:.3f}", '-t', f"{end - start:.3f}", '-i', file_path,
+               '-map', '0:v:0', '-vf', 'showinfo', '-f', 'null', '-']
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                universal_newlines=True, encoding='utf-8', errors='replace',
+                                **_popen_kwargs())
+        times = [float(t) for t in re.findall(r"pts_time:\s*([\d.]+)", result.stderr)]
+
+    return sorted(t for t in times if start - 0.001 <= t <= end + 0.001)
+
+
+def crossfade_segment(first_file, first_start, first_end, second_file, second_end,
+                      transition, duration, profile, output_file, threads=0, audio_gains=(0, 0), quality=None):
+    """
+    生成两个片段之间的转场
+
+    只解码first的[first_start, first_end]和second的[0, second_end]，
+    在重叠的duration秒内做交叉淡化后按目标规格编码，输出时长为两段之和减去duration。
+    audio_gains为两个输入各自的音频增益（dB），quality为速度/质量设置
+    """
+    first_length = first_end - first_start
+    args = ['-ss', f"{first_start:.6f}", '-t', f"{first_length:.6f}", '-i', first_file,
+            '-t', f"{second_end:.6f}", '-i', second_file]
+
+    frame_rate = profile['frame_rate']
+    graph = (
+        f"[0:v:0]settb=AVTB,setpts=PTS-STARTPTS,fps={frame_rate}[v0];"
+        f"[1:v:0]settb=AVTB,setpts=PTS-STARTPTS,fps={frame_rate}[v1];"
+        f"[v0][v1]xfade=transition={transition}:duration={duration:.3f}:offset={first_length - duration:.6f},"
+        f"format={profile['pix_fmt']}[v]"
+    )
+    if profile.get('audio_codec'):
+        graph += (
+            f";[0:a:0]asetpts=PTS-STARTPTS,volume={audio_gains[0] or 0:.2f}dB[a0];"
+            f"[1:a:0]asetpts=PTS-STARTPTS,volume={audio_gains[1] or 0:.2f}dB[a1];"
+            f"[a0][a1]acrossfade=d={duration:.3f}[a]"
+        )
+
+    args += ['-filter_complex', graph, '-map', '[v]'] + profile_encoder_args(profile, quality)
+    if profile.get('audio_codec'):
+        args += ['-map', '[a]'] + _profile_audio_args(profile)
+    if threads:
+        args += ['-threads', str(threads)]
+    args += [output_file]
+
+    run_ffmpeg(args)
+    return output_file
+
+
+def _even(value):
+    """取不大于value的偶数（yuv420p要求宽高为偶数）"""
+    return max(int(value) // 2 * 2, 2)
+
+
+def mosaic_cells(layout, count, width, height, grid_size=None):
+    """
+    计算合成画面中每个输入的位置和大小 [(x, y, 宽, 高)]
+
+    layout为'grid'时平铺为grid_size x grid_size的网格（grid_size为None时按输入数量自动选择行列数），
+    为'pip'时第一个输入铺满画面，其余输入缩小到1/4叠加在右下角并向上排列
+    """
+    if layout == 'grid':
+        columns = grid_size or math.ceil(math.sqrt(count))
+        rows = grid_size or math.ceil(count / columns)
+        if columns * rows < count:
+            raise RuntimeError(f"{columns}x{rows}网格最多容纳{columns * rows}个视频")
+        cell_width, cell_height = _even(width / columns), _even(height / rows)
+        return [((i % columns) * cell_width, (i // columns) * cell_height, cell_width, cell_height)
+                for i in range(count)]
+    if layout == 'pip':
+        pip_width, pip_height = _even(width / 4), _even(height / 4)
+        margin = _even(min(width, height) / 40)
+        if margin + (count - 1) * (pip_height + margin) > height:
+            raise RuntimeError(f"画中画最多叠加{(height - margin) // (pip_height + margin)}个视频")
+        cells = [(0, 0, width, height)]
+        for i in range(1, count):
+            cells.append((width - pip_width - margin, height - i * (pip_height + margin), pip_width, pip_height))
+        return cells
+    raise ValueError(f"未知的合成布局: {layout}")
+
+
+def compose_mosaic(input_files, output_file, layout, profile, grid_size=None, audio_mode='first',
+                   audio_gains=None, threads=0, progress_callback=None, quality=None):
+    """
+    在一个滤镜图中将多个输入合成为网格或画中画
+
+    所有输入由同一个ffmpeg进程同时解码（每个输入有独立的解码线程），缩放到所在格子大小后
+    用xstack/overlay拼成profile指定大小的画面，只编码一次。
+    audio_mode为'first'时使用第一个有音轨的输入的音频，为'mix'时混合所有音轨；
+    audio_gains为各输入的音频增益（dB），quality为速度/质量设置（None时使用草稿方案以保证速度）
+    """
+    infos = [probe_media(path) for path in input_files]
+    width, height = _even(profile['width']), _even(profile['height'])
+    cells = mosaic_cells(layout, len(input_files), width, height, grid_size)
+    cpu_count = os.cpu_count() or 1
+    decode_threads = max(1, cpu_count // len(input_files))
+
+    args = []
+    for path in input_files:
+        args += ['-threads', str(decode_threads), '-i', path]
+
+    frame_rate = profile['frame_rate']
+    graph = []
+    for i, (_, _, cell_width, cell_height) in enumerate(cells):
+        graph.append(f"[{i}:v:0]{scale_filter(cell_width, cell_height, 'pad')},fps={frame_rate}[v{i}]")
+    if layout == 'grid':
+        if len(cells) > 1:
+            positions = '|'.join(f"{x}_{y}" for x, y, _, _ in cells)
+            inputs = ''.join(f"[v{i}]" for i in range(len(cells)))
+            stack = f"{inputs}xstack=inputs={len(cells)}:layout={positions}:fill=black,"
+        else:
+            stack = "[v0]"
+        graph.append(f"{stack}pad={width}:{height},format={profile['pix_fmt']}[v]")
+        duration = max(info.get('duration') or 0 for info in infos)
+    else:
+        previous = 'v0'
+        for i, (x, y, _, _) in enumerate(cells[1:], start=1):
+            graph.append(f"[{previous}][v{i}]overlay={x}:{y}:eof_action=pass[o{i}]")
+            previous = f"o{i}"
+        graph.append(f"[{previous}]format={profile['pix_fmt']}[v]")
+        # 画中画以主画面的时长为准
+        duration = infos[0].get('duration')
+
+    audio_indexes = [i for i, info in enumerate(infos) if info.get('audio_codec')]
+    if audio_mode != 'mix':
+        audio_indexes = audio_indexes[:1]
+    gains = audio_gains or [0] * len(input_files)
+    if audio_indexes:
+        for i in audio_indexes:
+            graph.append(f"[{i}:a:0]volume={gains[i] or 0:.2f}dB[a{i}]")
+        if len(audio_indexes) > 1:
+            inputs = ''.join(f"[a{i}]" for i in audio_indexes)
+            graph.append(f"{inputs}amix=inputs={len(audio_indexes)}:duration=longest[a]")
+        else:
+            graph.append(f"[a{audio_indexes[0]}]anull[a]")
+
+    args += ['-filter_complex', ';'.join(graph), '-filter_complex_threads', str(cpu_count),
+             '-map', '[v]', '-c:v', 'libx264']
+    args += encoder_quality_args('libx264', quality or get_quality_profile('draft'))
+    if audio_indexes:
+        args += ['-map', '[a]', '-c:a', 'aac', '-b:a', '192k']
+    if duration:
+        args += ['-t', f"{duration:.3f}"]
+    if threads:
+        args += ['-threads', str(threads)]
+    args += ['-movflags', '+faststart', output_file]
+
+    run_ffmpeg(args, duration=duration, progress_callback=progress_callback)
+    return output_file
+
+
+def bitrate_value(bitrate):
+    """将 '5000k'、'5M' 形式的码率转换为bit/s"""
+    text = str(bitrate).strip().lower()
+    scale = {'k': 1000, 'm': 1000000}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * scale)
+
+
+def ladder_filter(renditions, fps=None, fit='pad', algorithm='bicubic'):
+    """
+    生成码率阶梯的滤镜图
+
+    源视频只解码一次，（按需转换帧率后）分成多路，每路缩放到对应规格，输出标签为[v0]、[v1]...
+    """
+    prefix = f"[0:v:0]fps={fps}," if fps else "[0:v:0]"
+    count = len(renditions)
+    if count == 1:
+        graph = [f"{prefix}null[s0]"]
+    else:
+        graph = [f"{prefix}split={count}" + ''.join(f"[s{i}]" for i in range(count))]
+    for i, rendition in enumerate(renditions):
+        width, height = _even(rendition['width']), _even(rendition['height'])
+        graph.append(f"[s{i}]{scale_filter(width, height, fit, algorithm)},format=yuv420p[v{i}]")
+    return ';'.join(graph)
+
+
+def _stream_option(option, index):
+    """为编码参数加上第index路视频流的说明符，index为None时原样返回"""
+    if index is None:
+        return option
+    return f"{option}:{index}" if option.endswith(':v') else f"{option}:v:{index}"
+
+
+def rendition_encoder_args(rendition, video_codec, quality=None, keyframe_interval=None, fps=None, index=None):
+    """
+    一档码率阶梯的视频编码参数
+
+    rendition中给出bitrate时按该码率编码并限制峰值码率，否则使用quality中的恒定质量设置；
+    keyframe_interval（秒）不为空时在固定时间点插入关键帧并关闭场景切换关键帧，
+    使各档的关键帧位置完全一致。index为该档在同一个输出中的视频流序号（多档写入同一个输出时使用）
+    """
+    quality = dict(quality or get_quality_profile())
+    if rendition.get('bitrate'):
+        quality.update(rate_control='bitrate', bitrate=rendition['bitrate'])
+
+    args = ['-c:v', video_codec] + encoder_quality_args(video_codec, quality)
+    if quality.get('rate_control') == 'bitrate':
+        bitrate = bitrate_value(quality['bitrate'])
+        args += ['-maxrate', str(int(bitrate * 1.07)), '-bufsize', str(int(bitrate * 1.5))]
+    if keyframe_interval:
+        args += ['-force_key_frames', f"expr:gte(t,n_forced*{keyframe_interval})"]
+        if fps:
+            args += ['-g', str(max(1, round(keyframe_interval * fps)))]
+        if video_codec == 'libx264':
+            args += ['-sc_threshold', '0']
+        elif video_codec == 'libx265':
+            args += ['-x265-params', 'scenecut=0']
+    # 参数成对出现，只给参数名加流说明符
+    return [_stream_option(arg, index) if j % 2 == 0 else arg for j, arg in enumerate(args)]
+
+
+def encode_ladder(input_file, outputs, renditions, video_codec='libx264', audio_codec='aac', fps=None,
+                  quality=None, fit='pad', algorithm='bicubic', keyframe_interval=None, threads=0,
+                  progress_callback=None):
+    """
+    一次解码输出多档码率
+
+    同一个ffmpeg进程解码源视频一次，分路缩放后交给各档的编码器并行编码，
+    总耗时接近最慢一档单独编码的耗时。outputs与renditions一一对应；threads为每个编码器的线程数
+    """
+    info = probe_media(input_file)
+    args = ['-i', input_file, '-filter_complex', ladder_filter(renditions, fps, fit, algorithm)]
+    for i, (output_file, rendition) in enumerate(zip(outputs, renditions)):
+        args += ['-map', f"[v{i}]"]
+        args += rendition_encoder_args(rendition, video_codec, quality, keyframe_interval, fps)
+        if threads:
+            args += ['-threads', str(threads)]
+        if info.get('audio_codec'):
+            args += ['-map', '0:a:0', '-c:a', audio_codec, '-b:a', rendition.get('audio_bitrate') or '128k']
+        if os.path.splitext(output_file)[1].lower() in ('.mp4', '.mov'):
+            args += ['-movflags', '+faststart']
+        args += [output_file]
+
+    run_ffmpeg(args, duration=info.get('duration'), progress_callback=progress_callback)
+    return outputs
+
+
+def package_stream(input_file, manifest_file, renditions, package_format='hls', segment_type='mpegts',
+                   segment_duration=6, video_codec='libx264', audio_codec='aac', fps=None, quality=None,
+                   fit='pad', algorithm='bicubic', threads=0, progress_callback=None):
+    """
+    编码并打包为HLS或DASH流媒体
+
+    与encode_ladder相同，源视频只解码一次并同时编码所有档位，编码结果直接写成分片，
+    不需要先输出完整文件再打包。各档每segment_duration秒强制插入关键帧，
+    分片边界在所有档位中对齐，播放器可以在任意分片处切换码率。
+    manifest_file为主清单路径（HLS为master播放列表，DASH为MPD），分片写入同一目录；
+    HLS的segment_type为'mpegts'或'fmp4'，DASH总是使用fMP4分片
+    """
+    info = probe_media(input_file)
+    has_audio = bool(info.get('audio_codec'))
+    output_dir = os.path.dirname(os.path.abspath(manifest_file))
+    os.makedirs(output_dir, exist_ok=True)
+
+    args = ['-i', input_file, '-filter_complex', ladder_filter(renditions, fps, fit, algorithm)]
+    for i, rendition in enumerate(renditions):
+        args += ['-map', f"[v{i}]"]
+        # HLS的每个变体流都带有自己的音轨，DASH的所有档位共用一路音频
+        if has_audio and (package_format == 'hls' or i == 0):
+            args += ['-map', '0:a:0']
+    for i, rendition in enumerate(renditions):
+        args += rendition_encoder_args(rendition, video_codec, quality, segment_duration, fps, index=i)
+    if has_audio:
+        args += ['-c:a', audio_codec]
+        for i, rendition in enumerate(renditions if package_format == 'hls' else renditions[:1]):
+            args += [f"-b:a:{i}", rendition.get('audio_bitrate') or '128k']
+    if threads:
+        args += ['-threads', str(threads)]
+
+    if package_format == 'hls':
+        fmp4 = segment_type == 'fmp4'
+        stream_map = ' '.join(
+            f"v:{i},a:{i},name:{rendition['name']}" if has_audio else f"v:{i},name:{rendition['name']}"
+            for i, rendition in enumerate(renditions))
+        args += ['-f', 'hls', '-hls_time', str(segment_duration), '-hls_playlist_type', 'vod',
+                 '-hls_flags', 'independent_segments', '-hls_segment_type', segment_type,
+                 '-hls_segment_filename', os.path.join(output_dir, '%v', f"segment_%05d.{'m4s' if fmp4 else 'ts'}"),
+                 '-master_pl_name', os.path.basename(manifest_file), '-var_stream_map', stream_map]
+        if fmp4:
+            args += ['-hls_fmp4_init_filename', 'init.mp4']
+        args += [os.path.join(output_dir, '%v', 'index.m3u8')]
+    else:
+        adaptation_sets = 'id=0,streams=v id=1,streams=a' if has_audio else 'id=0,streams=v'
+        args += ['-f', 'dash', '-seg_duration', str(segment_duration), '-use_template', '1',
+                 '-use_timeline', '1', '-adaptation_sets', adaptation_sets,
+                 '-init_seg_name', 'init-$RepresentationID$.m4s',
+                 '-media_seg_name', 'chunk-$RepresentationID$-$Number%05d$.m4s', manifest_file]
+
+    run_ffmpeg(args, duration=info.get('duration'), progress_callback=progress_callback)
+    return manifest_file
+
+
+def animation_filter(fps=12, width=0, dither='sierra2_4a', max_colors=256, decimate=False, palette=True,
+                     algorithm='lanczos'):
+    """
+    生成动图的滤镜
+
+    先降低帧率、按需去除重复帧，再缩放到width宽（0为原始宽度，高度按比例计算）；
+    palette为True时（GIF）将画面分为两路，一路统计生成调色板，另一路按调色板和抖动算法量化，
+    两遍处理在同一个滤镜图中完成，不需要中间文件
+    """
+    filters = [f"fps={fps}"]
+    if decimate:
+        # 丢弃与前一帧几乎相同的帧，静止画面较多时文件明显变小
+        filters.append('mpdecimate')
+    if width:
+        filters.append(f"scale={width}:-1:flags={algorithm}")
+    graph = ','.join(filters)
+
+    if not palette:
+        return graph
+    dither_args = 'dither=bayer:bayer_scale=3' if dither == 'bayer' else f"dither={dither}"
+    return (f"{graph},split[a][b];[a]palettegen=max_colors={max_colors}:stats_mode=diff[p];"
+            f"[b][p]paletteuse={dither_args}:diff_mode=rectangle")
+
+
+def export_animation(input_file, output_file, fps=12, width=0, loop=0, dither='sierra2_4a', max_colors=256,
+                     decimate=False, webp_quality=75, threads=0, progress_callback=None):
+    """
+    导出GIF或WebP动图（按输出文件扩展名决定格式）
+
+    解码、抽帧、缩放、调色板生成和编码在同一个ffmpeg进程中完成。
+    loop为循环次数（0为无限循环）；GIF使用调色板和抖动，WebP使用有损压缩，webp_quality为0-100
+    """
+    info = probe_media(input_file)
+    is_webp = os.path.splitext(output_file)[1].lower() == '.webp'
+
+    args = ['-i', input_file]
+    if is_webp:
+        args += ['-map', '0:v:0', '-vf', animation_filter(fps, width, decimate=decimate, palette=False),
+                 '-c:v', 'libwebp', '-lossless', '0', '-q:v', str(webp_quality),
+                 '-compression_level', '4', '-loop', str(loop)]
+    else:
+        graph = animation_filter(fps, width, dither, max_colors, decimate)
+        args += ['-filter_complex', f"[0:v:0]{graph}[v]", '-map', '[v]', '-c:v', 'gif', '-loop', str(loop)]
+    if decimate:
+        # 去除重复帧后按可变帧率输出，保留每帧的实际显示时长
+        # （-fps_mode需要ffmpeg 5.1以上，使用各版本都支持的-vsync）
+        args += ['-vsync', 'vfr']
+    if threads:
+        args += ['-threads', str(threads)]
+    args += [output_file]
+
+    run_ffmpeg(args, duration=info.get('duration'), progress_callback=progress_callback)
+    return output_file
+
+
+def _escape_concat_path(path):
+    """转义concat列表中的文件路径"""
+    return os.path.abspath(path).replace('\\', '/').replace("'", "'\\''")
+
+
+def concat_copy(input_files, output_file, work_dir, duration=None, progress_callback=None, audio_file=None):
+    """
+    使用concat分离器以流复制方式拼接规格一致的文件
+
+    给出audio_file时只拼接视频流，音频取自该文件
+    """
+    list_file = os.path.join(work_dir, "concat_list.txt")
+    with open(list_file, 'w', encoding='utf-8') as f:
+        for path in input_files:
+            f.write(f"file '{_escape_concat_path(path)}'\n")
+
+    args = ['-f', 'concat', '-safe', '0', '-i', list_file]
+    if audio_file:
+        args += ['-i', audio_file, '-map', '0:v', '-map', '1:a']
+    else:
+        args += ['-map', '0:v', '-map', '0:a?']
+    args += ['-c', 'copy']
+    if os.path.splitext(output_file)[1].lower() in ('.mp4', '.mov'):
+        args += ['-movflags', '+faststart']
+    args += [output_file]
+    run_ffmpeg(args, duration=duration, progress_callback=progress_callback)
+    return output_file
+
+
+def _parse_clock(value):
+    """解析 HH:MM:SS.ffffff 形式的时长（mkv的DURATION标签）"""
+    match = re.match(r"(\d+):(\d+):(\d+(?:\.\d+)?)", value or "")
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def probe_stream_timing(file_path):
+    """
+    读取容器的起始时间以及视频流、音频流的 (起始时间, 时长)（秒）
+
+    用于换算关键帧时间和检查分段拼接处的时间戳；没有ffprobe时返回None
+    """
+    ffprobe = get_ffprobe_exe()
+    if not ffprobe:
+        return None
+    cmd = [ffprobe, '-v', 'error',
+           '-show_entries', 'format=start_time,duration:stream=codec_type,start_time,duration'
+                            ':stream_disposition=attached_pic:stream_tags=DURATION',
+           '-of', 'json', file_path]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True, encoding='utf-8', errors='replace',
+                            **_popen_kwargs())
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe无法读取文件: {result.stderr.strip()}")
+
+    data = json.loads(result.stdout or "{}")
+    fmt = data.get('format', {})
+    timing = {'start_time': _to_float(fmt.get('start_time')) or 0.0, 'video': None, 'audio': None}
+    for stream in data.get('streams', []):
+        codec_type = stream.get('codec_type')
+        if codec_type not in ('video', 'audio') or timing[codec_type] is not None:
+            continue
+        if stream.get('disposition', {}).get('attached_pic'):
+            continue
+        # mkv的流时长记录在DURATION标签中
+        duration = _to_float(stream.get('duration'))
+        if duration is None:
+            duration = _parse_clock(stream.get('tags', {}).get('DURATION'))
+        if duration is None:
+            duration = _to_float(fmt.get('duration'))
+        timing[codec_type] = (_to_float(stream.get('start_time')) or 0.0, duration)
+    return timing
+
+
+def chunk_boundaries(file_path, duration, count, start_time=0.0, search_window=10.0):
+    """
+    把视频按时长等分为count段，返回各段的 (起始, 结束) 时间（秒，从0开始）
+
+    切点取每个等分点之后search_window秒内的第一个关键帧，各段都从关键帧开始解码，
+    不需要读取前一段的数据；附近没有关键帧的切点被跳过，实际段数可能少于count
+    """
+    points = [0.0]
+    for i in range(1, count):
+        target = duration * i / count
+        keyframes = find_keyframes(file_path, start_time + target, start_time + target + search_window)
+        for keyframe in keyframes:
+            point = keyframe - start_time
+            if points[-1] + 1.0 < point < duration - 1.0:
+                points.append(point)
+                break
+    points.append(duration)
+    return list(zip(points[:-1], points[1:]))
+
+
+def check_chunk_seams(chunk_files, expected_durations, fps):
+    """
+    检查分段编码的结果
+
+    每段视频都应从0开始，且时长与该段的帧数一致（允许1.5帧的误差），
+    否则拼接后接缝处的时间戳会出现空洞或重叠。expected_durations中为None的段不检查时长。
+    返回各段的 (起始时间, 时长)；没有ffprobe时返回None，发现异常时抛出RuntimeError
+    """
+    tolerance = 1.5 / fps
+    seams = []
+    for i, (chunk_file, expected) in enumerate(zip(chunk_files, expected_durations)):
+        timing = probe_stream_timing(chunk_file)
+        if timing is None:
+            logger.warning("没有ffprobe，跳过分段接缝检查")
+            return None
+        if timing['video'] is None:
+            raise RuntimeError(f"第{i + 1}段没有视频流")
+        start, chunk_duration = timing['video']
+        if abs(start) > tolerance:
+            raise RuntimeError(f"第{i + 1}段的时间戳从 {start:.3f} 秒开始，拼接后会出现空洞")
+        if expected is not None and chunk_duration is not None and abs(chunk_duration - expected) > tolerance:
+            raise RuntimeError(f"第{i + 1}段时长为 {chunk_duration:.3f} 秒，预期 {expected:.3f} 秒")
+        seams.append(timing['video'])
+    return seams
+
+
+def check_av_sync(file_path, expected_duration, fps):
+    """
+    检查拼接结果：视频总时长与各段之和一致，音频与视频的起始时间相差不超过一帧
+
+    返回 (视频时长, 音视频起始时间差)；没有ffprobe时返回None，发现异常时抛出RuntimeError
+    """
+    timing = probe_stream_timing(file_path)
+    if timing is None or timing['video'] is None:
+        return None
+    video_start, video_duration = timing['video']
+    if video_duration is not None and expected_duration and abs(video_duration - expected_duration) > 2.0 / fps:
+        raise RuntimeError(f"拼接后视频时长为 {video_duration:.3f} 秒，预期 {expected_duration:.3f} 秒")
+    offset = 0.0
+    if timing['audio'] is not None:
+        offset = timing['audio'][0] - video_start
+        if abs(offset) > 1.0 / fps:
+            raise RuntimeError(f"拼接后音频与视频相差 {offset:.3f} 秒")
+    return video_duration, offset
+
+
+def sample_segments(duration, count=3, length=5.0):
+    """
+    在视频中均匀选取count段代表性片段，返回 [(起始, 时长)]
+
+    片段中心分别位于时长的 1/(count+1)、2/(count+1)……处，避开片头片尾；视频很短时只取整段
+    """
+    if not duration or duration <= length * count:
+        return [(0.0, duration or length)]
+    return [(max(0.0, duration * (i + 1) / (count + 1) - length / 2), length) for i in range(count)]
+
+
+def measure_quality(distorted_file, reference_file, metric='ssim'):
+    """
+    用ffmpeg内置的ssim/psnr滤镜比较编码结果与参考视频，返回整段的平均值
+
+    SSIM取全部分量的综合值（0-1），PSNR取平均值（dB，完全相同时为inf）
+    """
+    cmd = [get_ffmpeg_exe(), '-hide_banner', '-nostdin', '-nostats',
+           '-i', distorted_file, '-i', reference_file,
+           '-lavfi', f"[0:v][1:v]{metric}", '-f', 'null', '-']
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            universal_newlines=True, encoding='utf-8', errors='replace',
+                            **_popen_kwargs())
+    if result.returncode != 0:
+        message = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else ""
+        raise RuntimeError(f"画质测量失败: {message}")
+
+    # 滤镜在结束时打印汇总行，例如 "SSIM Y:0.98 ... All:0.985 (18.2)"、"PSNR y:... average:42.1 ..."
+    pattern = r"SSIM .*?All:([\d.]+|inf)" if metric == 'ssim' else r"PSNR .*?average:([\d.]+|inf)"
+    match = re.search(pattern, result.stderr)
+    if not match:
+        raise RuntimeError(f"无法解析{metric.upper()}结果")
+    return float(match.group(1))
+
+
+def measure_loudness(file_path):
+    """
+    测量音轨的EBU R128响度（loudnorm第一遍分析）
+
+    返回包含input_i（综合响度，LUFS）、input_tp（真峰值，dBTP）、input_lra、input_thresh的字典，
+    没有音轨时返回None
+    """
+    cmd = [get_ffmpeg_exe(), '-hide_banner', '-nostdin', '-nostats', '-i', file_path,
+           '-map', '0:a:0?', '-vn', '-af', 'loudnorm=print_format=json', '-f', 'null', '-']
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            universal_newlines=True, encoding='utf-8', errors='replace',
+                            **_popen_kwargs())
+    if result.returncode != 0:
+        message = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else ""
+        raise RuntimeError(f"响度测量失败: {message}")
+
+    # loudnorm在输出末尾打印JSON
+    match = re.search(r"\{[^{}]*\"input_i\"[^{}]*\}", result.stderr)
+    if not match:
+        return None
+    data = json.loads(match.group(0))
+    return {key: _to_float(data.get(key)) for key in ('input_i', 'input_tp', 'input_lra', 'input_thresh')}
+
+
+def loudness_gain(measurement, target_lufs=-23.0, max_true_peak=-1.0):
+    """
+    根据测量结果计算使响度达到目标值的增益（dB）
+
+    增益受真峰值限制，避免放大后削波；静音或无法测量时返回0
+    """
+    if not measurement:
+        return 0.0
+    input_i = measurement.get('input_i')
+    input_tp = measurement.get('input_tp')
+    if input_i is None or input_i < -70 or input_i != input_i or abs(input_i) == float('inf'):
+        return 0.0
+    gain = target_lufs - input_i
+    if input_tp is not None and abs(input_tp) != float('inf'):
+        gain = min(gain, max_true_peak - input_tp)
+    return round(gain, 2)
+
+
+class StreamingConcatWriter:
+    """
+    流式拼接写入器
+
+    启动一个从标准输入读取MPEG-TS的ffmpeg进程，各片段按顺序以流复制方式转封装后写入，
+    并依次累加时间戳偏移。任意时刻只打开当前正在写入的一个片段，
+    内存和文件句柄占用与片段数量无关
+    """
+
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self.offset = 0.0
+        self._stderr = tempfile.TemporaryFile()
+        cmd = [get_ffmpeg_exe(), '-hide_banner', '-y', '-loglevel', 'error',
+               '-f', 'mpegts', '-i', 'pipe:0',
+               '-map', '0:v', '-map', '0:a?', '-c', 'copy']
+        if os.path.splitext(output_file)[1].lower() in ('.mp4', '.mov'):
+            cmd += ['-movflags', '+faststart']
+        cmd += [output_file]
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                        stderr=self._stderr, **_popen_kwargs())
+
+    def _error_message(self, stderr_file, returncode):
+        stderr_file.seek(0)
+        stderr = stderr_file.read().decode('utf-8', errors='replace').strip()
+        return stderr.splitlines()[-1] if stderr else f"返回码 {returncode}"
+
+    def append(self, input_file, duration, start=None, end=None, audio_gain=None):
+        """
+        以流复制方式写入一个片段，duration为写入部分的时长（秒）
+
+        指定start/end时只写入该区间，start应位于关键帧上；
+        audio_gain为None时音频也直接复制，指定增益（dB，可以为0）时视频仍直接复制，只重新编码音频
+        """
+        cmd = [get_ffmpeg_exe(), '-hide_banner', '-nostdin', '-loglevel', 'error']
+        if start:
+            cmd += ['-ss', f"{start:.6f}"]
+        if end is not None:
+            cmd += ['-to', f"{end:.6f}"]
+        cmd += ['-i', input_file, '-map', '0:v:0', '-map', '0:a:0?', '-c', 'copy']
+        if audio_gain is not None:
+            cmd += ['-af', f"volume={audio_gain:.2f}dB", '-c:a', 'aac', '-b:a', '192k']
+        cmd += ['-output_ts_offset', f"{self.offset:.6f}", '-f', 'mpegts', 'pipe:1']
+        with tempfile.TemporaryFile() as stderr:
+            remux = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr, **_popen_kwargs())
+            try:
+                shutil.copyfileobj(remux.stdout, self.process.stdin, self.CHUNK_SIZE)
+            except (BrokenPipeError, OSError):
+                remux.kill()
+                self.process.wait()
+                raise RuntimeError(f"ffmpeg拼接失败: {self._error_message(self._stderr, self.process.returncode)}")
+            finally:
+                remux.stdout.close()
+                remux.wait()
+            if remux.returncode != 0:
+                raise RuntimeError(f"ffmpeg转封装失败: {self._error_message(stderr, remux.returncode)}")
+
+        self.offset += duration or 0
+
+    def close(self):
+        """结束写入并等待输出文件完成"""
+        try:
+            self.process.stdin.close()
+            self.process.wait()
+            if self.process.returncode != 0:
+                raise RuntimeError(f"ffmpeg拼接失败: {self._error_message(self._stderr, self.process.returncode)}")
+        finally:
+            self._stderr.close()
+
+    def abort(self):
+        """中止写入"""
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        self._stderr.close()
@@ -6,7 +6,7 @@ import os
 import logging
 import traceback
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QTabWidget, 
-                            QVBoxLayout, QWidget, QLabel, QStatusBar, QMessageBox)
+                            QVBoxLayout, QWidget, QLabel, QStatusBar, QMessageBox, QPushButton)
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QIcon
 
@@ -83,6 +83,15 @@ except (ImportError, ValueError) as e:
             logger.debug(traceback.format_exc())
             VideoConvertTab = None
 
+try:
+    from .cache_dialog import ResultCacheDialog
+except (ImportError, ValueError):
+    try:
+        from video_editor_app.cache_dialog import ResultCacheDialog
+    except ImportError as e:
+        logger.error(f"导入ResultCacheDialog时出错: {str(e)}")
+        ResultCacheDialog = None
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -178,6 +187,13 @@ class MainWindow(QMainWindow):
         self.setStatusBar(self.statusBar)
         self.statusBar.showMessage("就绪")
         
+        # 结果缓存管理
+        if ResultCacheDialog is not None:
+            cache_button = QPushButton("结果缓存")
+            cache_button.setFlat(True)
+            cache_button.clicked.connect(self.show_result_cache)
+            self.statusBar.addPermanentWidget(cache_button)
+        
         # 设置样式
         self.setStyleSheet("""
             QMainWindow {
@@ -213,6 +229,10 @@ class MainWindow(QMainWindow):
         """)
         
         logger.info("MainWindow初始化完成")
+        
+    def show_result_cache(self):
+        """打开结果缓存管理对话框"""
+        ResultCacheDialog(self).exec()
 
 def main():
     try:
@@ -2,68 +2,934 @@
 # -*- coding: utf-8 -*-
 
 import os
-import cv2
+import re
+import queue
+import time
+import shutil
+import logging
 import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, 
                             QLabel, QFileDialog, QProgressBar, QMessageBox, 
-                            QFrame, QTableWidget, QTableWidgetItem, QHeaderView,
-                            QCheckBox, QDialog, QLineEdit, QFormLayout, QStyle)
-from PyQt5.QtCore import Qt, QSize, pyqtSignal, QThread, QUrl
+                            QFrame, QTableView, QAbstractItemView, QHeaderView,
+                            QStyledItemDelegate, QStyleOptionButton, QApplication,
+                            QDialog, QLineEdit, QFormLayout, QStyle, QComboBox,
+                            QDoubleSpinBox, QCheckBox)
+from PyQt5.QtCore import (Qt, QSize, pyqtSignal, QThread, QUrl, QTimer, QRect, QEvent,
+                          QAbstractTableModel, QModelIndex)
 from PyQt5.QtGui import QIcon, QDrag, QPixmap, QPainter, QColor
-from moviepy.editor import VideoFileClip, concatenate_videoclips
+
+try:
+    from .ffmpeg_utils import (probe_media, choose_target_profile, profile_key, select_conform_inputs,
+                               is_mp4_copy_compatible, conform_segment, concat_copy,
+                               find_keyframes, crossfade_segment, measure_loudness, loudness_gain,
+                               compose_mosaic, get_quality_profile, QUALITY_PROFILE_LABELS,
+                               DEFAULT_QUALITY_PROFILE, StreamingConcatWriter, conform_video_args)
+    from .cache_utils import (get_cache_dir, file_fingerprint, make_cache_key, JsonCache, SegmentCache,
+                              ResultCache)
+    from .resource_utils import plan_encoding, plan_parallel_jobs
+    from .estimate_utils import (EncodeHistory, encode_signature, sample_encode, encode_rates, output_pixels,
+                                 audio_bytes, with_overhead, new_estimate, add_basis, format_estimate,
+                                 COPY_BYTES_PER_SECOND)
+except ImportError:
+    from ffmpeg_utils import (probe_media, choose_target_profile, profile_key, select_conform_inputs,
+                              is_mp4_copy_compatible, conform_segment, concat_copy,
+                              find_keyframes, crossfade_segment, measure_loudness, loudness_gain,
+                              compose_mosaic, get_quality_profile, QUALITY_PROFILE_LABELS,
+                              DEFAULT_QUALITY_PROFILE, StreamingConcatWriter, conform_video_args)
+    from cache_utils import (get_cache_dir, file_fingerprint, make_cache_key, JsonCache, SegmentCache,
+                             ResultCache)
+    from resource_utils import plan_encoding, plan_parallel_jobs
+    from estimate_utils import (EncodeHistory, encode_signature, sample_encode, encode_rates, output_pixels,
+                                audio_bytes, with_overhead, new_estimate, add_basis, format_estimate,
+                                COPY_BYTES_PER_SECOND)
+
+# 获取logger
+logger = logging.getLogger("VideoEditor.merge")
+
+# 转换后片段缓存的容量上限（字节）
+SEGMENT_CACHE_MAX_BYTES = 20 * 1024 ** 3
+
+# 合并转换和合成画面时的音频码率（与ffmpeg_utils中目标规格的音频参数一致）
+MERGE_AUDIO_BITRATE = '192k'
+
+def mosaic_duration(infos, layout):
+    """合成画面的时长：网格以最长的输入为准，画中画以主画面为准"""
+    if layout == 'grid':
+        return max(info.get('duration') or 0 for info in infos)
+    return infos[0].get('duration') or 0
+
+def mosaic_codec_name(composition, count):
+    """合成画面的编码速度历史键中的编码器名称（同时解码多个输入，速度与转换单个片段不同）"""
+    return f"libx264-{composition['layout']}{count}"
+
+def estimate_merge(input_files, transition=None, transition_duration=1.0, composition=None, quality=None):
+    """
+    预估合并的输出大小和耗时，返回estimate_utils.new_estimate()格式的字典
+    
+    直接复制的输入按文件大小和磁盘速度估计；需要转换的输入和合成画面按本机的历史编码速度估计耗时
+    （没有历史记录时使用样本编码的速度），转换后的大小按样本编码的每像素比特数估计。
+    不考虑片段缓存和结果缓存的命中
+    """
+    quality = quality or get_quality_profile()
+    infos = [probe_media(file) for file in input_files]
+    profile = choose_target_profile(infos)
+    width, height, fps = profile['width'], profile['height'], profile['fps']
+    estimate = new_estimate()
+    extra_seconds = 0
+    
+    if composition:
+        codec = mosaic_codec_name(composition, len(input_files))
+        longest = max(range(len(infos)), key=lambda i: infos[i].get('duration') or 0)
+        jobs = [(longest, mosaic_duration(infos, composition['layout']))]
+        estimate['notes'].append("合成画面的样本只编码一个输入，耗时可能偏少")
+    else:
+        codec = 'libx264'
+        conform_indexes = select_conform_inputs(infos, profile, bool(transition) and len(infos) > 1)
+        identical = len(set(profile_key(info) for info in infos)) == 1 and is_mp4_copy_compatible(infos[0])
+        if identical and not transition:
+            conform_indexes = set()
+        copy_bytes = sum(os.path.getsize(file) for i, file in enumerate(input_files) if i not in conform_indexes)
+        if copy_bytes:
+            estimate['size'] += copy_bytes
+            estimate['time'] += copy_bytes / COPY_BYTES_PER_SECOND
+            add_basis(estimate, "输入文件大小")
+        jobs = [(i, infos[i].get('duration') or 0) for i in sorted(conform_indexes)]
+        if transition and len(input_files) > 1:
+            # 每个转场重新编码前后两个片段的衔接部分
+            extra_seconds = (len(input_files) - 1) * transition_duration * 2
+            
+    if jobs or extra_seconds:
+        plan = plan_parallel_jobs(max(len(jobs), 1), width, height, 'libx264')
+        history_entry = EncodeHistory().get(encode_signature(codec, quality, height, plan['threads']))
+        index = max(jobs, key=lambda job: job[1])[0] if jobs else 0
+        sample = sample_encode(input_files[index], conform_video_args(profile, quality)
+                               + ['-threads', str(plan['threads'])],
+                               infos[index].get('duration'), width, height, fps)
+        pixels_per_second, bits_per_pixel, basis = encode_rates(history_entry, sample)
+        add_basis(estimate, *basis)
+        
+        pixels = sum(output_pixels(width, height, fps, duration) for _, duration in jobs)
+        if bits_per_pixel is None:
+            estimate['size'] = None
+        else:
+            audio = sum(audio_bytes({'audio_codec': profile.get('audio_codec'), 'duration': duration},
+                                    MERGE_AUDIO_BITRATE) for _, duration in jobs)
+            estimate['size'] += with_overhead(bits_per_pixel * pixels + audio)
+        if pixels_per_second is None:
+            estimate['time'] = None
+        else:
+            pixels += output_pixels(width, height, fps, extra_seconds)
+            estimate['time'] += pixels / pixels_per_second / plan['workers']
+    return estimate
 
 class VideoMergeThread(QThread):
     progress_updated = pyqtSignal(int)
     process_finished = pyqtSignal(str)
     error_occurred = pyqtSignal(str)
     
-    def __init__(self, input_files, output_file):
+    def __init__(self, input_files, output_file, transition=None, transition_duration=1.0,
+                 loudness_target=None, composition=None, quality=None):
         super().__init__()
         self.input_files = input_files
         self.output_file = output_file
+        # 转场效果（xfade的transition名称），None表示直接拼接
+        self.transition = transition
+        self.transition_duration = transition_duration
+        # 响度标准化目标（LUFS），None表示不调整音量
+        self.loudness_target = loudness_target
+        # 合成设置 {'layout', 'grid_size', 'audio_mode'}，None表示按顺序拼接
+        self.composition = composition
+        # 重新编码时的速度/质量设置
+        self.quality = quality or get_quality_profile()
+        # 每个输入的音频增益（dB），None表示音频直接复制
+        self.audio_gains = None
+        # 转换后的片段缓存，再次拼接时只需转换有变化的输入
+        self.segment_cache = None
+        # 任务指标（各阶段的编码线程规划、耗时）
+        self.metrics = {}
         
     def run(self):
+        # 中间文件存放在临时目录中，结束后统一清理
+        scratch_dir = tempfile.mkdtemp(prefix="video_merge_")
+        self.segment_cache = SegmentCache(get_cache_dir("segments"), SEGMENT_CACHE_MAX_BYTES)
+        used_segments = []
+        start = time.monotonic()
         try:
-            # 加载所有视频
-            clips = []
-            total_clips = len(self.input_files)
+            # 相同的输入内容和合并设置已经合并过时直接使用缓存的结果
+            result_cache = ResultCache()
+            operation_params = {
+                'transition': self.transition,
+                'transition_duration': self.transition_duration,
+                'loudness_target': self.loudness_target,
+                'composition': self.composition,
+                'quality': self.quality,
+                'extension': os.path.splitext(self.output_file)[1].lower(),
+            }
+            cache_key = result_cache.make_key('merge', self.input_files, operation_params)
+            if result_cache.fetch(cache_key, self.output_file):
+                self.metrics['cached'] = True
+                logger.info(f"使用缓存的合并结果: {self.output_file}")
+                self.progress_updated.emit(100)
+                self.process_finished.emit(self.output_file)
+                return
+            result_cache.release_output(self.output_file)
+            
+            # 获取所有输入的规格（只读取文件头，不保持文件打开）
+            infos = [probe_media(file) for file in self.input_files]
+            total_duration = sum(info.get('duration') or 0 for info in infos)
             
-            for i, file in enumerate(self.input_files):
-                # 更新进度
-                self.progress_updated.emit(int((i / total_clips) * 50))
+            # 规格完全一致且可以放入mp4时直接复制拼接，否则统一到目标规格
+            # （转换后的片段与原始片段的参数集不同，有输入需要转换或带转场时全部转换）
+            profile = choose_target_profile(infos)
+            conform_indexes = select_conform_inputs(infos, profile,
+                                                    bool(self.transition) and len(self.input_files) > 1)
+            identical = len(set(profile_key(info) for info in infos)) == 1 and is_mp4_copy_compatible(infos[0])
+            if identical and not self.transition:
+                # 规格一致时所有输入都可以直接复制
+                conform_indexes = set()
                 
-                # 加载视频
-                clip = VideoFileClip(file)
-                clips.append(clip)
+            if self.loudness_target is not None:
+                self.audio_gains = self.measure_audio_gains(infos)
                 
-            # 合并视频
-            final_clip = concatenate_videoclips(clips)
-            
-            # 发送50%进度信号
-            self.progress_updated.emit(50)
-            
-            # 写入输出文件
-            final_clip.write_videofile(
-                self.output_file, 
-                codec='libx264', 
-                audio_codec='aac',
-                temp_audiofile=os.path.join(tempfile.gettempdir(), "temp-audio.m4a"),
-                remove_temp=True
-            )
-            
-            # 关闭视频对象
-            for clip in clips:
-                clip.close()
-            final_clip.close()
+            if self.composition:
+                # 多个输入同时显示在一个画面中，由一个ffmpeg进程完成
+                plan = plan_encoding(1, profile['width'], profile['height'], 'libx264')
+                self.metrics['compose_plan'] = plan
+                compose_start = time.monotonic()
+                compose_mosaic(self.input_files, self.output_file, self.composition['layout'], profile,
+                               grid_size=self.composition.get('grid_size'),
+                               audio_mode=self.composition.get('audio_mode', 'first'),
+                               audio_gains=self.audio_gains, threads=plan['threads'], quality=self.quality,
+                               progress_callback=lambda p: self.progress_updated.emit(int(p * 100)))
+                self.record_encode_speed(mosaic_codec_name(self.composition, len(self.input_files)), profile,
+                                         plan['threads'], mosaic_duration(infos, self.composition['layout']),
+                                         time.monotonic() - compose_start, self.output_file)
+            elif self.transition and len(self.input_files) > 1:
+                self.transition_merge(infos, profile, conform_indexes, scratch_dir, used_segments)
+            elif identical and self.audio_gains is None:
+                # concat分离器按顺序逐个打开输入
+                concat_copy(self.input_files, self.output_file, scratch_dir, duration=total_duration,
+                            progress_callback=lambda p: self.progress_updated.emit(int(p * 100)))
+            else:
+                self.stream_merge(infos, profile, conform_indexes, scratch_dir, used_segments)
             
             # 发送100%进度信号
             self.progress_updated.emit(100)
             
+            self.metrics['elapsed'] = time.monotonic() - start
+            logger.info(f"合并完成: {self.output_file}，任务指标: {self.metrics}")
+            try:
+                result_cache.store(cache_key, self.output_file, 'merge', self.input_files, operation_params)
+            except OSError as e:
+                logger.warning(f"保存合并结果到缓存失败: {str(e)}")
+            
             # 发送完成信号
             self.process_finished.emit(self.output_file)
             
         except Exception as e:
             self.error_occurred.emit(str(e))
+        finally:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+            # 缓存超过上限时淘汰最久未使用的片段（本次用到的片段保留）
+            self.segment_cache.evict(keep=used_segments)
+            
+    def measure_audio_gains(self, infos):
+        """
+        并行测量各输入的响度并计算达到目标响度所需的增益（dB）
+        
+        测量结果按文件内容指纹缓存，重复拼接相同文件时不再测量
+        """
+        loudness_cache = JsonCache(os.path.join(get_cache_dir(), "loudness.json"))
+        
+        def measure(file_path):
+            fingerprint = file_fingerprint(file_path)
+            measurement = loudness_cache.get(fingerprint)
+            if measurement is None:
+                measurement = measure_loudness(file_path) or {}
+                loudness_cache.set(fingerprint, measurement)
+            return measurement
+            
+        audio_files = [(i, file) for i, file in enumerate(self.input_files) if infos[i].get('audio_codec')]
+        gains = [0] * len(self.input_files)
+        if not audio_files:
+            return gains
+            
+        self.progress_updated.emit(0)
+        workers = max(1, min(len(audio_files), os.cpu_count() or 1))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            measurements = executor.map(measure, [file for _, file in audio_files])
+            for (i, _), measurement in zip(audio_files, measurements):
+                gains[i] = loudness_gain(measurement, self.loudness_target)
+        return gains
+        
+    def segment_gain(self, index, conformed):
+        """
+        片段写入时需要的音频增益
+        
+        转换生成的片段已经包含增益；不做响度标准化时返回None，音频直接复制
+        """
+        if conformed or self.audio_gains is None:
+            return None
+        return self.audio_gains[index]
+        
+    def conform_cached(self, index, profile, threads):
+        """
+        将输入转换为目标规格，结果按输入指纹、目标规格和音频增益缓存
+        
+        命中缓存时直接返回缓存文件，否则转换后写入缓存
+        """
+        input_file = self.input_files[index]
+        audio_gain = self.segment_gain(index, False)
+        key = make_cache_key([file_fingerprint(input_file)],
+                             {'profile': profile, 'audio_gain': audio_gain, 'quality': self.quality})
+        
+        cached = self.segment_cache.get(key)
+        if cached is not None:
+            return cached
+            
+        temp_path = self.segment_cache.temp_path(key)
+        start = time.monotonic()
+        try:
+            conform_segment(input_file, temp_path, profile, threads, audio_gain=audio_gain, quality=self.quality)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self.record_encode_speed('libx264', profile, threads, probe_media(input_file).get('duration'),
+                                 time.monotonic() - start, temp_path)
+        return self.segment_cache.commit(key, temp_path)
+        
+    def record_encode_speed(self, codec, profile, threads, duration, elapsed, output_file):
+        """记录本机的编码速度和码率，用于预估以后合并的耗时和大小"""
+        try:
+            audio = audio_bytes({'audio_codec': profile.get('audio_codec'), 'duration': duration},
+                                MERGE_AUDIO_BITRATE)
+            EncodeHistory().record(encode_signature(codec, self.quality, profile['height'], threads),
+                                   output_pixels(profile['width'], profile['height'], profile['fps'], duration),
+                                   elapsed, os.path.getsize(output_file) - audio)
+        except OSError as e:
+            logger.warning(f"记录编码速度失败: {str(e)}")
+            
+    def iter_sources(self, infos, profile, conform_indexes, scratch_dir):
+        """
+        按顺序产出符合目标规格的片段 (序号, 文件路径, 时长, 是否为转换后的片段)
+        
+        需要转换的输入由多个ffmpeg进程并行转换，但同时进行的任务数不超过工作线程数；
+        转换结果保存在片段缓存中，未变化的输入再次拼接时直接使用缓存
+        """
+        # 每个需要转换的输入一个编码进程，各进程分摊CPU核心
+        plan = plan_parallel_jobs(len(conform_indexes), profile['width'], profile['height'], 'libx264')
+        self.metrics['conform_plan'] = plan
+        workers, threads = plan['workers'], plan['threads']
+        
+        futures = {}
+        next_index = 0
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for i, input_file in enumerate(self.input_files):
+                    # 保持最多workers个转换任务在进行
+                    while next_index < len(self.input_files) and len(futures) < workers:
+                        if next_index in conform_indexes:
+                            futures[next_index] = executor.submit(self.conform_cached, next_index, profile, threads)
+                        next_index += 1
+                        
+                    if i in futures:
+                        segment = futures.pop(i).result()
+                        yield i, segment, probe_media(segment).get('duration'), True
+                    else:
+                        yield i, input_file, infos[i].get('duration'), False
+        finally:
+            # 出错时取消尚未开始的任务
+            for future in futures.values():
+                future.cancel()
+                
+    def stream_merge(self, infos, profile, conform_indexes, scratch_dir, used_segments):
+        """
+        流式拼接
+        
+        各片段按顺序写入拼接进程，任意时刻只打开一个片段，
+        因此内存和文件句柄占用与输入数量无关；中间片段的磁盘占用由缓存上限控制
+        """
+        total_duration = sum(info.get('duration') or 0 for info in infos) or len(infos)
+        done_duration = 0
+        
+        writer = StreamingConcatWriter(self.output_file)
+        try:
+            for i, segment, duration, conformed in self.iter_sources(infos, profile, conform_indexes, scratch_dir):
+                writer.append(segment, duration, audio_gain=self.segment_gain(i, conformed))
+                if conformed:
+                    used_segments.append(segment)
+                    
+                done_duration += infos[i].get('duration') or 1
+                self.progress_updated.emit(min(int(done_duration / total_duration * 100), 99))
+                
+            writer.close()
+        except Exception:
+            writer.abort()
+            raise
+            
+    def find_cut_points(self, segment, duration, is_first, is_last):
+        """
+        查找片段中间可以直接复制部分的起止关键帧
+        
+        开头需要留出至少一个转场时长给上一个转场，结尾同理；找不到合适的关键帧时返回None
+        """
+        fade = self.transition_duration
+        head_end = 0.0
+        if not is_first:
+            keyframes = find_keyframes(segment, fade, min(fade + 30, duration))
+            if not keyframes:
+                return None
+            head_end = keyframes[0]
+            
+        tail_start = duration
+        if not is_last:
+            keyframes = find_keyframes(segment, max(duration - fade - 30, 0), duration - fade)
+            if not keyframes:
+                return None
+            tail_start = keyframes[-1]
+            
+        if tail_start < head_end:
+            return None
+        return head_end, tail_start
+        
+    def transition_merge(self, infos, profile, conform_indexes, scratch_dir, used_segments):
+        """
+        带转场的拼接
+        
+        各输入先转换为目标规格（转场片段由libx264编码，原始H.264流的参数集与之不同，不能直接复制），
+        转换结果保存在片段缓存中。每个片段在关键帧处切分，中间部分直接流复制；只有每个拼接点前后的
+        几秒被解码、交叉淡化后重新编码，因此再次合并（更换转场或调整顺序）时耗时与转场数量成正比
+        """
+        fade = self.transition_duration
+        last_index = len(self.input_files) - 1
+        total_duration = sum(info.get('duration') or 0 for info in infos) or len(infos)
+        done_duration = 0
+        plan = plan_encoding(1, profile['width'], profile['height'], 'libx264')
+        self.metrics['transition_plan'] = plan
+        threads = plan['threads']
+        
+        for i, info in enumerate(infos):
+            if (info.get('duration') or 0) < fade * 2 + 1:
+                raise RuntimeError(f"视频过短，无法添加{fade:g}秒的转场: {os.path.basename(self.input_files[i])}")
+        
+        writer = StreamingConcatWriter(self.output_file)
+        previous = None  # (文件路径, 时长, 结尾转场起点, 用完后是否删除, 音频增益)
+        try:
+            for i, segment, duration, conformed in self.iter_sources(infos, profile, conform_indexes, scratch_dir):
+                if conformed:
+                    used_segments.append(segment)
+                is_temp = False
+                is_first, is_last = i == 0, i == last_index
+                cut_points = self.find_cut_points(segment, duration, is_first, is_last)
+                if cut_points is None:
+                    # 关键帧间隔太大时，重新编码该片段并在切分位置强制插入关键帧
+                    forced = os.path.join(scratch_dir, f"keyframed_{i:05d}.ts")
+                    conform_segment(segment, forced, profile, threads,
+                                    keyframes=[fade, duration - fade - 0.5],
+                                    audio_gain=self.segment_gain(i, conformed), quality=self.quality)
+                    segment, duration = forced, probe_media(forced).get('duration')
+                    conformed = is_temp = True
+                    cut_points = self.find_cut_points(segment, duration, is_first, is_last)
+                    if cut_points is None:
+                        raise RuntimeError(f"无法在视频中找到转场切分点: {os.path.basename(self.input_files[i])}")
+                head_end, tail_start = cut_points
+                gain = self.segment_gain(i, conformed)
+                
+                # 上一个片段结尾与本片段开头之间的转场
+                if previous is not None:
+                    prev_segment, prev_duration, prev_tail_start, prev_is_temp, prev_gain = previous
+                    transition_file = os.path.join(scratch_dir, f"transition_{i:05d}.ts")
+                    crossfade_segment(prev_segment, prev_tail_start, prev_duration, segment, head_end,
+                                      self.transition, fade, profile, transition_file, threads,
+                                      audio_gains=(prev_gain, gain), quality=self.quality)
+                    writer.append(transition_file, prev_duration - prev_tail_start + head_end - fade)
+                    os.remove(transition_file)
+                    if prev_is_temp:
+                        os.remove(prev_segment)
+                        
+                # 中间部分直接流复制
+                if tail_start > head_end:
+                    writer.append(segment, tail_start - head_end, start=head_end,
+                                  end=None if is_last else tail_start, audio_gain=gain)
+                previous = (segment, duration, tail_start, is_temp, gain)
+                
+                done_duration += infos[i].get('duration') or 1
+                self.progress_updated.emit(min(int(done_duration / total_duration * 100), 99))
+                
+            if previous is not None and previous[3]:
+                os.remove(previous[0])
+            writer.close()
+        except Exception:
+            writer.abort()
+            raise
+
+# 支持的视频文件扩展名
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv')
+
+# 表格中由后台线程填充的列
+VIDEO_INFO_COLUMNS = {
+    'duration': 2,
+    'video_codec': 4,
+    'resolution': 5,
+    'fps': 6,
+    'bitrate': 7,
+    'audio_codec': 8,
+    'audio_sample_rate': 9,
+    'channels': 10,
+}
+VIDEO_INFO_KEYS = {col: key for key, col in VIDEO_INFO_COLUMNS.items()}
+
+def format_duration(duration_sec):
+    """格式化时长为 时:分:秒.毫秒"""
+    hours = int(duration_sec // 3600)
+    minutes = int((duration_sec % 3600) // 60)
+    seconds = duration_sec % 60
+    return f"{hours:02d}:{minutes:02d}:{seconds:06.3f}"
+
+def format_channels(channels):
+    """格式化声道数"""
+    if channels == 1:
+        return "单声道"
+    if channels == 2:
+        return "立体声"
+    return f"{channels} 声道"
+
+def read_video_info(file_path):
+    """读取视频信息（只读取文件头），返回表格各列显示的文本"""
+    try:
+        info = probe_media(file_path)
+    except Exception:
+        # 如果无法获取视频信息，填充默认值
+        return {key: "未知" for key in VIDEO_INFO_COLUMNS}
+        
+    has_video = info['video_codec'] is not None
+    has_audio = info['audio_codec'] is not None
+    bitrate = info['video_bit_rate'] or info['bit_rate']
+    
+    return {
+        'duration': format_duration(info['duration']) if info['duration'] is not None else "未知",
+        'video_codec': info['video_codec'].upper() if has_video else "无",
+        'resolution': f"{info['width']}x{info['height']}" if has_video and info['width'] else "未知",
+        'fps': f"{info['fps']:.2f} fps" if info['fps'] else "未知",
+        'bitrate': f"{bitrate // 1000} kbps" if bitrate else "未知",
+        'audio_codec': info['audio_codec'].upper() if has_audio else "无",
+        'audio_sample_rate': f"{info['sample_rate'] / 1000:g} kHz" if has_audio and info['sample_rate'] else "-",
+        'channels': format_channels(info['channels']) if has_audio and info['channels'] else "-",
+    }
+
+class VideoInfoThread(QThread):
+    """
+    后台读取视频信息的线程，使用有界线程池并行读取
+    
+    文件按批加入队列，线程处理完队列中的所有批次后结束，再次加入文件时自动重新启动。
+    启动和重新启动都在界面线程中进行，界面线程不会等待读取完成
+    """
+    info_ready = pyqtSignal(str, dict)
+    
+    def __init__(self, max_workers=None):
+        super().__init__()
+        # 探测由ffprobe子进程完成，线程只负责等待，可以比CPU核心数多一些
+        self.max_workers = max_workers or min(16, (os.cpu_count() or 1) * 2)
+        self._queue = queue.Queue()
+        # 线程发现队列为空、正在结束时加入的批次，由结束后的处理重新启动线程读取
+        self.finished.connect(self.restart_if_pending)
+        
+    def add_files(self, file_paths):
+        """将一批文件加入读取队列"""
+        self._queue.put(list(file_paths))
+        if not self.isRunning():
+            self.start()
+            
+    def restart_if_pending(self):
+        if not self._queue.empty() and not self.isRunning():
+            self.start()
+                
+    def run(self):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                try:
+                    batch = self._queue.get_nowait()
+                except queue.Empty:
+                    return
+                    
+                futures = {executor.submit(read_video_info, path): path for path in batch}
+                for future in as_completed(futures):
+                    self.info_ready.emit(futures[future], future.result())
+
+def natural_sort_key(path):
+    """自然排序键，使 CLIP2 排在 CLIP10 之前"""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', path)]
+
+def row_ranges(rows):
+    """把行号合并为连续区间 [(起始行, 结束行)]，按从后往前的顺序排列，依次删除时前面区间的行号不受影响"""
+    ranges = []
+    for row in sorted(set(rows), reverse=True):
+        if ranges and ranges[-1][0] == row + 1:
+            ranges[-1][0] = row
+        else:
+            ranges.append([row, row])
+    return [tuple(item) for item in ranges]
+
+def is_video_file(path):
+    """根据扩展名判断是否为视频文件"""
+    return path.lower().endswith(VIDEO_EXTENSIONS)
+
+def scan_video_files(paths):
+    """
+    展开路径列表中的文件夹，返回其中的所有视频文件
+    
+    文件夹使用os.scandir递归遍历（不跟随符号链接），结果按自然顺序排列；
+    直接给出的文件保持原有顺序
+    """
+    result = []
+    for path in paths:
+        if not os.path.isdir(path):
+            if is_video_file(path):
+                result.append(path)
+            continue
+            
+        found = []
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(entry.path)
+                            elif entry.is_file() and is_video_file(entry.name):
+                                found.append(entry.path)
+                        except OSError:
+                            continue
+            except OSError:
+                # 没有权限的文件夹直接跳过
+                continue
+                
+        found.sort(key=natural_sort_key)
+        result.extend(found)
+    return result
+
+class VideoScanThread(QThread):
+    """后台遍历文件夹的线程，按顺序分批发出找到的视频文件"""
+    files_found = pyqtSignal(list)
+    
+    BATCH_SIZE = 500
+    
+    def __init__(self, paths):
+        super().__init__()
+        self.paths = paths
+        
+    def run(self):
+        files = scan_video_files(self.paths)
+        for start in range(0, len(files), self.BATCH_SIZE):
+            self.files_found.emit(files[start:start + self.BATCH_SIZE])
+
+class EstimateThread(QThread):
+    """在后台运行输出大小和耗时的预估（需要探测文件和编码样本），完成后发送预估结果"""
+    estimate_ready = pyqtSignal(object)
+    error_occurred = pyqtSignal(str)
+    
+    def __init__(self, estimate_func, *args):
+        super().__init__()
+        self.estimate_func = estimate_func
+        self.args = args
+        
+    def run(self):
+        try:
+            self.estimate_ready.emit(self.estimate_func(*self.args))
+        except Exception as e:
+            logger.warning(f"预估失败: {str(e)}")
+            self.error_occurred.emit(str(e))
+            
+    def detach(self):
+        """
+        不再需要预估结果时调用：断开结果信号，让线程在后台运行结束，不阻塞界面
+        
+        线程交给应用程序对象持有，结束后再删除（QThread运行时不能被销毁）
+        """
+        self.estimate_ready.disconnect()
+        self.error_occurred.disconnect()
+        self.setParent(QApplication.instance())
+        self.finished.connect(self.deleteLater)
+        if self.isFinished():
+            self.deleteLater()
+
+class VideoEntry:
+    """合并列表中的一项，使用__slots__保持每项占用内存很小"""
+    __slots__ = ('path', 'name', 'format', 'checked', 'info')
+    
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.format = os.path.splitext(path)[1][1:].upper()
+        self.checked = True
+        self.info = None
+
+class VideoListModel(QAbstractTableModel):
+    """合并列表的数据模型，视图只绘制可见的行"""
+    HEADERS = ["选择", "视频文件", "时长", "格式", "视频编码", "分辨率", "帧率", "视频码率",
+               "音频编码", "音频采样率", "声道"]
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._entries = []
+        self._entries_by_path = {}
+        
+        # 合并后台线程的信息更新，避免逐行刷新
+        self._refresh_timer = QTimer(self)
+        self._refresh_timer.setSingleShot(True)
+        self._refresh_timer.setInterval(100)
+        self._refresh_timer.timeout.connect(self._emit_info_changed)
+        
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._entries)
+        
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+        
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+        
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        entry = self._entries[index.row()]
+        col = index.column()
+        
+        if col == 0:
+            if role == Qt.CheckStateRole:
+                return Qt.Checked if entry.checked else Qt.Unchecked
+            return None
+            
+        if role == Qt.DisplayRole:
+            if col == 1:
+                return entry.name
+            if col == 3:
+                return entry.format
+            if entry.info is None:
+                return "读取中..."
+            return entry.info[VIDEO_INFO_KEYS[col]]
+        if role == Qt.ToolTipRole and col == 1:
+            return entry.path
+        return None
+        
+    def setData(self, index, value, role=Qt.EditRole):
+        if index.isValid() and index.column() == 0 and role == Qt.CheckStateRole:
+            self._entries[index.row()].checked = value == Qt.Checked
+            self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+            return True
+        return False
+        
+    def flags(self, index):
+        flags = super().flags(index)
+        if not index.isValid():
+            return flags | Qt.ItemIsDropEnabled
+        flags |= Qt.ItemIsDragEnabled
+        if index.column() == 0:
+            flags |= Qt.ItemIsUserCheckable
+        return flags
+        
+    def supportedDropActions(self):
+        return Qt.MoveAction
+        
+    def contains(self, path):
+        return path in self._entries_by_path
+        
+    def path_at(self, row):
+        return self._entries[row].path
+        
+    def add_files(self, file_paths):
+        """批量添加文件，返回实际添加的文件（已存在的文件会被跳过）"""
+        new_entries = []
+        for path in file_paths:
+            if path not in self._entries_by_path:
+                entry = VideoEntry(path)
+                self._entries_by_path[path] = entry
+                new_entries.append(entry)
+                
+        if new_entries:
+            first = len(self._entries)
+            self.beginInsertRows(QModelIndex(), first, first + len(new_entries) - 1)
+            self._entries.extend(new_entries)
+            self.endInsertRows()
+            
+        return [entry.path for entry in new_entries]
+        
+    def update_info(self, path, info):
+        """填充后台线程读取到的视频信息"""
+        entry = self._entries_by_path.get(path)
+        if entry is not None:
+            entry.info = info
+            if not self._refresh_timer.isActive():
+                self._refresh_timer.start()
+                
+    def _emit_info_changed(self):
+        if self._entries:
+            self.dataChanged.emit(self.index(0, 2), self.index(len(self._entries) - 1, len(self.HEADERS) - 1))
+            
+    def _swap_with_previous(self, row):
+        """交换row与row-1两行，O(1)"""
+        self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), row - 1)
+        self._entries[row - 1], self._entries[row] = self._entries[row], self._entries[row - 1]
+        self.endMoveRows()
+        
+    def move_rows_up(self, rows):
+        """将多行各向上移动一行"""
+        selected = set(rows)
+        blocked = -1
+        for row in sorted(selected):
+            if row - 1 > blocked and row - 1 not in selected:
+                self._swap_with_previous(row)
+                selected.discard(row)
+                selected.add(row - 1)
+            else:
+                blocked = row
+                
+    def move_rows_down(self, rows):
+        """将多行各向下移动一行"""
+        selected = set(rows)
+        blocked = len(self._entries)
+        for row in sorted(selected, reverse=True):
+            if row + 1 < blocked and row + 1 not in selected:
+                self._swap_with_previous(row + 1)
+                selected.discard(row)
+                selected.add(row + 1)
+            else:
+                blocked = row
+                
+    def move_rows(self, rows, target_row):
+        """将多行移动到target_row之前（用于拖放排序），保持选中状态"""
+        rows = sorted(set(rows))
+        if not rows:
+            return
+            
+        self.layoutAboutToBeChanged.emit()
+        old_entries = self._entries
+        moving = set(rows)
+        moved = [old_entries[row] for row in rows]
+        remaining = [entry for row, entry in enumerate(old_entries) if row not in moving]
+        insert_at = target_row - sum(1 for row in rows if row < target_row)
+        self._entries = remaining[:insert_at] + moved + remaining[insert_at:]
+        
+        # 更新持久索引，视图的选中状态随之移动
+        new_rows = {id(entry): row for row, entry in enumerate(self._entries)}
+        old_indexes = self.persistentIndexList()
+        new_indexes = [self.index(new_rows[id(old_entries[index.row()])], index.column())
+                       for index in old_indexes]
+        self.changePersistentIndexList(old_indexes, new_indexes)
+        self.layoutChanged.emit()
+        
+    def remove_rows(self, rows):
+        """删除多行，连续的行一次性删除"""
+        for first, last in row_ranges(rows):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            for entry in self._entries[first:last + 1]:
+                del self._entries_by_path[entry.path]
+            del self._entries[first:last + 1]
+            self.endRemoveRows()
+            
+    def set_checked(self, rows, checked):
+        """批量设置勾选状态"""
+        if not rows:
+            return
+        for row in rows:
+            self._entries[row].checked = checked
+        self.dataChanged.emit(self.index(min(rows), 0), self.index(max(rows), 0), [Qt.CheckStateRole])
+        
+    def is_checked(self, row):
+        return self._entries[row].checked
+        
+    def checked_paths(self):
+        """按列表顺序返回已勾选的文件"""
+        return [entry.path for entry in self._entries if entry.checked]
+
+class CheckBoxDelegate(QStyledItemDelegate):
+    """在单元格中居中绘制复选框，不为每行创建控件"""
+    
+    def _checkbox_rect(self, option):
+        style = option.widget.style() if option.widget else QApplication.style()
+        indicator = style.subElementRect(QStyle.SE_CheckBoxIndicator, QStyleOptionButton(), option.widget)
+        rect = QRect(0, 0, indicator.width(), indicator.height())
+        rect.moveCenter(option.rect.center())
+        return rect
+        
+    def paint(self, painter, option, index):
+        style = option.widget.style() if option.widget else QApplication.style()
+        
+        # 绘制背景（包括选中状态）
+        style.drawPrimitive(QStyle.PE_PanelItemViewItem, option, painter, option.widget)
+        
+        checkbox_option = QStyleOptionButton()
+        checkbox_option.rect = self._checkbox_rect(option)
+        checkbox_option.state = QStyle.State_Enabled
+        checkbox_option.state |= QStyle.State_On if index.data(Qt.CheckStateRole) == Qt.Checked else QStyle.State_Off
+        style.drawControl(QStyle.CE_CheckBox, checkbox_option, painter, option.widget)
+        
+    def editorEvent(self, event, model, option, index):
+        if event.type() in (QEvent.MouseButtonPress, QEvent.MouseButtonDblClick):
+            return self._checkbox_rect(option).contains(event.pos())
+        if event.type() == QEvent.MouseButtonRelease:
+            if not self._checkbox_rect(option).contains(event.pos()):
+                return False
+        elif event.type() != QEvent.KeyPress or event.key() != Qt.Key_Space:
+            return False
+            
+        checked = index.data(Qt.CheckStateRole) == Qt.Checked
+        return model.setData(index, Qt.Unchecked if checked else Qt.Checked, Qt.CheckStateRole)
+
+class VideoListView(QTableView):
+    """支持多选和拖放排序的视频列表"""
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.setDragEnabled(True)
+        self.setAcceptDrops(True)
+        self.setDragDropMode(QAbstractItemView.InternalMove)
+        self.setDragDropOverwriteMode(False)
+        self.setDropIndicatorShown(True)
+        self.setItemDelegateForColumn(0, CheckBoxDelegate(self))
+        
+        # 固定行高，大量数据时不必逐行计算高度
+        self.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.verticalHeader().setDefaultSectionSize(28)
+        self.verticalHeader().setVisible(False)
+        
+    def selected_rows(self):
+        """返回选中行号（升序）"""
+        return sorted(index.row() for index in self.selectionModel().selectedRows())
+        
+    def dragMoveEvent(self, event):
+        super().dragMoveEvent(event)
+        if event.source() is self:
+            event.setDropAction(Qt.MoveAction)
+            event.accept()
+        else:
+            event.ignore()
+            
+    def dropEvent(self, event):
+        if event.source() is not self:
+            event.ignore()
+            return
+            
+        index = self.indexAt(event.pos())
+        if not index.isValid():
+            target_row = self.model().rowCount()
+        elif self.dropIndicatorPosition() == QAbstractItemView.BelowItem:
+            target_row = index.row() + 1
+        else:
+            target_row = index.row()
+            
+        self.model().move_rows(self.selected_rows(), target_row)
+        # 移动已由模型完成，不让视图再删除源行
+        event.setDropAction(Qt.CopyAction)
+        event.accept()
 
 class VideoDropArea(QFrame):
     videos_dropped = pyqtSignal(list)
@@ -89,7 +955,7 @@ class VideoDropArea(QFrame):
         layout.setContentsMargins(10, 5, 10, 5)
         
         # 添加提示标签
-        self.label = QLabel("拖放视频文件到此处")
+        self.label = QLabel("拖放视频文件或文件夹到此处")
         self.label.setAlignment(Qt.AlignCenter)
         self.label.setStyleSheet("border: none; font-size: 14px; color: #cdd6f4;")
         layout.addWidget(self.label)
@@ -120,15 +986,14 @@ class VideoDropArea(QFrame):
             for url in event.mimeData().urls():
                 file_path = url.toLocalFile()
                 
-                # 检查是否为视频文件
-                video_extensions = ['.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv']
-                if any(file_path.lower().endswith(ext) for ext in video_extensions):
+                # 检查是否为视频文件或文件夹
+                if os.path.isdir(file_path) or is_video_file(file_path):
                     file_paths.append(file_path)
             
             if file_paths:
                 self.videos_dropped.emit(file_paths)
             else:
-                QMessageBox.warning(self, "文件类型错误", "请拖放视频文件")
+                QMessageBox.warning(self, "文件类型错误", "请拖放视频文件或文件夹")
                 
         self.setStyleSheet("""
             QFrame {
@@ -138,9 +1003,29 @@ class VideoDropArea(QFrame):
             }
         """)
 
+# 可选的转场效果 (显示名称, xfade转场名称)
+TRANSITIONS = [
+    ("无", None),
+    ("交叉淡化", "fade"),
+    ("溶解", "dissolve"),
+    ("黑场过渡", "fadeblack"),
+]
+
+# 合成方式 (显示名称, 布局, 网格大小)，布局为None表示按顺序拼接
+COMPOSITIONS = [
+    ("顺序拼接", None, None),
+    ("自动网格", "grid", None),
+    ("2x2 网格", "grid", 2),
+    ("3x3 网格", "grid", 3),
+    ("画中画", "pip", None),
+]
+
 class OutputSettingsDialog(QDialog):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, input_files=None):
         super().__init__(parent)
+        # 要合并的文件，用于预估输出大小和耗时
+        self.input_files = input_files or []
+        self.estimate_thread = None
         self.setWindowTitle("输出设置")
         self.setMinimumWidth(400)
         self.setStyleSheet("""
@@ -151,7 +1036,7 @@ class OutputSettingsDialog(QDialog):
             QLabel {
                 color: #cdd6f4;
             }
-            QLineEdit {
+            QLineEdit, QComboBox, QDoubleSpinBox {
                 background-color: #313244;
                 color: #cdd6f4;
                 border: 1px solid #45475a;
@@ -195,8 +1080,65 @@ class OutputSettingsDialog(QDialog):
         self.output_name_edit = QLineEdit("合成后视频")
         form_layout.addRow("输出文件名:", self.output_name_edit)
         
+        # 合成方式
+        self.composition_combo = QComboBox()
+        for label, composition_layout, grid_size in COMPOSITIONS:
+            self.composition_combo.addItem(label, (composition_layout, grid_size))
+        form_layout.addRow("合成方式:", self.composition_combo)
+        
+        self.mix_audio_checkbox = QCheckBox("混合所有视频的音频")
+        self.mix_audio_checkbox.setEnabled(False)
+        form_layout.addRow("", self.mix_audio_checkbox)
+        
+        # 转场效果
+        self.transition_combo = QComboBox()
+        for label, transition in TRANSITIONS:
+            self.transition_combo.addItem(label, transition)
+        form_layout.addRow("转场效果:", self.transition_combo)
+        
+        # 转场时长
+        self.transition_duration_spin = QDoubleSpinBox()
+        self.transition_duration_spin.setRange(0.2, 5.0)
+        self.transition_duration_spin.setSingleStep(0.1)
+        self.transition_duration_spin.setValue(1.0)
+        self.transition_duration_spin.setSuffix(" 秒")
+        form_layout.addRow("转场时长:", self.transition_duration_spin)
+        
+        # 重新编码时的速度/质量方案
+        self.quality_combo = QComboBox()
+        for name, label in QUALITY_PROFILE_LABELS:
+            self.quality_combo.addItem(label, name)
+        self.quality_combo.setCurrentIndex(self.quality_combo.findData(DEFAULT_QUALITY_PROFILE))
+        form_layout.addRow("编码质量:", self.quality_combo)
+        self.composition_combo.currentIndexChanged.connect(self.on_composition_changed)
+        
+        # 响度标准化
+        loudness_layout = QHBoxLayout()
+        self.loudness_checkbox = QCheckBox("EBU R128 响度标准化")
+        loudness_layout.addWidget(self.loudness_checkbox)
+        self.loudness_target_spin = QDoubleSpinBox()
+        self.loudness_target_spin.setRange(-36.0, -10.0)
+        self.loudness_target_spin.setSingleStep(1.0)
+        self.loudness_target_spin.setValue(-23.0)
+        self.loudness_target_spin.setSuffix(" LUFS")
+        self.loudness_target_spin.setEnabled(False)
+        self.loudness_checkbox.toggled.connect(self.loudness_target_spin.setEnabled)
+        loudness_layout.addWidget(self.loudness_target_spin)
+        form_layout.addRow("音量:", loudness_layout)
+        
         layout.addLayout(form_layout)
         
+        # 输出大小和耗时预估
+        estimate_layout = QHBoxLayout()
+        self.estimate_btn = QPushButton("预估耗时和大小")
+        self.estimate_btn.setEnabled(bool(self.input_files))
+        self.estimate_btn.clicked.connect(self.start_estimate)
+        estimate_layout.addWidget(self.estimate_btn)
+        self.estimate_label = QLabel()
+        self.estimate_label.setWordWrap(True)
+        estimate_layout.addWidget(self.estimate_label, 1)
+        layout.addLayout(estimate_layout)
+        
         # 创建按钮布局
         button_layout = QHBoxLayout()
         
@@ -228,6 +1170,74 @@ class OutputSettingsDialog(QDialog):
             output_name += '.mp4'
             
         return os.path.join(output_dir, output_name)
+        
+    def get_quality(self):
+        """获取重新编码时的速度/质量设置"""
+        return get_quality_profile(self.quality_combo.currentData())
+        
+    def get_loudness_target(self):
+        """获取响度标准化目标（LUFS），不标准化时返回None"""
+        if self.loudness_checkbox.isChecked():
+            return self.loudness_target_spin.value()
+        return None
+        
+    def get_transition(self):
+        """获取转场设置 (转场效果, 时长)，不使用转场时效果为None"""
+        if self.get_composition():
+            return None, self.transition_duration_spin.value()
+        return self.transition_combo.currentData(), self.transition_duration_spin.value()
+        
+    def on_composition_changed(self):
+        """合成画面时不使用转场，只有合成时才能混合音频"""
+        composing = self.get_composition() is not None
+        self.transition_combo.setEnabled(not composing)
+        self.transition_duration_spin.setEnabled(not composing)
+        self.mix_audio_checkbox.setEnabled(composing)
+        
+    def start_estimate(self):
+        """按当前设置在后台预估合并的输出大小和耗时"""
+        if not self.input_files or self.estimate_thread is not None:
+            return
+        transition, transition_duration = self.get_transition()
+        self.estimate_btn.setEnabled(False)
+        self.estimate_label.setText("正在预估...")
+        self.estimate_thread = EstimateThread(estimate_merge, self.input_files, transition, transition_duration,
+                                              self.get_composition(), self.get_quality())
+        self.estimate_thread.estimate_ready.connect(self.on_estimate_ready)
+        self.estimate_thread.error_occurred.connect(self.on_estimate_error)
+        self.estimate_thread.start()
+        
+    def on_estimate_ready(self, estimate):
+        self.estimate_label.setText(format_estimate(estimate))
+        self.finish_estimate()
+        
+    def on_estimate_error(self, error_msg):
+        self.estimate_label.setText(f"预估失败: {error_msg}")
+        self.finish_estimate()
+        
+    def finish_estimate(self):
+        if self.estimate_thread is not None:
+            self.estimate_thread.wait()
+            self.estimate_thread = None
+        self.estimate_btn.setEnabled(True)
+        
+    def done(self, result):
+        # 关闭对话框时不等待正在进行的样本编码，预估在后台结束后丢弃结果
+        if self.estimate_thread is not None:
+            self.estimate_thread.detach()
+            self.estimate_thread = None
+        super().done(result)
+        
+    def get_composition(self):
+        """获取合成设置，按顺序拼接时返回None"""
+        composition_layout, grid_size = self.composition_combo.currentData()
+        if composition_layout is None:
+            return None
+        return {
+            'layout': composition_layout,
+            'grid_size': grid_size,
+            'audio_mode': 'mix' if self.mix_audio_checkbox.isChecked() else 'first',
+        }
 
 class VideoMergeTab(QWidget):
     def __init__(self):
@@ -235,8 +1245,10 @@ class VideoMergeTab(QWidget):
         self.initUI()
         
         # 初始化变量
-        self.video_files = []
         self.process_thread = None
+        self.scan_threads = []
+        self.info_thread = VideoInfoThread()
+        self.info_thread.info_ready.connect(self.videos_model.update_info)
         
     def initUI(self):
         # 创建主布局
@@ -282,18 +1294,36 @@ class VideoMergeTab(QWidget):
         self.add_videos_btn.clicked.connect(self.open_file_dialog)
         add_btn_layout.addWidget(self.add_videos_btn)
         
+        self.add_folder_btn = QPushButton("添加文件夹")
+        self.add_folder_btn.setIcon(self.style().standardIcon(QStyle.SP_DirOpenIcon))
+        self.add_folder_btn.setIconSize(QSize(16, 16))
+        self.add_folder_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #313244;
+                color: #cdd6f4;
+                border: 1px solid #45475a;
+                border-radius: 5px;
+                padding: 3px 10px;
+                font-size: 12px;
+            }
+            QPushButton:hover {
+                background-color: #45475a;
+            }
+        """)
+        self.add_folder_btn.clicked.connect(self.open_folder_dialog)
+        add_btn_layout.addWidget(self.add_folder_btn)
+        
         top_layout.addLayout(add_btn_layout, 1)  # 按钮占1份宽度
         
         main_layout.addLayout(top_layout)
         
-        # 创建视频列表表格
-        self.videos_table = QTableWidget(0, 8)  # 增加为8列，包括码率
-        self.videos_table.setHorizontalHeaderLabels(["选择", "视频文件", "时长", "格式", "分辨率", "帧率", "码率", "音频采样率"])
+        # 创建视频列表
+        self.videos_model = VideoListModel(self)
+        self.videos_table = VideoListView()
+        self.videos_table.setModel(self.videos_model)
         self.videos_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
-        self.videos_table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
-        self.videos_table.setSelectionMode(QTableWidget.SelectionMode.SingleSelection)
         self.videos_table.setStyleSheet("""
-            QTableWidget {
+            QTableView {
                 background-color: #1e1e2e;
                 color: #cdd6f4;
                 border: 1px solid #313244;
@@ -305,10 +1335,10 @@ class VideoMergeTab(QWidget):
                 border: 1px solid #45475a;
                 padding: 5px;
             }
-            QTableWidget::item {
+            QTableView::item {
                 border-bottom: 1px solid #313244;
             }
-            QTableWidget::item:selected {
+            QTableView::item:selected {
                 background-color: #45475a;
             }
         """)
@@ -356,6 +1386,23 @@ class VideoMergeTab(QWidget):
         self.move_down_btn.clicked.connect(self.move_video_down)
         control_layout.addWidget(self.move_down_btn)
         
+        # 切换勾选按钮（作用于所有选中行）
+        self.toggle_check_btn = QPushButton("切换勾选")
+        self.toggle_check_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #313244;
+                color: #cdd6f4;
+                border: 1px solid #45475a;
+                border-radius: 4px;
+                padding: 5px 10px;
+            }
+            QPushButton:hover {
+                background-color: #45475a;
+            }
+        """)
+        self.toggle_check_btn.clicked.connect(self.toggle_selected_checked)
+        control_layout.addWidget(self.toggle_check_btn)
+        
         # 删除视频按钮
         self.remove_video_btn = QPushButton("删除视频")
         self.remove_video_btn.setStyleSheet("""
@@ -415,6 +1462,7 @@ class VideoMergeTab(QWidget):
         """启用或禁用控件"""
         self.move_up_btn.setEnabled(enabled)
         self.move_down_btn.setEnabled(enabled)
+        self.toggle_check_btn.setEnabled(enabled)
         self.remove_video_btn.setEnabled(enabled)
         self.start_merge_btn.setEnabled(enabled)
         
@@ -427,190 +1475,65 @@ class VideoMergeTab(QWidget):
         if file_paths:
             self.add_videos(file_paths)
             
+    def open_folder_dialog(self):
+        """选择文件夹，添加其中（包括子文件夹）的所有视频"""
+        dir_path = QFileDialog.getExistingDirectory(self, "选择视频文件夹")
+        if dir_path:
+            self.add_videos([dir_path])
+            
     def add_videos(self, file_paths):
-        """添加多个视频到列表"""
-        for file_path in file_paths:
-            if file_path not in self.video_files:
-                self.video_files.append(file_path)
-                self.add_video_to_table(file_path)
+        """添加多个视频或文件夹到列表"""
+        if not any(os.path.isdir(path) for path in file_paths):
+            self.add_video_files(file_paths)
+            return
+            
+        # 文件夹在后台遍历，找到的文件分批加入列表
+        self.scan_threads = [thread for thread in self.scan_threads if not thread.isFinished()]
+        scan_thread = VideoScanThread(file_paths)
+        scan_thread.files_found.connect(self.add_video_files)
+        self.scan_threads.append(scan_thread)
+        scan_thread.start()
+        
+    def add_video_files(self, file_paths):
+        """添加一批视频文件到列表（详细信息由后台线程读取后填充）"""
+        new_files = self.videos_model.add_files(file_paths)
+                
+        # 在后台并行读取视频信息
+        if new_files:
+            self.info_thread.add_files(new_files)
                 
         # 启用控件
-        if self.video_files:
+        if self.videos_model.rowCount():
             self.set_controls_enabled(True)
             
-    def add_video_to_table(self, file_path):
-        """将视频添加到表格"""
-        row = self.videos_table.rowCount()
-        self.videos_table.insertRow(row)
-        
-        # 创建复选框
-        checkbox = QCheckBox()
-        checkbox.setChecked(True)
-        checkbox_cell = QWidget()
-        checkbox_layout = QHBoxLayout(checkbox_cell)
-        checkbox_layout.addWidget(checkbox)
-        checkbox_layout.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        checkbox_layout.setContentsMargins(0, 0, 0, 0)
-        
-        # 设置单元格内容
-        self.videos_table.setCellWidget(row, 0, checkbox_cell)
-        self.videos_table.setItem(row, 1, QTableWidgetItem(os.path.basename(file_path)))
-        
-        # 获取视频信息
-        try:
-            video = cv2.VideoCapture(file_path)
-            
-            # 获取视频时长
-            fps = video.get(cv2.CAP_PROP_FPS)
-            total_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
-            duration_sec = total_frames / fps if fps > 0 else 0
-            
-            # 格式化时长为 时:分:秒
-            hours = int(duration_sec // 3600)
-            minutes = int((duration_sec % 3600) // 60)
-            seconds = int(duration_sec % 60)
-            duration_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-            
-            duration_item = QTableWidgetItem(duration_str)
-            self.videos_table.setItem(row, 2, duration_item)
-            
-            # 获取视频格式
-            _, ext = os.path.splitext(file_path)
-            format_item = QTableWidgetItem(ext[1:].upper())
-            self.videos_table.setItem(row, 3, format_item)
-            
-            # 获取分辨率
-            width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            resolution_item = QTableWidgetItem(f"{width}x{height}")
-            self.videos_table.setItem(row, 4, resolution_item)
-            
-            # 获取帧率
-            fps_item = QTableWidgetItem(f"{fps:.2f} fps")
-            self.videos_table.setItem(row, 5, fps_item)
-            
-            # 获取码率（估算值）
-            # 使用文件大小和时长估算码率
-            file_size = os.path.getsize(file_path)  # 字节
-            bitrate = int((file_size * 8) / (duration_sec * 1000)) if duration_sec > 0 else 0  # kbps
-            bitrate_item = QTableWidgetItem(f"{bitrate} kbps")
-            self.videos_table.setItem(row, 6, bitrate_item)
-            
-            # 获取音频采样率
-            # 注意：OpenCV不直接提供音频采样率，使用默认值
-            # 实际应用中可以使用ffmpeg或其他库获取准确值
-            audio_sample_rate = "44.1 kHz"  # 默认值
-            audio_item = QTableWidgetItem(audio_sample_rate)
-            self.videos_table.setItem(row, 7, audio_item)
-            
-            video.release()
-            
-        except Exception as e:
-            # 如果无法获取视频信息，填充默认值
-            self.videos_table.setItem(row, 2, QTableWidgetItem("未知"))
-            self.videos_table.setItem(row, 3, QTableWidgetItem("未知"))
-            self.videos_table.setItem(row, 4, QTableWidgetItem("未知"))
-            self.videos_table.setItem(row, 5, QTableWidgetItem("未知"))
-            self.videos_table.setItem(row, 6, QTableWidgetItem("未知"))
-            self.videos_table.setItem(row, 7, QTableWidgetItem("未知"))
-            
     def move_video_up(self):
         """将选中的视频向上移动"""
-        current_row = self.videos_table.currentRow()
-        if current_row > 0:
-            # 交换表格行
-            for col in range(1, self.videos_table.columnCount()):
-                item1 = self.videos_table.item(current_row, col)
-                item2 = self.videos_table.item(current_row - 1, col)
-                
-                if item1 and item2:
-                    text1 = item1.text()
-                    text2 = item2.text()
-                    item1.setText(text2)
-                    item2.setText(text1)
-            
-            # 交换复选框状态
-            checkbox1 = self.videos_table.cellWidget(current_row, 0).findChild(QCheckBox)
-            checkbox2 = self.videos_table.cellWidget(current_row - 1, 0).findChild(QCheckBox)
-            
-            if checkbox1 and checkbox2:
-                state1 = checkbox1.isChecked()
-                state2 = checkbox2.isChecked()
-                checkbox1.setChecked(state2)
-                checkbox2.setChecked(state1)
-            
-            # 交换视频文件列表中的位置
-            self.video_files[current_row], self.video_files[current_row - 1] = \
-                self.video_files[current_row - 1], self.video_files[current_row]
-            
-            # 选择移动后的行
-            self.videos_table.setCurrentCell(current_row - 1, 0)
+        self.videos_model.move_rows_up(self.videos_table.selected_rows())
             
     def move_video_down(self):
         """将选中的视频向下移动"""
-        current_row = self.videos_table.currentRow()
-        if current_row < self.videos_table.rowCount() - 1 and current_row >= 0:
-            # 交换表格行
-            for col in range(1, self.videos_table.columnCount()):
-                item1 = self.videos_table.item(current_row, col)
-                item2 = self.videos_table.item(current_row + 1, col)
-                
-                if item1 and item2:
-                    text1 = item1.text()
-                    text2 = item2.text()
-                    item1.setText(text2)
-                    item2.setText(text1)
-            
-            # 交换复选框状态
-            checkbox1 = self.videos_table.cellWidget(current_row, 0).findChild(QCheckBox)
-            checkbox2 = self.videos_table.cellWidget(current_row + 1, 0).findChild(QCheckBox)
-            
-            if checkbox1 and checkbox2:
-                state1 = checkbox1.isChecked()
-                state2 = checkbox2.isChecked()
-                checkbox1.setChecked(state2)
-                checkbox2.setChecked(state1)
-            
-            # 交换视频文件列表中的位置
-            self.video_files[current_row], self.video_files[current_row + 1] = \
-                self.video_files[current_row + 1], self.video_files[current_row]
-            
-            # 选择移动后的行
-            self.videos_table.setCurrentCell(current_row + 1, 0)
+        self.videos_model.move_rows_down(self.videos_table.selected_rows())
+        
+    def toggle_selected_checked(self):
+        """切换选中行的勾选状态：有未勾选的则全部勾选，否则全部取消"""
+        rows = self.videos_table.selected_rows()
+        if rows:
+            checked = not all(self.videos_model.is_checked(row) for row in rows)
+            self.videos_model.set_checked(rows, checked)
             
     def remove_selected_video(self):
         """删除选中的视频"""
-        current_row = self.videos_table.currentRow()
-        if current_row >= 0:
-            self.videos_table.removeRow(current_row)
-            self.video_files.pop(current_row)
+        rows = self.videos_table.selected_rows()
+        if rows:
+            self.videos_model.remove_rows(rows)
             
             # 如果没有视频了，禁用控件
-            if not self.video_files:
+            if not self.videos_model.rowCount():
                 self.set_controls_enabled(False)
                 
     def get_selected_videos(self):
         """获取选中的视频文件列表"""
-        selected_videos = []
-        
-        for row in range(self.videos_table.rowCount()):
-            checkbox = self.videos_table.cellWidget(row, 0).findChild(QCheckBox)
-            if checkbox and checkbox.isChecked():
-                selected_videos.append(self.video_files[row])
-                
-        return selected_videos
-        
-    def check_video_formats(self, videos):
-        """检查视频格式是否一致"""
-        if not videos:
-            return False
-            
-        formats = set()
-        for video in videos:
-            _, ext = os.path.splitext(video)
-            formats.add(ext.lower())
-            
-        return len(formats) == 1
+        return self.videos_model.checked_paths()
         
     def start_merging(self):
         """开始拼接视频"""
@@ -621,17 +1544,16 @@ class VideoMergeTab(QWidget):
             QMessageBox.warning(self, "错误", "请选择至少一个视频")
             return
             
-        # 检查视频格式是否一致
-        if not self.check_video_formats(selected_videos):
-            QMessageBox.warning(self, "格式不一致", "选中的视频格式不一致，请选择相同格式的视频")
-            return
-            
         # 显示输出设置对话框
-        dialog = OutputSettingsDialog(self)
+        dialog = OutputSettingsDialog(self, selected_videos)
         if dialog.exec() != QDialog.DialogCode.Accepted:
             return
             
         output_path = dialog.get_output_path()
+        transition, transition_duration = dialog.get_transition()
+        loudness_target = dialog.get_loudness_target()
+        composition = dialog.get_composition()
+        quality = dialog.get_quality()
         
         # 显示进度条
         self.progress_bar.setValue(0)
@@ -640,9 +1562,11 @@ class VideoMergeTab(QWidget):
         # 禁用控件
         self.set_controls_enabled(False)
         self.add_videos_btn.setEnabled(False)
+        self.add_folder_btn.setEnabled(False)
         
         # 创建并启动处理线程
-        self.process_thread = VideoMergeThread(selected_videos, output_path)
+        self.process_thread = VideoMergeThread(selected_videos, output_path, transition, transition_duration,
+                                               loudness_target, composition, quality)
         self.process_thread.progress_updated.connect(self.update_progress)
         self.process_thread.process_finished.connect(self.on_process_finished)
         self.process_thread.error_occurred.connect(self.on_process_error)
@@ -659,6 +1583,7 @@ class VideoMergeTab(QWidget):
         # 启用控件
         self.set_controls_enabled(True)
         self.add_videos_btn.setEnabled(True)
+        self.add_folder_btn.setEnabled(True)
         
         # 显示成功消息
         QMessageBox.information(self, "成功", f"视频拼接完成\n保存至: {output_file}")
@@ -670,6 +1595,7 @@ class VideoMergeTab(QWidget):
         # 启用控件
         self.set_controls_enabled(True)
         self.add_videos_btn.setEnabled(True)
+        self.add_folder_btn.setEnabled(True)
         
         # 显示错误消息
         QMessageBox.critical(self, "错误", f"视频拼接失败: {error_msg}") 
\ No newline at end of file
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+系统资源辅助函数
+获取CPU和可用内存，为编码任务规划每个任务的编码线程数和同时运行的任务数量
+"""
+
+import os
+import sys
+import math
+import logging
+
+# 获取logger
+logger = logging.getLogger("VideoEditor.resource")
+
+# 为系统和界面保留的内存（字节）
+RESERVED_MEMORY = 1024 ** 3
+
+# 各编码器能有效利用的线程数（按输出高度分档：720p及以下、1080p及以下、更高）
+# 超过该线程数后编码速度基本不再提升，多出的核心分给其他任务更划算
+CODEC_THREAD_LIMITS = {
+    'libx264': (6, 12, 16),
+    'h264': (6, 12, 16),
+    'libx265': (6, 12, 16),
+    'libvpx': (4, 6, 8),
+    'libvpx-vp9': (4, 8, 16),
+    'mpeg4': (4, 6, 8),
+    'libxvid': (2, 4, 4),
+    # 不支持多线程的编码器
+    'rawvideo': (1, 1, 1),
+    'gif': (1, 1, 1),
+    'libwebp': (1, 1, 1),
+}
+DEFAULT_THREAD_LIMITS = (4, 8, 8)
+
+
+def get_cpu_count():
+    """获取当前进程可以使用的CPU核心数"""
+    if hasattr(os, 'sched_getaffinity'):
+        try:
+            return max(len(os.sched_getaffinity(0)), 1)
+        except OSError:
+            pass
+    return os.cpu_count() or 1
+
+
+def get_available_memory():
+    """获取当前可用的物理内存（字节），无法获取时返回None"""
+    try:
+        if sys.platform == 'win32':
+            import ctypes
+
+            class MEMORYSTATUSEX(ctypes.Structure):
+                _fields_ = [
+                    ('dwLength', ctypes.c_ulong),
+                    ('dwMemoryLoad', ctypes.c_ulong),
+                    ('ullTotalPhys', ctypes.c_ulonglong),
+                    ('ullAvailPhys', ctypes.c_ulonglong),
+                    ('ullTotalPageFile', ctypes.c_ulonglong),
+                    ('ullAvailPageFile', ctypes.c_ulonglong),
+                    ('ullTotalVirtual', ctypes.c_ulonglong),
+                    ('ullAvailVirtual', ctypes.c_ulonglong),
+                    ('ullAvailExtendedVirtual', ctypes.c_ulonglong),
+                ]
+
+            status = MEMORYSTATUSEX()
+            status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+            if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+                return status.ullAvailPhys
+            return None
+
+        if os.path.exists('/proc/meminfo'):
+            with open('/proc/meminfo', 'r') as f:
+                for line in f:
+                    if line.startswith('MemAvailable:'):
+                        return int(line.split()[1]) * 1024
+
+        # macOS等系统没有可用内存的接口，按物理内存的一半估计
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // 2
+    except (OSError, ValueError, AttributeError) as e:
+        logger.warning(f"获取可用内存失败: {str(e)}")
+        return None
+
+
+def estimate_encode_memory(width, height):
+    """
+    估计一个编码任务占用的内存（字节）
+
+    包括解码/编码进程的固定开销和编码器前瞻缓存的若干帧
+    """
+    frame_size = (width or 1920) * (height or 1080) * 3
+    return 300 * 1024 ** 2 + frame_size * 40
+
+
+def codec_thread_limit(codec, height=None):
+    """编码器在给定输出高度下能有效利用的线程数"""
+    limits = CODEC_THREAD_LIMITS.get(codec, DEFAULT_THREAD_LIMITS)
+    height = height or 1080
+    if height <= 720:
+        return limits[0]
+    if height <= 1080:
+        return limits[1]
+    return limits[2]
+
+
+def plan_encoding(job_count, width=None, height=None, codec='libx264', threads=None, workers=None):
+    """
+    规划编码线程数和同时运行的任务数
+
+    每个任务的线程数不超过编码器能有效利用的数量；同时运行的任务数使所有任务的线程总数
+    接近CPU核心数，并受任务数量和可用内存限制。threads、workers大于0时使用指定值。
+    返回的字典同时记录规划依据，可以直接写入任务指标
+    """
+    cpu_count = get_cpu_count()
+    limit = min(codec_thread_limit(codec, height), cpu_count)
+    memory_per_job = estimate_encode_memory(width, height)
+    available_memory = get_available_memory()
+
+    if workers and workers > 0:
+        planned_workers = min(workers, max(job_count, 1))
+    else:
+        planned_workers = min(max(job_count, 1), math.ceil(cpu_count / limit))
+        if available_memory is not None:
+            memory_workers = max(1, (available_memory - RESERVED_MEMORY) // memory_per_job)
+            planned_workers = min(planned_workers, memory_workers)
+        planned_workers = max(1, int(planned_workers))
+
+    if threads and threads > 0:
+        planned_threads = threads
+    else:
+        planned_threads = max(1, min(limit, cpu_count // planned_workers))
+
+    return {
+        'threads': planned_threads,
+        'workers': planned_workers,
+        'codec': codec,
+        'resolution': f"{width}x{height}" if width and height else None,
+        'cpu_count': cpu_count,
+        'codec_thread_limit': limit,
+        'memory_per_job': memory_per_job,
+        'available_memory': available_memory,
+        'threads_overridden': bool(threads and threads > 0),
+        'workers_overridden': bool(workers and workers > 0),
+    }
+
+
+def plan_parallel_jobs(job_count, width=None, height=None, codec='libx264'):
+    """
+    为多个互相独立的编码任务规划：每个任务一个编码进程同时运行
+
+    同时运行的进程数只受CPU核心数和可用内存限制，每个进程的线程数相应减少，
+    适合合并前并行转换各个输入这类单个任务较短、按任务数并行更快的情况
+    """
+    workers = max(1, min(job_count, get_cpu_count()))
+    available_memory = get_available_memory()
+    if available_memory is not None:
+        memory_workers = (available_memory - RESERVED_MEMORY) // estimate_encode_memory(width, height)
+        workers = max(1, min(workers, int(memory_workers)))
+    return plan_encoding(job_count, width, height, codec, workers=workers)